@@ -8,14 +8,25 @@
 from __future__ import annotations
 
 import argparse
-import glob
+import contextlib
 import json
 import os
-import shutil
 import sys
+from typing import Iterator, Mapping, Sequence
 
 import rocrate_inveniordm.mapping.converter as converter
+import rocrate_inveniordm.metrics as metrics
+import rocrate_inveniordm.profiling as profiling
+import rocrate_inveniordm.tracing as tracing
+import rocrate_inveniordm.upload.bundling as bundling
+import rocrate_inveniordm.upload.progress as progress
+import rocrate_inveniordm.upload.sources as sources
 import rocrate_inveniordm.upload.uploader as uploader
+import rocrate_inveniordm.upload.zipstream as zipstream
+import rocrate_inveniordm.walk as walk
+from rocrate_inveniordm.exceptions import DepositError, InvalidCrateError
+from rocrate_inveniordm.inventory import Inventory, inventory_path
+from rocrate_inveniordm.upload.journal import Journal, journal_path
 
 
 def main():
@@ -57,6 +68,40 @@ def main():
         "containing 'ro-crate-preview' from the upload (not recommended)",
         action="store_true",
     )
+    parser.add_argument(
+        "--include",
+        help="Only upload files matching this gitignore-style pattern, relative to "
+        "the crate directory, e.g. 'data/**/*.csv'. Can be given several times",
+        action="append",
+        default=[],
+        metavar="PATTERN",
+    )
+    parser.add_argument(
+        "--exclude",
+        help="Do not upload files and directories matching this gitignore-style "
+        "pattern. Can be given several times; a pattern starting with '!' "
+        "re-includes what an earlier one excluded. Hidden files are excluded "
+        "unless re-included, e.g. with '!.zenodo.json'",
+        action="append",
+        default=[],
+        metavar="PATTERN",
+    )
+    parser.add_argument(
+        "--inventory",
+        help="Before uploading, compute the sizes, MIME types and checksums of the "
+        "crate's files in parallel, and keep them next to the crate directory for "
+        "later deposits. Files uploaded in parts are then verified, unchanged files "
+        "of a new version are found without reading them again, and the record's "
+        "sizes and formats are filled in if the crate does not declare them",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--symlinks",
+        help="Whether to follow symbolic links in the crate, skip them, or stop with "
+        "an error. Defaults to follow",
+        choices=walk.SYMLINK_POLICIES,
+        default="follow",
+    )
     parser.add_argument(
         "-p",
         "--publish",
@@ -70,6 +115,199 @@ def main():
         "single zip file containing the whole crate",
         action="store_true",
     )
+    parser.add_argument(
+        "--zip-compression-level",
+        help="With -z, compress the files in the zip file at this zlib level, from "
+        "1 (fastest) to 9 (smallest). Files of compressed formats are stored as they "
+        "are. Defaults to 0, which stores all files uncompressed",
+        type=int,
+        choices=range(10),
+        default=0,
+        metavar="LEVEL",
+    )
+    parser.add_argument(
+        "--zip-cache",
+        help="With -z, write the zip file to this directory, and reuse it when the "
+        "crate is deposited again without changes to its files",
+        action="store",
+        metavar="DIR",
+    )
+    parser.add_argument(
+        "--zip-jobs",
+        help="Number of threads compressing the files of the zip file. Defaults "
+        "to the number of CPUs",
+        type=int,
+        action="store",
+    )
+    parser.add_argument(
+        "--bundle-small-files",
+        help="Pack files smaller than this many KiB into zip bundles, which are "
+        "uploaded instead of the individual files. Larger files are still uploaded "
+        "individually. The contents of each bundle are listed in the record's "
+        "description",
+        type=int,
+        action="store",
+        metavar="KIB",
+    )
+    parser.add_argument(
+        "--bundle-max-size",
+        help="Maximum total size of the files in one bundle, in MiB. Defaults to 100",
+        type=int,
+        action="store",
+        default=bundling.DEFAULT_MAX_BUNDLE_SIZE // (1024 * 1024),
+    )
+    parser.add_argument(
+        "--bundle-by-directory",
+        help="Bundle the small files of each directory separately",
+        action="store_true",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        help="Number of files to upload in parallel. Defaults to 1",
+        type=int,
+        action="store",
+        default=1,
+    )
+    parser.add_argument(
+        "--max-jobs",
+        help="Adapt the number of files uploaded in parallel to the repository's "
+        "responses, starting from --jobs and growing up to this number while "
+        "throughput improves. It is cut back when the repository responds with 429 "
+        "or 503, or when uploads slow down. By default, --jobs files are uploaded "
+        "in parallel throughout",
+        type=int,
+        action="store",
+    )
+    parser.add_argument(
+        "--part-size",
+        help="Upload files larger than this many MiB with multipart transfer, in parts "
+        "of this size which are uploaded in parallel and retried individually. "
+        "Requires InvenioRDM 13 or later. By default, each file is uploaded with a "
+        "single request",
+        type=int,
+        action="store",
+    )
+    parser.add_argument(
+        "--part-jobs",
+        help="Number of parts of a file to upload in parallel with --part-size. "
+        "Defaults to 4",
+        type=int,
+        action="store",
+        default=4,
+    )
+    parser.add_argument(
+        "--max-bandwidth",
+        help="Limit the upload of file contents to this many MiB per second in "
+        "total, across all files and parts uploaded in parallel. By default, the "
+        "bandwidth is not limited",
+        type=float,
+        action="store",
+    )
+    parser.add_argument(
+        "--timeout",
+        help="Seconds to wait for a response from the repository before retrying the "
+        "request. Defaults to 300",
+        type=float,
+        action="store",
+        default=uploader.DEFAULT_TIMEOUT[1],
+        metavar="SECONDS",
+    )
+    parser.add_argument(
+        "--init-batch-size",
+        help="Maximum number of files to initialize in the draft record with one "
+        "request. Files are initialized in batches of this size while the previous "
+        "batch is being uploaded. Defaults to 1000",
+        type=int,
+        action="store",
+        default=uploader.DEFAULT_INIT_BATCH_SIZE,
+    )
+    parser.add_argument(
+        "--sha256",
+        help="Also compute the SHA-256 checksum of each file while uploading it, and "
+        "record it in the upload journal. MD5 checksums are always computed and "
+        "verified against the repository",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--new-version-of",
+        help="Deposit the crate as a new version of the published record with this "
+        "id. Files which are unchanged since that version are reused instead of "
+        "being uploaded again, and files which are no longer in the crate are removed",
+        type=str,
+        action="store",
+        metavar="RECORD_ID",
+    )
+    parser.add_argument(
+        "--journal",
+        help="Keep a journal of the upload next to the crate directory, from which an "
+        "interrupted upload can be resumed with --resume",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--journal-file",
+        help="Keep the journal of the upload in this file instead of next to the "
+        "crate directory. Implies --journal",
+        type=str,
+        action="store",
+        metavar="PATH",
+    )
+    parser.add_argument(
+        "--resume",
+        help="Resume an interrupted upload of the crate: reuse its draft record and "
+        "upload only the files which the draft does not have yet, or which have "
+        "changed since they were uploaded. Requires the journal of an upload with "
+        "--journal or --journal-file",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--no-progress",
+        help="Do not show the progress line, which is shown while uploading when "
+        "stderr is a terminal",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--report",
+        help="Write a JSON report of the upload to this path, with the size, "
+        "duration, throughput, retries and phase times of each file",
+        type=str,
+        action="store",
+    )
+    parser.add_argument(
+        "--profile",
+        help="Profile the deposit with cProfile and write pstats output to this path",
+        type=str,
+        action="store",
+    )
+    parser.add_argument(
+        "--profile-sample",
+        help="Profile the deposit with a low-overhead sampling profiler and write "
+        "collapsed stacks (for flame graphs) to this path",
+        type=str,
+        action="store",
+    )
+    parser.add_argument(
+        "--profile-interval",
+        help="Interval between samples for --profile-sample, in seconds. Defaults to "
+        "0.01",
+        type=float,
+        action="store",
+        default=0.01,
+    )
+    parser.add_argument(
+        "--trace",
+        help="Write a timeline of the deposit phases to this path in Trace Event "
+        "Format, for viewing in Perfetto or chrome://tracing",
+        type=str,
+        action="store",
+    )
+    parser.add_argument(
+        "--metrics-textfile",
+        help="Write Prometheus metrics to this path when the deposit finishes, for the "
+        "node_exporter textfile collector",
+        type=str,
+        action="store",
+    )
     args = parser.parse_args()
 
     crate_dir = args.ro_crate_directory
@@ -78,17 +316,74 @@ def main():
     omit_roc_files = args.omit_roc_files
     publish = args.publish
     use_zip = args.zip
+    jobs = args.jobs
 
     datacite_file = datacite_list[0] if datacite_list else None
 
-    deposit(
-        ro_crate_dir=crate_dir,
-        datacite_file=datacite_file,
-        no_upload=no_upload,
-        omit_roc_files=omit_roc_files,
-        publish=publish,
-        use_zip=use_zip,
-    )
+    observers: list[progress.UploadObserver] = []
+    if not args.no_progress and sys.stderr.isatty():
+        estimate = progress.UploadEstimate()
+        observers += [estimate, progress.TerminalProgress(estimate=estimate)]
+
+    with contextlib.ExitStack() as stack:
+        if args.report:
+            report = progress.UploadReport()
+            observers.append(report)
+            stack.callback(report.write, args.report)
+        if args.metrics_textfile:
+            stack.callback(metrics.write_textfile, args.metrics_textfile)
+        if args.trace:
+            stack.enter_context(tracing.tracing(args.trace))
+        if args.profile:
+            stack.enter_context(profiling.cprofile(args.profile))
+        if args.profile_sample:
+            stack.enter_context(
+                profiling.SamplingProfiler(
+                    args.profile_sample, interval=args.profile_interval
+                )
+            )
+
+        try:
+            deposit(
+                ro_crate_dir=crate_dir,
+                datacite_file=datacite_file,
+                no_upload=no_upload,
+                omit_roc_files=omit_roc_files,
+                publish=publish,
+                use_zip=use_zip,
+                concurrency=jobs,
+                max_concurrency=args.max_jobs,
+                resume=args.resume,
+                keep_journal=args.journal,
+                journal_file=args.journal_file,
+                part_size=args.part_size * 1024 * 1024 if args.part_size else None,
+                part_concurrency=args.part_jobs,
+                sha256=args.sha256,
+                new_version_of=args.new_version_of,
+                init_batch_size=args.init_batch_size,
+                observers=observers,
+                max_bandwidth=(
+                    args.max_bandwidth * 1024 * 1024 if args.max_bandwidth else None
+                ),
+                bundle_threshold=(
+                    args.bundle_small_files * 1024
+                    if args.bundle_small_files is not None
+                    else None
+                ),
+                bundle_max_size=args.bundle_max_size * 1024 * 1024,
+                bundle_by_directory=args.bundle_by_directory,
+                zip_compression_level=args.zip_compression_level,
+                zip_jobs=args.zip_jobs,
+                zip_cache=args.zip_cache,
+                include=args.include,
+                exclude=args.exclude,
+                symlinks=args.symlinks,
+                inventory=args.inventory,
+                timeout=(uploader.DEFAULT_TIMEOUT[0], args.timeout),
+            )
+        except DepositError as e:
+            print(e)
+            sys.exit(1)
 
 
 def deposit(
@@ -98,6 +393,29 @@ def deposit(
     omit_roc_files: bool = False,
     publish: bool = False,
     use_zip: bool = False,
+    concurrency: int = 1,
+    max_concurrency: int | None = None,
+    resume: bool = False,
+    keep_journal: bool = False,
+    journal_file: str | None = None,
+    part_size: int | None = None,
+    part_concurrency: int = 4,
+    sha256: bool = False,
+    new_version_of: str | None = None,
+    init_batch_size: int = uploader.DEFAULT_INIT_BATCH_SIZE,
+    observers: list | tuple = (),
+    max_bandwidth: float | None = None,
+    bundle_threshold: int | None = None,
+    bundle_max_size: int = bundling.DEFAULT_MAX_BUNDLE_SIZE,
+    bundle_by_directory: bool = False,
+    zip_compression_level: int = 0,
+    zip_jobs: int | None = None,
+    zip_cache: str | None = None,
+    include: Sequence[str] = (),
+    exclude: Sequence[str] = (),
+    symlinks: str = "follow",
+    inventory: bool = False,
+    timeout: tuple[float, float] = uploader.DEFAULT_TIMEOUT,
 ):
     """
     The main function of the script.
@@ -114,61 +432,136 @@ def deposit(
         directories/files containing 'ro-crate-preview' from the upload (not
         recommended). Defaults to False
     :param publish: Publish the record after uploading. Defaults to False
-    :param zip: Instead of uploading all the files within the crate, create and upload a
-        single zip file containing the whole crate. Defaults to False
+    :param zip: Instead of uploading all the files within the crate, upload a single
+        zip file containing the whole crate. The zip file is generated while it is
+        uploaded, and not written to disk. Defaults to False
+    :param concurrency: Number of files to upload in parallel. Defaults to 1
+    :param max_concurrency: If set, the number of files uploaded in parallel is
+        adapted, from concurrency up to this many. Defaults to None
+    :param resume: Resume an interrupted upload of the crate, using its journal.
+        Defaults to False
+    :param keep_journal: Keep a journal of the upload, from which it can be resumed.
+        Defaults to False
+    :param journal_file: Path of the journal. Implies keep_journal. Defaults to None,
+        which keeps the journal next to the crate directory
+    :param part_size: If set, files larger than this many bytes are uploaded with
+        multipart transfer, in parts of this size. Defaults to None
+    :param part_concurrency: Number of parts of a file to upload in parallel.
+        Defaults to 4
+    :param sha256: Also compute the SHA-256 checksum of each file while uploading
+        it. Defaults to False
+    :param new_version_of: The id of a published record to deposit the crate as a new
+        version of, reusing the files which have not changed. Defaults to None
+    :param init_batch_size: Maximum number of files to initialize in the draft record
+        with one request. Defaults to 1000
+    :param observers: UploadObservers to report the progress of the upload to.
+        Defaults to none
+    :param max_bandwidth: Maximum bytes per second to upload file contents at, in
+        total with the concurrent deposits of the process given the same limit.
+        Defaults to None, which does not limit the bandwidth
+    :param bundle_threshold: If set, files smaller than this many bytes are packed
+        into zip bundles instead of being uploaded individually. Ignored with
+        use_zip. Defaults to None
+    :param bundle_max_size: Maximum total size of the files in one bundle, in bytes.
+        Defaults to 100 MiB
+    :param bundle_by_directory: Bundle the small files of each directory
+        separately. Defaults to False
+    :param zip_compression_level: With use_zip, the zlib level to compress the files
+        in the zip file at, or 0 to store them uncompressed. Defaults to 0
+    :param zip_jobs: With use_zip, the number of threads compressing files.
+        Defaults to the number of CPUs
+    :param zip_cache: With use_zip, a directory to keep the zip file in, which is
+        reused as long as the files of the crate do not change. Defaults to None,
+        which streams the zip file while it is uploaded
+    :param include: If not empty, only upload files matching these gitignore-style
+        patterns, relative to the crate directory. Ignored with use_zip. Defaults to
+        ()
+    :param exclude: Do not upload files and directories matching these
+        gitignore-style patterns. Hidden files are excluded unless a pattern
+        starting with "!" re-includes them. Ignored with use_zip. Defaults to ()
+    :param symlinks: Whether to "follow" symbolic links in the crate, "skip" them, or
+        raise an InvalidCrateError ("error"). Ignored with use_zip. Defaults to
+        "follow"
+    :param inventory: Take an inventory of the crate's files before uploading, see
+        scan_inventory. Ignored with use_zip. Defaults to False
+    :param timeout: Seconds to wait for a connection to the repository, and for each
+        read from it, before retrying the request. Defaults to (10, 300)
     :return: The ID of the created record, or None if no record was created.
+    :raises InvalidCrateError: If ro_crate_dir is not an RO-Crate directory
+    :raises DepositError: If resume is True but there is no journal to resume from
+    :raises UploadError: If the record could not be uploaded to the repository
     """
 
     # Get all files in RO-Crate directory and check if it is a RO-Crate directory
     # Exclude RO-Crate metadata, and RO-Crate website files
-    all_files = []
+    all_files: list = []
+    file_stats: dict[str, sources.FileStat] = {}
+    bundles: list[bundling.Bundle] = []
+    archives: list[zipstream.ZipStream] = []
+    file_inventory = None
+    algorithms = ("md5", "sha256") if sha256 else ("md5",)
 
     if use_zip:
         crate_name = os.path.basename(ro_crate_dir.strip("/"))
-        print(f"Creating zipped crate {crate_name}.zip")
-        crate_zip_path = shutil.make_archive(
-            crate_name,
-            "zip",
-            root_dir=ro_crate_dir,
-        )
-        all_files.append(crate_zip_path)
+        print(f"Streaming zipped crate {crate_name}.zip")
+        with tracing.span("zip", cat="deposit"):
+            archives.append(
+                zipstream.ZipStream.from_directory(f"{crate_name}.zip", ro_crate_dir)
+            )
     else:
-        for file in glob.glob(f"{ro_crate_dir}/**", recursive=True):
-            if omit_roc_files and (
-                "ro-crate-preview" in file or "ro-crate-metadata.json" in file
-            ):
-                continue
-            if os.path.isfile(file):
-                all_files.append(file)
+        with tracing.span("walk", cat="deposit"):
+            file_stats = list_crate_files(
+                ro_crate_dir, omit_roc_files, include, exclude, symlinks
+            )
+        all_files = list(file_stats)
+        if inventory:
+            file_inventory = scan_inventory(
+                ro_crate_dir, all_files, algorithms, file_stats
+            )
+        if bundle_threshold is not None:
+            all_files, bundles = bundling.plan_bundles(
+                ro_crate_dir,
+                all_files,
+                bundle_threshold,
+                bundle_max_size,
+                bundle_by_directory,
+                file_stats,
+            )
 
     ro_crate_metadata_file = os.path.join(ro_crate_dir, "ro-crate-metadata.json")
 
     if not os.path.isfile(ro_crate_metadata_file):
-        print(
+        raise InvalidCrateError(
             f"'{ro_crate_dir}' is not a RO-Crate directory: "
             "'ro-crate-metadata.json' not found."
         )
-        sys.exit()
 
     if datacite_file:
         # skip conversion and use the provided file
         print(f"Skipping metadata conversion, loading DataCite file {datacite_file}")
-        with open(datacite_file, "r") as f:
-            data_cite_metadata = json.load(f)
+        with tracing.span("load metadata", cat="deposit"):
+            with open(datacite_file, "r") as f:
+                data_cite_metadata = json.load(f)
     else:
         # convert the RO-Crate metadata to DataCite
-        with open(ro_crate_metadata_file, "r") as f:
-            ro_crate_metadata = json.load(f)
+        with tracing.span("load metadata", cat="deposit"):
+            with open(ro_crate_metadata_file, "r") as f:
+                ro_crate_metadata = json.load(f)
 
         # if no files to upload, just set the metadata on the record
         metadata_only = False
-        if len(all_files) == 0:
+        if len(all_files) == 0 and not archives:
             metadata_only = True
 
         # Convert Metadata
-        data_cite_metadata = converter.convert(
-            ro_crate_metadata, metadata_only=metadata_only
-        )
+        with tracing.span("convert", cat="deposit"):
+            data_cite_metadata = converter.convert(
+                ro_crate_metadata, metadata_only=metadata_only, inventory=file_inventory
+            )
+
+    if bundles:
+        bundling.describe_bundles(data_cite_metadata, bundles)
+    if not datacite_file:
         # store datacite metadata
         with open("datacite-out.json", "w") as f:
             json.dump(data_cite_metadata, f, indent=4)
@@ -178,11 +571,153 @@ def deposit(
         print("Created datacite-out.json, skipping upload.")
         return None
     else:
-        record_id = uploader.deposit(data_cite_metadata, all_files, publish=publish)
+        with contextlib.ExitStack() as stack:
+            journal = stack.enter_context(
+                upload_journal(ro_crate_dir, resume, keep_journal, journal_file)
+            )
+            bundle_files = stack.enter_context(
+                bundling.write_bundles(bundles, ro_crate_dir)
+            )
+            archive_files = stack.enter_context(
+                zipstream.prepare_archives(
+                    archives, zip_compression_level, zip_jobs, zip_cache
+                )
+            )
+            upload_files = all_files + bundle_files + archive_files
+            with tracing.span("upload", cat="deposit", files=len(upload_files)):
+                record_id = uploader.deposit(
+                    data_cite_metadata,
+                    upload_files,
+                    publish=publish,
+                    concurrency=concurrency,
+                    max_concurrency=max_concurrency,
+                    journal=journal,
+                    part_size=part_size,
+                    part_concurrency=part_concurrency,
+                    checksum_algorithms=algorithms,
+                    new_version_of=new_version_of,
+                    init_batch_size=init_batch_size,
+                    observers=observers,
+                    max_bandwidth=max_bandwidth,
+                    inventory=file_inventory,
+                    timeout=timeout,
+                    file_stats=file_stats,
+                )
 
         print(f"Successfully created record {record_id}")
         return record_id
 
 
+def list_crate_files(
+    ro_crate_dir: str,
+    omit_roc_files: bool = False,
+    include: Sequence[str] = (),
+    exclude: Sequence[str] = (),
+    symlinks: str = "follow",
+) -> dict[str, sources.FileStat]:
+    """
+    Lists the files in a crate directory, recursively, in order of their paths.
+    Hidden files are left out, unless they are re-included by an exclude pattern
+    starting with "!".
+
+    :param ro_crate_dir: Path to the RO-Crate directory.
+    :param omit_roc_files: Omit the RO-Crate metadata file and website.
+    :param include: If not empty, only list files matching these gitignore-style
+        patterns.
+    :param exclude: Leave out files and directories matching these gitignore-style
+        patterns.
+    :param symlinks: Whether to "follow" symbolic links, "skip" them or raise an
+        "error".
+    :return: The size and modification time of each file, by path, as kept from
+        the walk so that they are not looked up again.
+    """
+    exclude = [*walk.DEFAULT_EXCLUDE, *exclude]
+    if omit_roc_files:
+        exclude += walk.ROC_FILE_PATTERNS
+    path_filter = walk.PathFilter(include, exclude)
+    return {
+        path: sources.FileStat(stat.st_size, stat.st_mtime_ns)
+        for path, stat in walk.walk_files(ro_crate_dir, path_filter, symlinks)
+    }
+
+
+def scan_inventory(
+    ro_crate_dir: str,
+    files: list[str],
+    algorithms=("md5",),
+    stats: Mapping[str, sources.FileStat] | None = None,
+) -> Inventory:
+    """
+    Takes the inventory of a crate's files in parallel, reusing the entries of the
+    inventory saved next to the crate directory for unchanged files, and saves it.
+
+    :param ro_crate_dir: Path to the RO-Crate directory.
+    :param files: The paths of the files.
+    :param algorithms: Names of hashlib algorithms to compute for each file.
+    :param stats: The sources.FileStat of the files by path, if known.
+    :return: The inventory.
+    """
+    print(f"Taking inventory of {len(files)} files")
+    with tracing.span("inventory", cat="deposit", files=len(files)):
+        file_inventory = Inventory.load(inventory_path(ro_crate_dir), algorithms)
+        file_inventory.scan(files, stats=stats)
+        file_inventory.save()
+    return file_inventory
+
+
+@contextlib.contextmanager
+def upload_journal(
+    ro_crate_dir: str, resume: bool, keep_journal: bool, path: str | None = None
+) -> Iterator[Journal | None]:
+    """
+    Opens the journal of the crate's upload if it is kept, see open_journal, and
+    closes it afterwards.
+
+    :param ro_crate_dir: Path to the RO-Crate directory.
+    :param resume: Whether to resume the upload of the journal.
+    :param keep_journal: Whether to keep a journal. It is always kept when resuming
+        or when a path is given.
+    :param path: Path of the journal. Defaults to the journal next to the crate
+        directory.
+    :return: The journal, or None if no journal is kept.
+    """
+    if not (keep_journal or resume or path):
+        yield None
+        return
+    with open_journal(ro_crate_dir, resume, path) as journal:
+        yield journal
+
+
+def open_journal(ro_crate_dir: str, resume: bool, path: str | None = None) -> Journal:
+    """
+    Opens the journal of the crate's upload. A new journal is created right away,
+    so that a journal which cannot be written fails before a draft is created.
+
+    :param ro_crate_dir: Path to the RO-Crate directory.
+    :param resume: Whether to load the journal of an earlier upload to resume it, or
+        to start a new one.
+    :param path: Path of the journal. Defaults to the journal next to the crate
+        directory.
+    :return: The journal.
+    :raises DepositError: If resume is True but there is no journal, or if a new
+        journal cannot be created.
+    """
+    path = path or journal_path(ro_crate_dir)
+    if not resume:
+        journal = Journal(path)
+        try:
+            journal.create()
+        except OSError as e:
+            raise DepositError(f"Cannot create the upload journal {path}: {e}")
+        return journal
+    try:
+        journal = Journal.load(path)
+    except FileNotFoundError:
+        raise DepositError(f"Cannot resume: no upload journal found at {path}")
+    if journal.record_id is None:
+        raise DepositError(f"Cannot resume: the journal {path} has no draft record")
+    return journal
+
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,101 @@
+"""
+    Exceptions raised when a deposit fails.
+
+    All of them derive from DepositError, so programs which embed the package can
+    handle a failed deposit without the process exiting. Only the command line
+    entrypoint, deposit.main(), turns them into an exit status.
+"""
+
+from __future__ import annotations
+
+
+class DepositError(RuntimeError):
+    """Base class for errors which stop a deposit."""
+
+
+class InvalidCrateError(DepositError):
+    """The directory to deposit is not an RO-Crate."""
+
+
+class UploadError(DepositError):
+    """Base class for errors while uploading a record to the repository."""
+
+
+class RepositoryError(UploadError):
+    """The repository responded to a request with an unexpected status code."""
+
+    def __init__(self, message: str, endpoint: str, status: int, body: str = ""):
+        """
+        :param message: What the request was for, e.g. "Could not create record"
+        :param endpoint: Endpoint label of the request, e.g. "records" or "content"
+        :param status: The HTTP status code of the response
+        :param body: The body of the response
+        """
+        self.message = message
+        self.endpoint = endpoint
+        self.status = status
+        self.body = body
+        super().__init__(f"{message}: {status} {body}")
+
+    @staticmethod
+    def from_response(
+        message: str, endpoint: str, status: int, body: str = ""
+    ) -> RepositoryError:
+        """Create the subclass of RepositoryError matching the status code."""
+        cls: type[RepositoryError] = RepositoryError
+        if status in (401, 403):
+            cls = AuthenticationError
+        elif 400 <= status < 500:
+            cls = ClientError
+        elif status >= 500:
+            cls = ServerError
+        return cls(message, endpoint, status, body)
+
+
+class ClientError(RepositoryError):
+    """The repository rejected a request (4xx), e.g. because of invalid metadata."""
+
+
+class AuthenticationError(ClientError):
+    """The API token is missing, invalid, or lacks the required scopes (401/403)."""
+
+
+class ServerError(RepositoryError):
+    """The repository failed to handle a request (5xx)."""
+
+
+class ChecksumMismatchError(UploadError):
+    """The checksum of an uploaded file differs from the checksum of the local file."""
+
+    def __init__(self, key: str, server_checksum: str, digests: dict):
+        """
+        :param key: The file's key in the record
+        :param server_checksum: The checksum reported by the repository, e.g.
+            "md5:d41d8c..."
+        :param digests: The checksums computed while uploading, by algorithm
+        """
+        self.key = key
+        self.server_checksum = server_checksum
+        self.digests = digests
+        algorithm = server_checksum.split(":", 1)[0]
+        super().__init__(
+            f"Checksum of {key} in the repository is {server_checksum}, but the "
+            f"uploaded file has {algorithm}:{digests.get(algorithm)}"
+        )
+
+
+class FilesUploadError(UploadError):
+    """One or more files of a record could not be uploaded."""
+
+    def __init__(self, record_id: str, results: list):
+        """
+        :param record_id: The id of the draft record
+        :param results: A list of FileUploadResult, one per file of the record
+        """
+        self.record_id = record_id
+        self.results = results
+        failed = [r for r in results if r.status != "uploaded"]
+        super().__init__(
+            f"{len(failed)} of {len(results)} files of record {record_id} were not "
+            "uploaded"
+        )
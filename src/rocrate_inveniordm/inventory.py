@@ -0,0 +1,200 @@
+"""
+    Takes an inventory of the files of a crate: the size, modification time, MIME
+    type and checksums of each file, computed once in a pool of threads and shared
+    by the steps of a deposit which need them.
+
+    The inventory is kept in a JSON file next to the crate directory, keyed by the
+    files' paths. A file whose size and modification time have not changed since the
+    inventory was saved is not read again.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import itertools
+import json
+import mimetypes
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from typing import Iterable, Mapping
+
+import rocrate_inveniordm.upload.sources as sources
+
+INVENTORY_SUFFIX = ".inveniordm-inventory"
+
+# large reads, into a buffer reused by each thread, keep the hashing threads busy
+# with few calls; hashlib releases the GIL while hashing them
+READ_SIZE = 8 * 1024 * 1024
+
+_buffers = threading.local()
+
+
+def inventory_path(ro_crate_dir: str) -> str:
+    """
+    :param ro_crate_dir: Path to the RO-Crate directory
+    :return: Path of the crate's inventory, next to the crate directory, so that it
+        is never uploaded as part of the crate.
+    """
+    return os.path.abspath(ro_crate_dir.rstrip("/")) + INVENTORY_SUFFIX
+
+
+@dataclass
+class FileInfo:
+    """What the inventory knows about a file."""
+
+    size: int
+    mtime_ns: int
+    mime_type: str | None
+    digests: dict[str, str] = field(default_factory=dict)  # by hashlib algorithm
+
+
+def hash_file(path: str, algorithms: Iterable[str] = ("md5",)) -> dict[str, str]:
+    """
+    Reads a file once, updating a hash for each algorithm.
+
+    :param path: Path of the file
+    :param algorithms: Names of hashlib algorithms
+    :return: The file's checksums by algorithm
+    """
+    hashes = {name: hashlib.new(name) for name in algorithms}
+    view = _read_buffer()
+    with open(path, "rb", buffering=0) as f:
+        while True:
+            count = f.readinto(view)
+            if not count:
+                break
+            for hash in hashes.values():
+                hash.update(view[:count])
+    return {name: hash.hexdigest() for name, hash in hashes.items()}
+
+
+def _read_buffer() -> memoryview:
+    """:return: The calling thread's buffer of READ_SIZE bytes for hash_file"""
+    view = getattr(_buffers, "view", None)
+    if view is None or len(view) != READ_SIZE:
+        view = _buffers.view = memoryview(bytearray(READ_SIZE))
+    return view
+
+
+class Inventory:
+    """The inventory of a crate's files."""
+
+    def __init__(self, path: str | None = None, algorithms=("md5",)):
+        """
+        :param path: Path of the file to save the inventory to. Defaults to None,
+            which keeps it in memory only
+        :param algorithms: Names of hashlib algorithms to compute for each file
+        """
+        self.path = path
+        self.algorithms = tuple(algorithms)
+        self.files: dict[str, FileInfo] = {}  # by absolute path
+        self._saved: dict[str, FileInfo] = {}
+
+    @classmethod
+    def load(cls, path: str, algorithms=("md5",)) -> Inventory:
+        """
+        Loads the inventory saved by an earlier deposit, if there is one. An
+        unreadable inventory is ignored, and all files are read again.
+
+        :param path: Path of the inventory file
+        :param algorithms: Names of hashlib algorithms to compute for each file
+        """
+        inventory = cls(path, algorithms)
+        try:
+            with open(path, "r") as f:
+                saved = json.load(f)
+            inventory._saved = {file: FileInfo(**info) for file, info in saved.items()}
+        except FileNotFoundError:
+            pass
+        except (ValueError, TypeError):
+            print(f"Ignoring the unreadable file inventory {path}")
+        return inventory
+
+    def scan(
+        self,
+        files: list[str],
+        jobs: int | None = None,
+        stats: Mapping[str, sources.FileStat] | None = None,
+    ):
+        """
+        Takes the inventory of files in a pool of threads. Files which are unchanged
+        since the inventory was saved are not read.
+
+        :param files: Paths of the files
+        :param jobs: Number of threads. Defaults to ThreadPoolExecutor's default
+        :param stats: FileStat of the files by path, e.g. from the walk which listed
+            them. Files without one are stat'ed
+        """
+        with ThreadPoolExecutor(
+            max_workers=jobs, thread_name_prefix="inventory"
+        ) as executor:
+            infos = executor.map(self._take, files, itertools.repeat(stats))
+            for file, info in zip(files, infos):
+                self.files[os.path.abspath(file)] = info
+
+    def _take(
+        self, file: str, stats: Mapping[str, sources.FileStat] | None = None
+    ) -> FileInfo:
+        stat = sources.file_stat(file, stats)
+        saved = self._saved.get(os.path.abspath(file))
+        if (
+            saved is not None
+            and (saved.size, saved.mtime_ns) == stat
+            and set(self.algorithms) <= saved.digests.keys()
+        ):
+            return saved
+        return FileInfo(
+            stat.size,
+            stat.mtime_ns,
+            mimetypes.guess_type(file)[0],
+            hash_file(file, self.algorithms),
+        )
+
+    def get(self, file) -> FileInfo | None:
+        """
+        :param file: A file of the record: a path, or a generated file
+        :return: What the inventory knows about the file, or None if it is not in
+            the inventory or has changed since it was scanned
+        """
+        if not isinstance(file, (str, os.PathLike)):
+            return None
+        info = self.files.get(os.path.abspath(file))
+        if info is None:
+            return None
+        stat = os.stat(file)
+        if (stat.st_size, stat.st_mtime_ns) != (info.size, info.mtime_ns):
+            return None
+        return info
+
+    def digests(self, file) -> dict[str, str]:
+        """:return: The checksums of a file by algorithm, if the inventory has it"""
+        info = self.get(file)
+        return dict(info.digests) if info is not None else {}
+
+    def save(self):
+        """Saves the inventory of the scanned files, replacing the saved one."""
+        if self.path is None:
+            return
+        saved = {file: asdict(info) for file, info in self.files.items()}
+        with open(self.path + ".part", "w") as f:
+            json.dump(saved, f)
+        os.replace(self.path + ".part", self.path)
+
+    def describe(self, metadata: dict):
+        """
+        Fills in the sizes and formats of a record's DataCite metadata from the
+        files, unless the crate declares them.
+
+        :param metadata: The record's DataCite metadata
+        """
+        if not self.files:
+            return
+        record = metadata.setdefault("metadata", {})
+        if not record.get("sizes"):
+            record["sizes"] = [f"{sum(i.size for i in self.files.values())} bytes"]
+        if not record.get("formats"):
+            formats = {i.mime_type for i in self.files.values() if i.mime_type}
+            if formats:
+                record["formats"] = sorted(formats)
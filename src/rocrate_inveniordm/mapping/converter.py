@@ -5,6 +5,8 @@ import sys
 
 import rocrate_inveniordm.mapping.condition_functions as cf
 import rocrate_inveniordm.mapping.processing_functions as pf
+import rocrate_inveniordm.metrics as metrics
+import rocrate_inveniordm.tracing as tracing
 from rocrate_inveniordm.mapping.mapping_utils import (
     MappingException,
     load_mapping_json,
@@ -16,6 +18,7 @@ from rocrate_inveniordm.mapping.mapping_utils import (
 )
 from rocrate_inveniordm.mapping.crate_utils import (
     dereference,
+    indexed_entities,
     rc_get_rde,
     get_value_from_rc,
 )
@@ -42,12 +45,14 @@ def main():
     return
 
 
-def convert(rc: dict, metadata_only: bool = False) -> dict:
+def convert(rc: dict, metadata_only: bool = False, inventory=None) -> dict:
     """
     Convert a RO-Crate to a DataCite object
 
     :param rc: The RO-Crate
     :param metadata_only: Whether it is a metadata-only DataCite
+    :param inventory: An Inventory of the crate's files, to fill in the sizes and
+        formats with if the crate does not declare them
     :return: Dictionary containing DataCite metadata
     """
 
@@ -63,42 +68,58 @@ def convert(rc: dict, metadata_only: bool = False) -> dict:
     except KeyError:
         raise MappingException("Mapping does not contain a '$root' key.")
 
-    for mapping_class in root_rules:
-        print()
+    with indexed_entities(rc):
+        for mapping_class in root_rules:
+            timer = metrics.CONVERSION_SECONDS.labels(mapping_class).time()
+            with tracing.span(mapping_class, cat="convert"), timer:
+                dc = apply_rule_class(rc, dc, mapping_class, root_rules[mapping_class])
 
-        # Ignore mappings that are marked as ignored
-        if "_ignore" in root_rules.get(mapping_class).keys():
-            print(f"|x Ignoring {mapping_class}")
-            continue
+    if inventory is not None:
+        inventory.describe(dc)
+    return dc
+
+
+def apply_rule_class(rc: dict, dc: dict, mapping_class: str, root_mappings: dict):
+    """Apply all mappings of one rule class (e.g. "creators_mapping") to the DataCite
+    metadata, or its ifNonePresent rule if none of the mappings apply.
+
+    :param rc: Dictionary of RO-Crate metadata
+    :param dc: Dictionary of DataCite metadata
+    :param mapping_class: Name of the rule class
+    :param root_mappings: The rule class from the mapping
+    :return: The updated dictionary of DataCite metadata
+    """
+    print()
 
-        print(f"|- Applying rule collection {mapping_class}")
+    # Ignore mappings that are marked as ignored
+    if "_ignore" in root_mappings.keys():
+        print(f"|x Ignoring {mapping_class}")
+        return dc
 
-        root_mappings = root_rules.get(mapping_class)
+    print(f"|- Applying rule collection {mapping_class}")
 
-        mappings = root_mappings.get("mappings")
+    mappings = root_mappings.get("mappings", {})
 
-        mapping_paths = get_mapping_paths(rc, mappings)
+    mapping_paths = get_mapping_paths(rc, mappings)
 
-        print(f"\t\t|- Paths: {mapping_paths}")
+    print(f"\t\t|- Paths: {mapping_paths}")
 
-        is_any_present = False
+    is_any_present = False
 
-        for mapping_key in mappings:
-            print(f"\t|- Applying mapping {mapping_key}")
+    for mapping_key in mappings:
+        print(f"\t|- Applying mapping {mapping_key}")
 
-            mapping = mappings.get(mapping_key)
-            dc, any_present = apply_mapping(mapping, mapping_paths, rc, dc)
-            is_any_present = is_any_present or any_present
+        mapping = mappings.get(mapping_key)
+        dc, any_present = apply_mapping(mapping, mapping_paths, rc, dc)
+        is_any_present = is_any_present or any_present
 
-        if not is_any_present:
-            none_present_value = root_mappings.get("ifNonePresent")
-            if none_present_value is not None:
-                print(f"\t|- Applying ifNonePresent rule {none_present_value}")
-                for none_present_key in none_present_value:
-                    none_present_mapping_value = none_present_value.get(
-                        none_present_key
-                    )
-                    dc = set_dc(dc, none_present_key, none_present_mapping_value)
+    if not is_any_present:
+        none_present_value = root_mappings.get("ifNonePresent")
+        if none_present_value is not None:
+            print(f"\t|- Applying ifNonePresent rule {none_present_value}")
+            for none_present_key in none_present_value:
+                none_present_mapping_value = none_present_value.get(none_present_key)
+                dc = set_dc(dc, none_present_key, none_present_mapping_value)
 
     return dc
 
@@ -184,12 +205,12 @@ def apply_mapping(mapping, mapping_paths, rc, dc):  # noqa: C901
         new_path = path.copy()
         from_value = get_value_from_rc(rc.copy(), from_mapping_value, new_path)
 
-        if from_value and isinstance(from_value, dict):
-            # If the value is a JSON object, then we ignore the rule (since another rule
-            # must be implemented on how to handle it)
+        if from_value and isinstance(from_value, (dict, list)):
+            # If the value is a JSON object or a nested list, then we ignore the rule
+            # (since another rule must be implemented on how to handle it)
             print(
-                "\t\t|- Result is a JSON object, so this rule cannot be applied. "
-                "Skipping to next rule."
+                "\t\t|- Result is a JSON object or list, so this rule cannot be "
+                "applied. Skipping to next rule."
             )
             from_value = None
 
@@ -213,7 +234,6 @@ def apply_mapping(mapping, mapping_paths, rc, dc):  # noqa: C901
                 f"{path.copy()}"
             )
             rule_applied = True
-            print(dc, to_mapping_value, from_value)
             dc = set_dc(dc, to_mapping_value, from_value, path.copy())
 
     return dc, rule_applied
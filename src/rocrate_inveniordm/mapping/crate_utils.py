@@ -1,7 +1,51 @@
 from __future__ import annotations
 
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator
+
 from rocrate_inveniordm.mapping.mapping_utils import clean_key, MappingException
 
+# (graph, {@id: entity}, root data entity) for the crate currently being converted
+_entity_index: ContextVar[tuple[list, dict, dict] | None] = ContextVar(
+    "_entity_index", default=None
+)
+
+
+@contextmanager
+def indexed_entities(rc: dict) -> Iterator[None]:
+    """Index the entities of an RO-Crate by @id for the duration of the block.
+
+    Without the index, every reference lookup scans the whole @graph and every value
+    lookup searches for the Root Data Entity again, which makes conversion quadratic in
+    the size of the crate. The crate must not be modified while the index is active.
+
+    :param rc: Dictionary of RO-Crate metadata
+    """
+    graph = rc.get("@graph", [])
+    entity_map: dict = {}
+    for entity in graph:
+        entity_id = entity.get("@id") if isinstance(entity, dict) else None
+        try:
+            # keep the first match, like the linear scan in get_referenced_entity
+            entity_map.setdefault(entity_id, entity)
+        except TypeError:
+            # unhashable @id; such entities can only be found by a linear scan
+            continue
+    token = _entity_index.set((graph, entity_map, _find_rde(rc)))
+    try:
+        yield
+    finally:
+        _entity_index.reset(token)
+
+
+def _get_index(rc: dict) -> tuple[list, dict, dict] | None:
+    """Return the active entity index if it belongs to the given RO-Crate."""
+    index = _entity_index.get()
+    if index is not None and index[0] is rc.get("@graph"):
+        return index
+    return None
+
 
 def dereference(
     rc: dict, entity_or_dict: dict, key: str, index: int | None = None
@@ -35,6 +79,14 @@ def rc_get_rde(rc):
     :param rc: The RO-Crate to retrieve the RDE from.
     :return: The Root Data Entity of the given RO-Crate.
     """
+    index = _get_index(rc)
+    if index is not None:
+        return index[2]
+    return _find_rde(rc)
+
+
+def _find_rde(rc):
+    """Search the @graph of the given RO-Crate for its Root Data Entity."""
 
     # Following the RO-Crate specification
     # (https://www.researchobject.org/ro-crate/specification/1.2-DRAFT/root-data-entity.html#finding-the-root-data-entity),
@@ -52,7 +104,12 @@ def rc_get_rde(rc):
     # Fail with unknown root data entity.
 
     # Build a map of all entities using their @id as keys
-    entity_map = {e["@id"]: e for e in rc["@graph"]}
+    entity_map = {}
+    for e in rc["@graph"]:
+        try:
+            entity_map[e["@id"]] = e
+        except TypeError:
+            continue  # unhashable @id, cannot be the metadata descriptor or root
 
     # First, try to find the root from ro-crate-metadata.json
     metadata_entity = entity_map.get("ro-crate-metadata.json")
@@ -197,13 +254,28 @@ def get_referenced_entity(
         return None
 
     # find matching entity in crate
+    entity = _find_entity(rc, id)
+    if entity is not None:
+        print(f"\t\t\t|- Found entity {entity}")
+    return entity
+
+
+def _find_entity(rc: dict, id) -> dict | None:
+    """Find the first entity in the @graph of an RO-Crate with the given @id, using
+    the active entity index if there is one."""
+    index = _get_index(rc)
+    if index is not None:
+        try:
+            return index[1].get(id)
+        except TypeError:
+            pass  # unhashable @id, fall back to scanning the graph
+
     all_entities = rc.get("@graph", [])
     assert isinstance(all_entities, list)
 
     for entity in all_entities:
         assert isinstance(entity, dict)
         if entity.get("@id") == id:
-            print(f"\t\t\t|- Found entity {entity}")
             return entity
 
     return None
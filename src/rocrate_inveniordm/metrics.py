@@ -0,0 +1,327 @@
+"""
+    Prometheus metrics for the deposit pipeline.
+
+    The uploader and converter record their metrics in the module-level REGISTRY.
+    They can be exported in the Prometheus text exposition format, either by writing a
+    file for the node_exporter textfile collector with write_textfile(), or by serving
+    them over HTTP with start_http_server().
+"""
+
+from __future__ import annotations
+
+import math
+import os
+import tempfile
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Iterator, Sequence, TypeVar
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# request latencies range from fast API calls to multi-hour content uploads
+DEFAULT_BUCKETS = (
+    0.01,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+    300.0,
+    900.0,
+    3600.0,
+)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra="") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+
+M = TypeVar("M", bound="Metric")
+
+
+class Metric(ABC):
+    """Base class for metrics with an optional set of labels."""
+
+    type = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._children: dict[tuple[str, ...], Metric] = {}  # one per label values
+
+    def labels(self: M, *values: str) -> M:
+        """Return the child metric for the given label values, creating it if
+        necessary."""
+        if len(values) != len(self.labelnames):
+            raise ValueError(
+                f"{self.name} expects labels {self.labelnames}, got {values}"
+            )
+        key = tuple(str(v) for v in values)
+        with self._lock:
+            if key not in self._children:
+                self._children[key] = self._new_child()
+            return self._children[key]  # type: ignore[return-value]
+
+    @abstractmethod
+    def _new_child(self) -> Metric:
+        """Return a new metric of the same type for one set of label values."""
+
+    def _samples(self) -> Iterator[tuple[str, tuple[str, ...], str, float]]:
+        """Yield (suffix, label values, extra label, value) for every sample."""
+        if not self.labelnames:
+            yield from self._own_samples(())
+        with self._lock:
+            children = list(self._children.items())
+        for key, child in children:
+            yield from child._own_samples(key)
+
+    @abstractmethod
+    def _own_samples(self, key):
+        """Yield the samples of this metric, labelled with key."""
+
+    def render(self) -> str:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type}",
+        ]
+        for suffix, key, extra, value in self._samples():
+            labels = _format_labels(self.labelnames, key, extra)
+            lines.append(f"{self.name}{suffix}{labels} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+class Counter(Metric):
+    """A value that only goes up, e.g. the number of bytes uploaded."""
+
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self.value = 0.0
+
+    def _new_child(self) -> Counter:
+        return Counter(self.name, self.documentation)
+
+    def inc(self, amount: float = 1):
+        if amount < 0:
+            raise ValueError("Counters can only be incremented by non-negative amounts")
+        with self._lock:
+            self.value += amount
+
+    def _own_samples(self, key):
+        yield "", key, "", self.value
+
+
+class Gauge(Metric):
+    """A value that goes up and down, e.g. the number of uploads in parallel."""
+
+    type = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self.value = 0.0
+
+    def _new_child(self) -> Gauge:
+        return Gauge(self.name, self.documentation)
+
+    def set(self, value: float):
+        with self._lock:
+            self.value = value
+
+    def _own_samples(self, key):
+        yield "", key, "", self.value
+
+
+class Histogram(Metric):
+    """Counts observations, e.g. request latencies, in cumulative buckets."""
+
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self.counts = [0] * len(self.buckets)
+        self.sum = 0.0
+
+    def _new_child(self) -> Histogram:
+        return Histogram(self.name, self.documentation, buckets=self.buckets[:-1])
+
+    def observe(self, value: float):
+        with self._lock:
+            self.sum += value
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    self.counts[i] += 1
+                    break
+
+    @contextmanager
+    def time(self) -> Iterator[None]:
+        """Observe the duration of the enclosed block, in seconds."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+    def _own_samples(self, key):
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            yield "_bucket", key, f'le="{_format_value(bound)}"', cumulative
+        yield "_sum", key, "", self.sum
+        yield "_count", key, "", cumulative
+
+
+class Registry:
+    """A collection of metrics which are exported together."""
+
+    def __init__(self) -> None:
+        self._metrics: dict[str, Metric] = {}
+
+    def register(self, metric: M) -> M:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        """Return all metrics in the Prometheus text exposition format."""
+        return "".join(metric.render() for metric in self._metrics.values())
+
+
+REGISTRY = Registry()
+
+UPLOADED_BYTES = REGISTRY.register(
+    Counter(
+        "rocrate_inveniordm_uploaded_bytes_total",
+        "Bytes of file content uploaded to InvenioRDM.",
+    )
+)
+RECORD_FILES = REGISTRY.register(
+    Histogram(
+        "rocrate_inveniordm_record_files",
+        "Number of files uploaded per record.",
+        buckets=(0, 1, 5, 10, 50, 100, 500, 1000, 5000, 10000, 50000),
+    )
+)
+REQUEST_SECONDS = REGISTRY.register(
+    Histogram(
+        "rocrate_inveniordm_request_duration_seconds",
+        "Latency of requests to InvenioRDM by endpoint.",
+        ["endpoint"],
+    )
+)
+RESPONSES = REGISTRY.register(
+    Counter(
+        "rocrate_inveniordm_responses_total",
+        "Responses from InvenioRDM by endpoint and HTTP status code.",
+        ["endpoint", "status"],
+    )
+)
+RETRIES = REGISTRY.register(
+    Counter(
+        "rocrate_inveniordm_retries_total",
+        "Requests to InvenioRDM which were retried, by endpoint.",
+        ["endpoint"],
+    )
+)
+CHECKSUM_MISMATCHES = REGISTRY.register(
+    Counter(
+        "rocrate_inveniordm_checksum_mismatches_total",
+        "Uploaded files whose checksum in InvenioRDM differed from the local file.",
+    )
+)
+UPLOAD_CONCURRENCY = REGISTRY.register(
+    Gauge(
+        "rocrate_inveniordm_upload_concurrency",
+        "Number of files currently allowed to upload in parallel.",
+    )
+)
+CONVERSION_SECONDS = REGISTRY.register(
+    Histogram(
+        "rocrate_inveniordm_conversion_duration_seconds",
+        "Time spent converting RO-Crate metadata to DataCite, by rule class.",
+        ["rule_class"],
+        buckets=(0.0001, 0.001, 0.01, 0.1, 1.0, 10.0, 60.0),
+    )
+)
+
+
+def write_textfile(path: str, registry: Registry = REGISTRY):
+    """Write the metrics to a file for the node_exporter textfile collector.
+    The file is replaced atomically, so the collector never reads a partial file.
+
+    :param path: Path of the file to write. The collector only reads files ending in
+        .prom
+    :param registry: Registry to export. Defaults to REGISTRY
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".metrics-", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(registry.render())
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def start_http_server(
+    port: int, addr: str = "", registry: Registry = REGISTRY
+) -> ThreadingHTTPServer:
+    """Serve the metrics over HTTP from a daemon thread, for Prometheus to scrape.
+
+    :param port: Port to listen on. Use 0 to pick a free port
+    :param addr: Address to listen on. Defaults to all interfaces
+    :param registry: Registry to export. Defaults to REGISTRY
+    :return: The running server. Call shutdown() on it to stop serving
+    """
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = registry.render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass  # scrapes are frequent, do not log each one to stderr
+
+    server = ThreadingHTTPServer((addr, port), MetricsHandler)
+    thread = threading.Thread(
+        target=server.serve_forever, name="rocrate-inveniordm-metrics", daemon=True
+    )
+    thread.start()
+    return server
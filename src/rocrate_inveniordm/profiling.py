@@ -0,0 +1,114 @@
+"""
+    Profilers that can be wrapped around a deposit to find out where time is spent.
+
+    cprofile() is a deterministic profiler which writes pstats output, and
+    SamplingProfiler is a low-overhead statistical profiler which writes collapsed
+    stacks, suitable for leaving on in production.
+"""
+
+from __future__ import annotations
+
+import cProfile
+import os
+import sys
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from typing import Iterator
+
+
+@contextmanager
+def cprofile(path: str) -> Iterator[cProfile.Profile]:
+    """Profile the enclosed block with cProfile and write pstats output to path.
+    The output is written even if the block raises or exits.
+
+    The file can be inspected with `python -m pstats <path>` or tools such as
+    snakeviz.
+
+    :param path: Path of the pstats file to write
+    """
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield profiler
+    finally:
+        profiler.disable()
+        profiler.dump_stats(path)
+        print(f"Wrote profile to {path}")
+
+
+class SamplingProfiler:
+    """Samples the call stacks of all running threads at a fixed interval.
+
+    Unlike cProfile, the profiled code is not slowed down by tracing every call: the
+    only cost is a background thread waking up every `interval` seconds. Samples are
+    written in the collapsed stack format ("frame;frame;frame count" per line), which
+    can be read by flamegraph.pl, speedscope and similar tools.
+
+    Usable as a context manager, which starts sampling on entry and writes the output
+    on exit.
+    """
+
+    def __init__(self, path: str, interval: float = 0.01):
+        """
+        :param path: Path of the collapsed stacks file to write
+        :param interval: Time between samples, in seconds. Defaults to 0.01
+        """
+        self.path = path
+        self.interval = interval
+        self.samples: Counter[str] = Counter()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="rocrate-inveniordm-sampler", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def sample(self):
+        """Record the current stack of every thread except the sampler itself."""
+        own_id = threading.get_ident()
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_id:
+                continue
+            self.samples[collapse_stack(frame)] += 1
+
+    def write(self):
+        with open(self.path, "w") as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+        print(f"Wrote {sum(self.samples.values())} stack samples to {self.path}")
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+    def __enter__(self) -> SamplingProfiler:
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+        self.write()
+
+
+def collapse_stack(frame) -> str:
+    """Format a stack as semicolon-separated frames, outermost first.
+
+    :param frame: The innermost frame of the stack
+    :return: The collapsed stack, e.g. "deposit.py:main;deposit.py:deposit"
+    """
+    frames = []
+    while frame is not None:
+        code = frame.f_code
+        frames.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+        frame = frame.f_back
+    return ";".join(reversed(frames))
@@ -0,0 +1,144 @@
+"""
+    Records a timeline of the phases of a deposit in the Trace Event Format, which can
+    be viewed in Perfetto (https://ui.perfetto.dev) or chrome://tracing.
+
+    Code marks phases with span(), which does nothing unless tracing is active:
+
+        with tracing.span("create_draft_record", cat="upload"):
+            ...
+
+    Each thread gets a track of its own. Concurrent asyncio tasks share a thread, so
+    each task opens its own track with track(), or their spans would overlap:
+
+        with tracing.track("upload 1"):
+            ...
+
+    See https://docs.google.com/document/d/1CvAClvFfyA5R-PhYUmn5OOQtYMH4h6I0nSsKchNAySU
+    for the format.
+"""
+
+from __future__ import annotations
+
+import itertools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from typing import ContextManager, Iterator
+
+# the track of the current task, as (id, name), or None for the current thread's
+_track: ContextVar[tuple[int, str] | None] = ContextVar("track", default=None)
+_track_ids = itertools.count(1)
+
+
+class Tracer:
+    """Collects complete ("X") trace events from any number of threads."""
+
+    def __init__(self) -> None:
+        self.events: list[dict] = []
+        self._start = time.perf_counter()
+        self._lock = threading.Lock()
+        self._thread_names: dict[int, str] = {}
+
+    def now(self) -> float:
+        """Microseconds since the tracer was created."""
+        return (time.perf_counter() - self._start) * 1e6
+
+    @contextmanager
+    def span(self, name: str, cat: str = "", **args) -> Iterator[dict]:
+        """Record the enclosed block as an event. The yielded dictionary is stored as
+        the event's args, so details only known at the end (e.g. a status code) can be
+        added to it."""
+        track = _track.get()
+        if track is None:
+            thread = threading.current_thread()
+            track = (thread.ident or 0, thread.name)
+        tid, track_name = track
+        start = self.now()
+        try:
+            yield args
+        finally:
+            event = {
+                "name": name,
+                "cat": cat,
+                "ph": "X",
+                "ts": start,
+                "dur": self.now() - start,
+                "pid": os.getpid(),
+                "tid": tid,
+                "args": args,
+            }
+            with self._lock:
+                self.events.append(event)
+                self._thread_names.setdefault(tid, track_name)
+
+    def to_json(self) -> dict:
+        with self._lock:
+            metadata = [
+                {
+                    "name": "thread_name",
+                    "ph": "M",
+                    "pid": os.getpid(),
+                    "tid": tid,
+                    "args": {"name": name},
+                }
+                for tid, name in self._thread_names.items()
+            ]
+            return {
+                "traceEvents": metadata + sorted(self.events, key=lambda e: e["ts"]),
+                "displayTimeUnit": "ms",
+            }
+
+    def write(self, path: str):
+        with open(path, "w") as f:
+            json.dump(self.to_json(), f)
+
+
+_tracer: Tracer | None = None
+
+
+def span(name: str, cat: str = "", **args) -> ContextManager[dict]:
+    """Record the enclosed block in the active trace, if there is one.
+
+    :param name: Name of the phase, shown on the timeline
+    :param cat: Category of the phase, e.g. "deposit", "convert" or "upload"
+    :param args: Extra details to attach to the event
+    """
+    if _tracer is None:
+        return nullcontext(args)
+    return _tracer.span(name, cat, **args)
+
+
+@contextmanager
+def track(name: str) -> Iterator[None]:
+    """Record the spans of the enclosed block on a new track instead of the current
+    thread's, e.g. those of one of several asyncio tasks running at once. The track
+    is inherited by tasks started in the block.
+
+    :param name: Name of the track, shown on the timeline
+    """
+    token = _track.set((next(_track_ids), name))
+    try:
+        yield
+    finally:
+        _track.reset(token)
+
+
+@contextmanager
+def tracing(path: str) -> Iterator[Tracer]:
+    """Trace the enclosed block and write the timeline to path as Trace Event Format
+    JSON. The output is written even if the block raises or exits.
+
+    :param path: Path of the trace file to write
+    """
+    global _tracer
+    previous, _tracer = _tracer, Tracer()
+    tracer = _tracer
+    try:
+        yield tracer
+    finally:
+        _tracer = previous
+        tracer.write(path)
+        print(f"Wrote trace to {path}")
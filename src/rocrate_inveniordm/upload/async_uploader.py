@@ -0,0 +1,410 @@
+"""
+    Asyncio variant of uploader.py, for programs that already run an event loop.
+    Requires the optional aiohttp dependency:
+
+        pip install rocrate-inveniordm[async]
+
+    Usage from a coroutine:
+
+        record_id = await async_uploader.deposit(metadata, files, concurrency=8)
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import os
+import time
+
+import rocrate_inveniordm.metrics as metrics
+import rocrate_inveniordm.tracing as tracing
+import rocrate_inveniordm.upload.checksum as checksum
+import rocrate_inveniordm.upload.credentials as credentials
+import rocrate_inveniordm.upload.retry as retry
+import rocrate_inveniordm.upload.throttle as throttle
+from rocrate_inveniordm.exceptions import (
+    ChecksumMismatchError,
+    FilesUploadError,
+    UploadError,
+)
+from rocrate_inveniordm.upload.uploader import (
+    DEFAULT_TIMEOUT,
+    FileUploadResult,
+    check_status,
+    print_upload_summary,
+)
+
+try:
+    import aiohttp
+except ImportError:  # pragma: no cover
+    aiohttp = None  # type: ignore[assignment]
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def open_session(
+    concurrency: int = 4,
+    timeout: tuple[float, float] = DEFAULT_TIMEOUT,
+    api_key: str | None = None,
+) -> aiohttp.ClientSession:
+    """
+    Opens an HTTP session for the repository, with a connection pool sized for the
+    given number of parallel uploads. The API key is sent with every request of
+    the session.
+
+    :param concurrency: Number of files to upload in parallel.
+    :param timeout: Seconds to wait for a connection and for each read from the
+        repository, as a (connect, read) tuple. There is no limit on the total time
+        of a request, which may upload a large file.
+    :param api_key: The repository's API key. Defaults to the one in the
+        environment.
+    :returns: The session. It must be closed by the caller.
+    """
+    if aiohttp is None:
+        raise ImportError(
+            "The asyncio upload engine requires aiohttp. Install it with "
+            "'pip install rocrate-inveniordm[async]'."
+        )
+    connector = aiohttp.TCPConnector(limit=max(1, concurrency))
+    connect, read = timeout
+    headers = {
+        "Accept": "application/json",
+        "Authorization": f"Bearer {api_key or credentials.get_api_key()}",
+    }
+    return aiohttp.ClientSession(
+        connector=connector,
+        headers=headers,
+        timeout=aiohttp.ClientTimeout(total=None, sock_connect=connect, sock_read=read),
+    )
+
+
+async def deposit(
+    metadata, files, publish=False, concurrency=4, session=None, max_bandwidth=None
+):
+    """
+    Entry point.
+    Uploads and publishes a record to the repository.
+
+    :param metadata: The record's DataCite metadata.
+    :param files: The record's files.
+    :param publish: Whether to publish the record after uploading.
+    :param concurrency: Number of files to upload in parallel.
+    :param session: An aiohttp.ClientSession opened with open_session to use.
+        Defaults to a new session which is closed afterwards.
+    :param max_bandwidth: Maximum bytes per second to send file contents at, in
+        total with the other uploads of the process given the same rate, or a
+        throttle.TokenBucket. Defaults to None, which does not limit the bandwidth.
+    :returns: The record's id.
+    """
+    if session is None:
+        async with open_session(concurrency) as session:
+            return await deposit(
+                metadata, files, publish, concurrency, session, max_bandwidth
+            )
+
+    api_url = credentials.get_repository_base_url()
+    if max_bandwidth is not None and not isinstance(
+        max_bandwidth, throttle.TokenBucket
+    ):
+        max_bandwidth = throttle.shared_bucket(max_bandwidth)
+    record_id = await upload(
+        session, metadata, files, concurrency, api_url, max_bandwidth
+    )
+    if publish:
+        await publish_record(session, record_id, api_url)
+    return record_id
+
+
+async def send_request(session, method, url, name, endpoint, trace_args=None, **kw):
+    """
+    Sends a request to the repository, recording it in the trace and metrics.
+    Retries the request according to the endpoint's policy in
+    retry.DEFAULT_RETRY_POLICIES, or RetryPolicy() for other endpoints.
+
+    :param session: The aiohttp.ClientSession to use.
+    :param method: The HTTP method.
+    :param url: The URL to send the request to.
+    :param name: Name of the request in the trace.
+    :param endpoint: Endpoint label for metrics, e.g. "records" or "content".
+    :param trace_args: Extra details to attach to the trace event.
+    :param kw: Passed on to session.request. If `data` is callable, it is called
+        for each attempt to create a new request body.
+    :returns: A tuple of the response status, the response body as text, and the
+        number of retries.
+    :raises UploadError: If the request still fails with a connection error after
+        the last retry.
+    """
+    policy = retry.get_policy(endpoint, method=method)
+    body = kw.pop("data", None)
+    retries = 0
+    while True:
+        data = body() if callable(body) else body
+        args = dict(trace_args or {}, retry=retries) if retries else trace_args
+        try:
+            status, text, retry_after = await _send_once(
+                session, method, url, name, endpoint, args, data=data, **kw
+            )
+        except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+            if not policy.should_retry(retries):
+                raise UploadError(f"Request to {url} failed: {e!r}") from e
+            delay = policy.delay(retries)
+        else:
+            if not policy.should_retry(retries, status):
+                return status, text, retries
+            delay = policy.delay(retries, retry_after)
+        retries += 1
+        metrics.RETRIES.labels(endpoint).inc()
+        await asyncio.sleep(delay)
+
+
+async def _send_once(session, method, url, name, endpoint, trace_args, **kw):
+    with tracing.span(name, cat="upload", **(trace_args or {})) as args:
+        with metrics.REQUEST_SECONDS.labels(endpoint).time():
+            async with session.request(method, url, **kw) as resp:
+                text = await resp.text()
+        args["status"] = resp.status
+    metrics.RESPONSES.labels(endpoint, str(resp.status)).inc()
+    return resp.status, text, resp.headers.get("Retry-After")
+
+
+async def create_draft_record(session, metadata, api_url=None):
+    """
+    Creates a draft record in the repository.
+    Raises a RepositoryError if the request fails.
+
+    :param session: The aiohttp.ClientSession to use.
+    :param metadata: The record's metadata.
+    :param api_url: The repository's base URL. Defaults to the one in the
+        environment.
+    :returns: The record's id.
+    """
+    api_url = api_url or credentials.get_repository_base_url()
+    status, text, _ = await send_request(
+        session,
+        "POST",
+        f"{api_url}/api/records",
+        "create_draft_record",
+        "records",
+        data=json.dumps(metadata),
+        headers={"Content-Type": "application/json"},
+    )
+    check_status(status, text, 201, "Could not create record", "records")
+    return json.loads(text).get("id")
+
+
+async def start_draft_files_upload(session, record_id, files, api_url=None):
+    """
+    Starts the draft file upload.
+    This function does NOT upload any files, but initializes the upload process.
+    Raises a RepositoryError if the request fails.
+
+    :param session: The aiohttp.ClientSession to use.
+    :param record_id: The record's id.
+    :param files: The files to be uploaded.
+    :param api_url: The repository's base URL. Defaults to the one in the
+        environment.
+    """
+    payload = [{"key": os.path.basename(file)} for file in files]
+
+    api_url = api_url or credentials.get_repository_base_url()
+    status, text, _ = await send_request(
+        session,
+        "POST",
+        f"{api_url}/api/records/{record_id}/draft/files",
+        "start_draft_files_upload",
+        "draft/files",
+        trace_args={"files": len(payload)},
+        data=json.dumps(payload),
+        headers={"Content-Type": "application/json"},
+    )
+    check_status(status, text, 201, "Could not initiate file upload", "draft/files")
+
+
+async def read_chunks(file_path, chunk_size=CHUNK_SIZE, hashes=(), bandwidth=None):
+    """
+    Reads a file in chunks without blocking the event loop. Each read runs in the
+    loop's default executor.
+
+    :param file_path: The path of the file to read.
+    :param chunk_size: Size of each chunk in bytes.
+    :param hashes: hashlib objects to update with each chunk.
+    :param bandwidth: A throttle.TokenBucket to wait for before each chunk is
+        sent, if any.
+    """
+    loop = asyncio.get_running_loop()
+    with open(file_path, "rb") as f:
+        while True:
+            chunk = await loop.run_in_executor(None, f.read, chunk_size)
+            if not chunk:
+                break
+            for hash in hashes:
+                hash.update(chunk)
+            if bandwidth is not None:
+                await asyncio.sleep(bandwidth.reserve(len(chunk)))
+            yield chunk
+
+
+async def upload_file(session, record_id, file_path, api_url=None, bandwidth=None):
+    """
+    Uploads a file to the record, streaming it from disk in chunks. Its md5 checksum
+    is computed while it is sent, and compared with the checksum the repository
+    returns on commit.
+    Raises a RepositoryError if a request fails, or a ChecksumMismatchError if the
+    checksums differ.
+
+    :param session: The aiohttp.ClientSession to use.
+    :param record_id: The record's id.
+    :param file_path: The path of the file to upload.
+    :param api_url: The repository's base URL. Defaults to the one in the
+        environment.
+    :param bandwidth: A throttle.TokenBucket limiting the bandwidth, if any.
+    :returns: The number of times requests for the file were retried.
+    """
+    file_name = os.path.basename(file_path)
+    print(file_name)
+
+    # Upload file content
+    api_url = api_url or credentials.get_repository_base_url()
+    upload_url = f"{api_url}/api/records/{record_id}/draft/files/{file_name}/content"
+    size = os.path.getsize(file_path)
+    headers = {"Content-Type": "application/octet-stream", "Content-Length": str(size)}
+    md5 = hashlib.md5()
+
+    def body():
+        nonlocal md5
+        md5 = hashlib.md5()  # restart for each attempt
+        return read_chunks(file_path, hashes=[md5], bandwidth=bandwidth)
+
+    status, text, retries = await send_request(
+        session,
+        "PUT",
+        upload_url,
+        "upload_file content",
+        "content",
+        trace_args={"file": file_name},
+        data=body,
+        headers=headers,
+    )
+    check_status(status, text, 200, "Could not upload file content", "content")
+    metrics.UPLOADED_BYTES.inc(size)
+    content_retries = retries
+
+    # Complete draft file upload
+    status, text, retries = await send_request(
+        session,
+        "POST",
+        f"{api_url}/api/records/{record_id}/draft/files/{file_name}/commit",
+        "upload_file commit",
+        "commit",
+        trace_args={"file": file_name},
+        headers={"Content-Type": "application/json"},
+    )
+    check_status(status, text, 200, "Could not commit file upload", "commit")
+    digests = {"md5": md5.hexdigest()}
+    server_checksum = json.loads(text).get("checksum")
+    if not checksum.matches(server_checksum, digests):
+        metrics.CHECKSUM_MISMATCHES.inc()
+        raise ChecksumMismatchError(file_name, server_checksum, digests)
+    return content_retries + retries
+
+
+async def upload(session, metadata, files, concurrency=4, api_url=None, bandwidth=None):
+    """
+    Uploads a draft record to the repository.
+    Raises a RepositoryError if a request fails, or a FilesUploadError if any file
+    could not be uploaded.
+
+    :param session: The aiohttp.ClientSession to use.
+    :param metadata: The record's metadata.
+    :param files: The record's files.
+    :param concurrency: Number of files to upload in parallel.
+    :param api_url: The repository's base URL. Defaults to the one in the
+        environment.
+    :param bandwidth: A throttle.TokenBucket limiting the bandwidth, if any.
+    :returns: The draft record's id.
+    """
+    api_url = api_url or credentials.get_repository_base_url()
+    record_id = await create_draft_record(session, metadata, api_url)
+    metrics.RECORD_FILES.observe(len(files))
+    print(f"Preparing to upload {len(files)} files...")
+    await start_draft_files_upload(session, record_id, files, api_url)
+
+    print(f"Uploading {len(files)} files with {concurrency} workers...")
+    results = await upload_files(
+        session, record_id, files, concurrency, api_url, bandwidth
+    )
+    print_upload_summary(results)
+    if any(result.status != "uploaded" for result in results):
+        raise FilesUploadError(record_id, results)
+
+    print(f"All {len(files)} files uploaded.")
+    return record_id
+
+
+async def upload_files(
+    session, record_id, files, concurrency=4, api_url=None, bandwidth=None
+):
+    """
+    Uploads and commits files to the record, with at most `concurrency` files in
+    flight at once. Fails fast: after the first failure, files that have not finished
+    uploading are cancelled. Each file's requests are traced on a track of its own.
+
+    :param session: The aiohttp.ClientSession to use.
+    :param record_id: The record's id.
+    :param files: The paths of the files to upload.
+    :param concurrency: Number of files to upload in parallel.
+    :param api_url: The repository's base URL. Defaults to the one in the
+        environment.
+    :param bandwidth: A throttle.TokenBucket limiting the total bandwidth of the
+        files, if any.
+    :returns: A list of FileUploadResult, in the same order as files.
+    """
+    api_url = api_url or credentials.get_repository_base_url()
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    results = [FileUploadResult(file) for file in files]
+
+    async def timed_upload(result):
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                with tracing.track(f"upload {os.path.basename(result.file)}"):
+                    result.retries = await upload_file(
+                        session, record_id, result.file, api_url, bandwidth
+                    )
+            except Exception as e:
+                result.status, result.error = "failed", repr(e)
+                current = asyncio.current_task()
+                for task in tasks:
+                    if task is not current:
+                        task.cancel()
+            else:
+                result.status = "uploaded"
+            finally:
+                result.seconds = time.perf_counter() - start
+
+    tasks = [asyncio.ensure_future(timed_upload(result)) for result in results]
+    await asyncio.gather(*tasks, return_exceptions=True)
+    return results
+
+
+async def publish_record(session, record_id, api_url=None):
+    """
+    Publishes a record.
+    Raises a RepositoryError if the request fails.
+
+    :param session: The aiohttp.ClientSession to use.
+    :param record_id: The record's id.
+    :param api_url: The repository's base URL. Defaults to the one in the
+        environment.
+    """
+    api_url = api_url or credentials.get_repository_base_url()
+    status, text, _ = await send_request(
+        session,
+        "POST",
+        f"{api_url}/api/records/{record_id}/draft/actions/publish",
+        "publish_record",
+        "publish",
+        headers={"Content-Type": "application/json"},
+    )
+    check_status(status, text, 202, "Could not publish record", "publish")
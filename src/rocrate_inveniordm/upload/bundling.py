@@ -0,0 +1,166 @@
+"""
+    Packs the small files of a crate into zip bundles, so that a crate with many tiny
+    files is uploaded with a few requests per bundle instead of a few per file.
+
+    Files below a size threshold are bundled, either per directory or across the
+    whole crate, into zip files of up to a maximum size, while larger files are
+    still uploaded individually. The paths inside a bundle are relative to the crate
+    root, so extracting all bundles into the crate directory restores it. Which files
+    went into which bundle is recorded in the record's metadata as an additional
+    description.
+"""
+
+from __future__ import annotations
+
+import html
+import os
+import shutil
+import tempfile
+import zipfile
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Iterator, Mapping
+
+import rocrate_inveniordm.upload.sources as sources
+
+DEFAULT_MAX_BUNDLE_SIZE = 100 * 1024 * 1024
+
+DESCRIPTION_TYPE = {"id": "technical-info", "title": {"en": "Technical info"}}
+DESCRIPTION_HEADING = "<p>Small files of the crate are bundled in zip archives:</p>"
+
+# kept out of bundles, so that the record shows the crate's metadata file
+UNBUNDLED_FILES = ("ro-crate-metadata.json",)
+
+
+@dataclass
+class Bundle:
+    """A zip archive of small files of a crate."""
+
+    name: str
+    files: list[str] = field(default_factory=list)  # relative to the crate root
+    size: int = 0  # total size of the files before compression
+
+
+def plan_bundles(
+    ro_crate_dir: str,
+    files: list[str],
+    threshold: int,
+    max_bundle_size: int = DEFAULT_MAX_BUNDLE_SIZE,
+    by_directory: bool = False,
+    stats: Mapping[str, sources.FileStat] | None = None,
+) -> tuple[list[str], list[Bundle]]:
+    """
+    Decides which files of a crate are bundled, and into which bundle.
+
+    :param ro_crate_dir: Path to the RO-Crate directory
+    :param files: Paths of the crate's files, inside ro_crate_dir
+    :param threshold: Files smaller than this many bytes are bundled
+    :param max_bundle_size: Maximum total size of the files in one bundle
+    :param by_directory: Whether to bundle the files of each directory separately
+    :param stats: FileStat of the files by path, e.g. from the walk which listed
+        them. Files without one are stat'ed
+    :return: The files to upload individually, and the bundles. Bundles are named
+        bundle-0001.zip and so on, skipping names of files uploaded individually,
+        as the files of a record are keyed by their names
+    """
+    individual, small = [], []
+    for file in files:
+        relative = os.path.relpath(file, ro_crate_dir)
+        size = sources.size(file, stats)
+        if relative in UNBUNDLED_FILES or size >= threshold:
+            individual.append(file)
+        else:
+            small.append((relative, size))
+
+    names = bundle_names({os.path.basename(file) for file in individual})
+    bundles: list[Bundle] = []
+    directory = None
+    # by directory, so that the files of a subdirectory do not come between those
+    # of its parent
+    small.sort(key=lambda item: (os.path.dirname(item[0]), item[0]))
+    for relative, size in small:
+        full = bool(bundles) and bundles[-1].size + size > max_bundle_size
+        moved = by_directory and os.path.dirname(relative) != directory
+        if not bundles or full or moved:
+            bundles.append(Bundle(next(names)))
+        bundles[-1].files.append(relative)
+        bundles[-1].size += size
+        directory = os.path.dirname(relative)
+    return individual, bundles
+
+
+def bundle_names(taken: set[str]) -> Iterator[str]:
+    """
+    :param taken: Names which are already used by files of the record
+    :return: The names for consecutive bundles, which are not taken
+    """
+    number = 0
+    while True:
+        number += 1
+        name = f"bundle-{number:04}.zip"
+        if name not in taken:
+            yield name
+
+
+def write_bundle(bundle: Bundle, ro_crate_dir: str, out_dir: str) -> str:
+    """
+    Writes a bundle as a zip file.
+
+    :param bundle: The bundle to write
+    :param ro_crate_dir: Path to the RO-Crate directory which holds the files
+    :param out_dir: Directory to write the zip file to
+    :return: Path of the zip file
+    """
+    path = os.path.join(out_dir, bundle.name)
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as archive:
+        for relative in bundle.files:
+            archive.write(os.path.join(ro_crate_dir, relative), relative)
+    return path
+
+
+@contextmanager
+def write_bundles(bundles: list[Bundle], ro_crate_dir: str) -> Iterator[list[str]]:
+    """
+    Writes the bundles to a temporary directory, which is removed on exit.
+
+    :param bundles: The bundles to write
+    :param ro_crate_dir: Path to the RO-Crate directory which holds the files
+    :return: The paths of the zip files
+    """
+    if not bundles:
+        yield []
+        return
+    out_dir = tempfile.mkdtemp(prefix="rocrate-inveniordm-bundles-")
+    try:
+        print(f"Bundling small files into {len(bundles)} zip files")
+        yield [write_bundle(bundle, ro_crate_dir, out_dir) for bundle in bundles]
+    finally:
+        shutil.rmtree(out_dir, ignore_errors=True)
+
+
+def describe_bundles(metadata: dict, bundles: list[Bundle]):
+    """
+    Records the contents of each bundle in the record's metadata, as an additional
+    description. A description of bundles from an earlier run, e.g. in a DataCite
+    file passed with -d, is replaced.
+
+    :param metadata: The record's DataCite metadata
+    :param bundles: The bundles
+    """
+    items = "".join(
+        f"<li>{html.escape(bundle.name)}: "
+        f"{', '.join(html.escape(file) for file in bundle.files)}</li>"
+        for bundle in bundles
+    )
+    descriptions = [
+        description
+        for description in metadata["metadata"].get("additional_descriptions", [])
+        if not description.get("description", "").startswith(DESCRIPTION_HEADING)
+    ]
+    descriptions.append(
+        {
+            "description": f"{DESCRIPTION_HEADING}<ul>{items}</ul>",
+            "type": DESCRIPTION_TYPE,
+        }
+    )
+    metadata["metadata"]["additional_descriptions"] = descriptions
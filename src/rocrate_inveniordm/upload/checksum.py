@@ -0,0 +1,106 @@
+"""
+    Computes the checksums of files while they are uploaded, so that each file is
+    only read once, and compares them with the checksums reported by the repository.
+"""
+
+from __future__ import annotations
+
+import hashlib
+
+READ_SIZE = 1024 * 1024
+
+
+class HashingReader:
+    """
+    Wraps a binary file opened for reading, and updates a hash for each algorithm
+    with every byte read through it.
+
+    Rewinding the reader with seek() restarts the hashes, so a request body which is
+    sent again after a failed attempt is hashed once.
+    """
+
+    def __init__(self, file, algorithms=("md5",)):
+        """
+        :param file: The file to read
+        :param algorithms: Names of hashlib algorithms to compute. Defaults to md5,
+            the algorithm of InvenioRDM's checksums
+        """
+        self._file = file
+        self.algorithms = tuple(algorithms)
+        self._start = file.tell()
+        self._reset()
+
+    def _reset(self):
+        self._hashes = {name: hashlib.new(name) for name in self.algorithms}
+
+    def read(self, size: int = -1) -> bytes:
+        data = self._file.read(size)
+        for hash in self._hashes.values():
+            hash.update(data)
+        return data
+
+    def __iter__(self):
+        while True:
+            chunk = self.read(READ_SIZE)
+            if not chunk:
+                return
+            yield chunk
+
+    def __len__(self) -> int:
+        position = self._file.tell()
+        end = self._file.seek(0, 2)
+        self._file.seek(position)
+        return end - self._start
+
+    def tell(self) -> int:
+        return self._file.tell() - self._start
+
+    def seek(self, offset: int, whence: int = 0) -> int:
+        if whence != 0 or offset != 0:
+            raise ValueError("A HashingReader can only be rewound to its start")
+        self._file.seek(self._start)
+        self._reset()
+        return 0
+
+    def hexdigests(self) -> dict[str, str]:
+        """The checksums of the bytes read so far, by algorithm."""
+        return {name: hash.hexdigest() for name, hash in self._hashes.items()}
+
+
+def digest(f, algorithm: str = "md5") -> str:
+    """
+    :param f: A binary file opened for reading
+    :param algorithm: Name of a hashlib algorithm
+    :return: The checksum of the rest of the file's content
+    """
+    hash = hashlib.new(algorithm)
+    for chunk in iter(lambda: f.read(READ_SIZE), b""):
+        hash.update(chunk)
+    return hash.hexdigest()
+
+
+def file_digest(path: str, algorithm: str = "md5") -> str:
+    """
+    :param path: Path of the file
+    :param algorithm: Name of a hashlib algorithm
+    :return: The checksum of the file's content
+    """
+    with open(path, "rb") as f:
+        return digest(f, algorithm)
+
+
+def matches(server_checksum: str | None, digests: dict[str, str]) -> bool:
+    """
+    Compares a checksum reported by the repository with the locally computed ones.
+
+    :param server_checksum: The checksum of a file entry, e.g. "md5:d41d8c..."
+    :param digests: The locally computed checksums, by algorithm
+    :return: False if the checksums differ, and True if they are equal or cannot be
+        compared, e.g. because the algorithm was not computed locally
+    """
+    if not server_checksum or ":" not in server_checksum:
+        return True
+    algorithm, value = server_checksum.split(":", 1)
+    if algorithm not in digests:
+        return True
+    return digests[algorithm] == value.lower()
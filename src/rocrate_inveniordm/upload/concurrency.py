@@ -0,0 +1,138 @@
+"""
+    Adapts the number of files uploaded in parallel to what the repository and the
+    network can take.
+
+    AdaptiveLimit follows AIMD (additive increase, multiplicative decrease), as TCP
+    congestion control does: the upload is divided into windows of as many completed
+    files as the current limit. After a window in which throughput improved, one more
+    file may be in flight. When the repository pushes back with 429 or 503, or the
+    latency of uploads grows well beyond the best seen so far, the limit is cut by a
+    factor.
+
+    Latency is measured in seconds per byte, and a window is only compared with
+    earlier windows of files of a similar mean size (within a factor of two): the
+    scheduler mixes the largest and smallest files, and a window of small files has
+    a higher latency per byte, from the fixed cost of each request, than a window
+    holding a large file.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+
+
+class AdaptiveLimit:
+    """
+    Limits the number of uploads in flight, adapting the limit with AIMD. Used as a
+    context manager around each upload, which waits until the upload may start.
+    """
+
+    def __init__(
+        self,
+        initial: int = 1,
+        max_limit: int = 16,
+        min_limit: int = 1,
+        backoff: float = 0.5,
+        latency_tolerance: float = 2.0,
+        on_change=None,
+        clock=time.monotonic,
+    ):
+        """
+        :param initial: Number of uploads allowed in flight at first
+        :param max_limit: Most uploads ever allowed in flight
+        :param min_limit: Fewest uploads allowed in flight
+        :param backoff: Factor to cut the limit by when the repository pushes back
+        :param latency_tolerance: Cut the limit when the latency per byte of a
+            window is more than this many times the lowest latency per byte seen so
+            far in windows of files of a similar size
+        :param on_change: Called with the new limit whenever it changes
+        :param clock: Returns the current time in seconds
+        """
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.limit = min(max(initial, self.min_limit), self.max_limit)
+        self.backoff = backoff
+        self.latency_tolerance = latency_tolerance
+        self.on_change = on_change
+        self._clock = clock
+        self.history: list[tuple[float, int]] = [(0.0, self.limit)]
+        self._start = clock()
+        self._in_flight = 0
+        self._best_latency: dict[int, float] = {}  # by size class
+        self._last_throughput = 0.0
+        self._condition = threading.Condition()
+        self._new_window()
+
+    def _new_window(self):
+        self._window_start = self._clock()
+        self._window_files = 0
+        self._window_bytes = 0
+        self._window_seconds = 0.0
+        self._throttled = False
+
+    def __enter__(self):
+        with self._condition:
+            while self._in_flight >= self.limit:
+                self._condition.wait()
+            self._in_flight += 1
+        return self
+
+    def __exit__(self, *exc_info):
+        with self._condition:
+            self._in_flight -= 1
+            self._condition.notify_all()
+
+    def record(self, seconds: float, size: int):
+        """
+        Records a completed upload, and adapts the limit at the end of a window.
+
+        :param seconds: How long the upload took
+        :param size: Size of the uploaded file in bytes
+        """
+        with self._condition:
+            self._window_files += 1
+            self._window_bytes += size
+            self._window_seconds += seconds
+            if self._window_files >= self.limit:
+                self._end_window()
+
+    def _end_window(self):
+        elapsed = self._clock() - self._window_start
+        throughput = self._window_bytes / elapsed if elapsed > 0 else 0.0
+        latency = self._window_seconds / max(self._window_bytes, 1)
+        size_class = (self._window_bytes // self._window_files).bit_length()
+        best = min(self._best_latency.get(size_class, latency), latency)
+        self._best_latency[size_class] = best
+        if latency > self.latency_tolerance * best:
+            self._set_limit(int(self.limit * self.backoff))
+        elif throughput > self._last_throughput:
+            self._set_limit(self.limit + 1)
+        self._last_throughput = throughput
+        self._new_window()
+
+    def throttled(self):
+        """
+        Records that the repository asked to slow down, e.g. with 429 or 503. The
+        limit is cut at most once per window, as the uploads in flight when it is
+        cut are likely to be pushed back as well.
+        """
+        with self._condition:
+            if self._throttled:
+                return
+            self._set_limit(int(self.limit * self.backoff))
+            # the window was cut short by the pushback, so its throughput is no
+            # baseline for the next window
+            self._last_throughput = 0.0
+            self._new_window()
+            self._throttled = True
+
+    def _set_limit(self, limit: int):
+        limit = min(max(limit, self.min_limit), self.max_limit)
+        if limit == self.limit:
+            return
+        self.limit = limit
+        self.history.append((self._clock() - self._start, limit))
+        self._condition.notify_all()
+        if self.on_change is not None:
+            self.on_change(limit)
@@ -0,0 +1,150 @@
+"""
+    On-disk journal of a deposit, which allows an interrupted upload to be resumed.
+
+    The journal is a file of JSON lines, by default next to the crate directory. Each
+    step of the upload appends a line and flushes it before the next step, so after a
+    crash of the process the journal holds the draft record's id, the initialized file
+    keys, and the committed files with their checksums. The draft record and its
+    publication are also synced to disk; a committed file which is lost from the
+    journal by a system crash is found in the draft when the deposit is resumed.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import threading
+from typing import IO
+
+JOURNAL_SUFFIX = ".inveniordm-journal"
+
+
+def journal_path(ro_crate_dir: str) -> str:
+    """
+    :param ro_crate_dir: Path to the RO-Crate directory
+    :return: Path of the crate's journal, next to the crate directory. It is not
+        inside the directory, so that it is never uploaded as part of the crate.
+    """
+    return os.path.abspath(ro_crate_dir.rstrip("/")) + JOURNAL_SUFFIX
+
+
+class Journal:
+    """
+    Records the progress of uploading a record, and replays it when loaded.
+
+    Safe to use from the threads of InvenioRDMClient.upload_files.
+    """
+
+    def __init__(self, path: str):
+        """
+        Creates an empty journal. Nothing is written until create() or start() is
+        called.
+
+        :param path: Path of the journal file
+        """
+        self.path = path
+        self.base_url: str | None = None
+        self.record_id: str | None = None
+        self.initialized: set[str] = set()
+        self.committed: dict[str, str | None] = {}  # key to checksum
+        self.published = False
+        self._lock = threading.Lock()
+        self._file: IO[str] | None = None
+
+    @classmethod
+    def load(cls, path: str) -> Journal:
+        """
+        Loads a journal written by an earlier deposit. A last line which was cut off
+        by a crash is ignored.
+
+        :param path: Path of the journal file
+        :raises FileNotFoundError: If there is no journal at path
+        """
+        journal = cls(path)
+        with open(path, "r") as f:
+            for line in f:
+                try:
+                    event = json.loads(line)
+                except json.JSONDecodeError:
+                    break
+                journal._apply(event)
+        return journal
+
+    def _apply(self, event: dict):
+        kind = event.get("event")
+        if kind == "draft":
+            self.base_url = event["base_url"]
+            self.record_id = event["record_id"]
+        elif kind == "initialized":
+            self.initialized.update(event["keys"])
+        elif kind == "committed":
+            self.committed[event["key"]] = event.get("checksum")
+        elif kind == "published":
+            self.published = True
+
+    def create(self):
+        """
+        Creates the journal file, replacing any earlier journal. Called before the
+        draft record is created, so that a journal which cannot be written fails the
+        deposit before it leaves a draft behind.
+        """
+        with self._lock:
+            self._open("w")
+
+    def _open(self, mode: str):
+        if self._file is not None:
+            self._file.close()
+        self._file = open(self.path, mode)
+
+    def _append(self, event: dict, sync: bool = False):
+        with self._lock:
+            self._apply(event)
+            if self._file is None:
+                self._open("a")
+            assert self._file is not None
+            self._file.write(json.dumps(event) + "\n")
+            self._file.flush()
+            if sync:
+                os.fsync(self._file.fileno())
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def start(self, base_url: str, record_id: str):
+        """Record a newly created draft, replacing any earlier journal."""
+        with self._lock:
+            self.initialized.clear()
+            self.committed.clear()
+            self.published = False
+            if self._file is None or self._file.tell() > 0:
+                self._open("w")
+        event = {"event": "draft", "base_url": base_url, "record_id": record_id}
+        self._append(event, sync=True)
+
+    def record_initialized(self, keys: list[str]):
+        self._append({"event": "initialized", "keys": list(keys)})
+
+    def record_committed(
+        self, key: str, checksum: str | None, digests: dict | None = None
+    ):
+        """
+        :param key: The file's key
+        :param checksum: The checksum reported by the repository
+        :param digests: The checksums computed while uploading, by algorithm
+        """
+        event: dict = {"event": "committed", "key": key, "checksum": checksum}
+        if digests:
+            event["digests"] = digests
+        self._append(event)
+
+    def record_published(self):
+        self._append({"event": "published"}, sync=True)
@@ -0,0 +1,88 @@
+"""
+    Helpers for InvenioRDM's multipart file transfer, in which a large file is
+    uploaded as separate parts that can be sent in parallel and retried one by one.
+"""
+
+from __future__ import annotations
+
+import math
+
+MIN_PART_SIZE = 5 * 1024 * 1024  # the smallest part S3-compatible storage accepts
+READ_SIZE = 1024 * 1024
+
+
+def part_count(size: int, part_size: int) -> int:
+    """
+    :param size: Size of the file in bytes
+    :param part_size: Size of each part in bytes. The last part may be smaller
+    :return: Number of parts to split the file into
+    """
+    return max(1, math.ceil(size / part_size))
+
+
+def transfer(size: int, part_size: int) -> dict:
+    """
+    :return: The "transfer" of a file entry when initializing a multipart upload
+    """
+    return {"type": "M", "parts": part_count(size, part_size), "part_size": part_size}
+
+
+class FilePart:
+    """
+    A file-like view of a byte range of a file, used as the body of a part upload.
+
+    It can be rewound with seek(0), so a failed part can be sent again, and has a
+    length, so requests sets the Content-Length header instead of sending the body
+    in chunked encoding.
+    """
+
+    def __init__(self, path: str, offset: int, length: int):
+        """
+        :param path: Path of the file
+        :param offset: Position of the first byte of the part in the file
+        :param length: Number of bytes in the part
+        """
+        self.offset = offset
+        self.length = length
+        self._file = open(path, "rb")
+        self._position = 0
+        self.seek(0)
+
+    def __len__(self) -> int:
+        return self.length
+
+    def tell(self) -> int:
+        return self._position
+
+    def seek(self, position: int, whence: int = 0) -> int:
+        if whence == 1:
+            position += self._position
+        elif whence == 2:
+            position += self.length
+        self._position = min(max(position, 0), self.length)
+        self._file.seek(self.offset + self._position)
+        return self._position
+
+    def read(self, size: int = -1) -> bytes:
+        remaining = self.length - self._position
+        if size < 0 or size > remaining:
+            size = remaining
+        data = self._file.read(size)
+        self._position += len(data)
+        return data
+
+    def __iter__(self):
+        while True:
+            chunk = self.read(READ_SIZE)
+            if not chunk:
+                return
+            yield chunk
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self) -> FilePart:
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,338 @@
+"""
+    Progress of an upload, reported to observers while it runs.
+
+    InvenioRDMClient notifies its observers when the upload starts, when each file
+    starts and finishes, whenever bytes of a file are sent, and when each phase of
+    the upload finishes, and how many files may be uploaded in parallel whenever
+    that changes. TerminalProgress shows a progress line with throughput and
+    ETA, UploadEstimate estimates the remaining time from the measured throughput,
+    and UploadReport collects a JSON report of the run. Programs which embed the
+    package can subclass UploadObserver to feed their own dashboards.
+
+    Observers are called from the upload's worker threads, so they must be thread
+    safe and should return quickly.
+"""
+
+from __future__ import annotations
+
+import json
+import sys
+import threading
+import time
+
+import rocrate_inveniordm.upload.scheduling as scheduling
+import rocrate_inveniordm.upload.sources as sources
+
+
+class UploadObserver:
+    """Receives the progress of an upload. All hooks do nothing by default."""
+
+    def upload_started(self, files: list[str], total_bytes: int, sizes: list[int]):
+        """
+        :param files: The files which are going to be uploaded
+        :param total_bytes: Their total size
+        :param sizes: The size of each file
+        """
+
+    def file_started(self, file: str, size: int):
+        """A worker started uploading a file of the given size."""
+
+    def bytes_sent(self, file: str, count: int):
+        """
+        :param file: The file whose content is being sent
+        :param count: Number of bytes sent since the last call. Negative if a request
+            body is rewound to be sent again after a failed attempt
+        """
+
+    def phase_finished(self, phase: str, seconds: float, file: str | None = None):
+        """
+        :param phase: Name of the phase, e.g. "initialize", "content" or "commit"
+        :param seconds: How long the phase took
+        :param file: The file the phase belongs to, or None for phases of the whole
+            upload
+        """
+
+    def file_finished(self, result):
+        """:param result: The FileUploadResult of the file"""
+
+    def concurrency_changed(self, limit: int):
+        """
+        :param limit: The number of files which may now be uploaded in parallel.
+            Also called with the initial number when files start uploading
+        """
+
+    def upload_finished(self, results: list):
+        """:param results: A FileUploadResult for each file"""
+
+
+class ProgressReader:
+    """
+    Wraps a file-like request body and reports the bytes read from it, i.e. sent to
+    the repository, to a callback.
+    """
+
+    def __init__(self, body, callback):
+        """
+        :param body: The request body, e.g. a HashingReader or a FilePart
+        :param callback: Called with the number of bytes read, or with a negative
+            number when the body is rewound
+        """
+        self._body = body
+        self._callback = callback
+
+    def __len__(self) -> int:
+        return len(self._body)
+
+    def read(self, size: int = -1) -> bytes:
+        data = self._body.read(size)
+        if data:
+            self._callback(len(data))
+        return data
+
+    def __iter__(self):
+        for chunk in self._body:
+            self._callback(len(chunk))
+            yield chunk
+
+    def tell(self) -> int:
+        return self._body.tell()
+
+    def seek(self, offset: int, whence: int = 0) -> int:
+        before = self._body.tell()
+        position = self._body.seek(offset, whence)
+        if position != before:
+            self._callback(position - before)
+        return position
+
+
+def format_bytes(count: float) -> str:
+    for unit in ("B", "KiB", "MiB", "GiB"):
+        if abs(count) < 1024:
+            return f"{count:.1f} {unit}"
+        count /= 1024
+    return f"{count:.1f} TiB"
+
+
+def format_seconds(seconds: float) -> str:
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02}:{seconds:02}"
+
+
+class TerminalProgress(UploadObserver):
+    """
+    Shows a single, continually updated line with the bytes and files uploaded so
+    far, the throughput, and the estimated time until the upload is done.
+    """
+
+    def __init__(self, stream=None, interval: float = 0.5, estimate=None):
+        """
+        :param stream: The terminal to write to. Defaults to sys.stderr
+        :param interval: Minimum number of seconds between updates of the line
+        :param estimate: An UploadEstimate observing the same upload, whose
+            estimate is shown as the ETA once it has one. By default, the ETA
+            assumes the remaining bytes are sent at the throughput so far
+        """
+        self.stream = stream or sys.stderr
+        self.interval = interval
+        self.estimate = estimate
+        self.total_bytes = 0
+        self.total_files = 0
+        self.sent = 0
+        self.done_files = 0
+        self.workers = 0
+        self._start = self._shown = 0.0
+        self._lock = threading.Lock()
+
+    def upload_started(self, files, total_bytes, sizes):
+        with self._lock:
+            self.total_files, self.total_bytes = len(files), total_bytes
+            self._start = time.perf_counter()
+            self._show(force=True)
+
+    def bytes_sent(self, file, count):
+        with self._lock:
+            self.sent += count
+            self._show()
+
+    def file_finished(self, result):
+        with self._lock:
+            self.done_files += 1
+            self._show()
+
+    def concurrency_changed(self, limit):
+        with self._lock:
+            self.workers = limit
+
+    def upload_finished(self, results):
+        with self._lock:
+            self._show(force=True)
+            self.stream.write("\n")
+            self.stream.flush()
+
+    def line(self) -> str:
+        """The progress line, e.g. "1.0 MiB of 4.0 MiB (25%), 1/4 files, ..."."""
+        elapsed = time.perf_counter() - self._start
+        rate = self.sent / elapsed if elapsed > 0 else 0.0
+        percent = 100 * self.sent / self.total_bytes if self.total_bytes else 100.0
+        line = (
+            f"{format_bytes(self.sent)} of {format_bytes(self.total_bytes)} "
+            f"({percent:.0f}%), {self.done_files}/{self.total_files} files, "
+            f"{format_bytes(rate)}/s, {self.workers} workers"
+        )
+        remaining = self.estimate.remaining_seconds() if self.estimate else None
+        if remaining is None and 0 < rate and self.sent < self.total_bytes:
+            remaining = (self.total_bytes - self.sent) / rate
+        if remaining is not None:
+            line += f", ETA {format_seconds(remaining)}"
+        return line
+
+    def _show(self, force: bool = False):
+        now = time.perf_counter()
+        if not force and now - self._shown < self.interval:
+            return
+        self._shown = now
+        self.stream.write(f"\r{self.line()}\033[K")
+        self.stream.flush()
+
+
+class UploadEstimate(UploadObserver):
+    """
+    Estimates the time until an upload is done. The time to upload a file is fitted
+    to the sizes and times of the files uploaded so far, as a fixed time per file
+    plus the size divided by the throughput of a connection, and the remaining
+    files are scheduled largest first on the workers in a simulation.
+    """
+
+    def __init__(self, min_samples: int = 2):
+        """
+        :param min_samples: Number of files which have to be uploaded before there
+            is an estimate
+        """
+        self.min_samples = min_samples
+        self.workers = 1
+        self.pending: dict[str, int] = {}  # file to size
+        self.in_flight: dict[str, tuple[int, float]] = {}  # file to size, start
+        self.samples: list[tuple[int, float]] = []  # size, seconds
+        self._lock = threading.Lock()
+
+    def upload_started(self, files, total_bytes, sizes):
+        with self._lock:
+            self.pending.update(zip(files, sizes))
+
+    def concurrency_changed(self, limit):
+        with self._lock:
+            self.workers = limit
+
+    def file_started(self, file, size):
+        with self._lock:
+            self.pending.pop(file, None)
+            self.in_flight[file] = (size, time.perf_counter())
+
+    def file_finished(self, result):
+        with self._lock:
+            self.in_flight.pop(result.file, None)
+            if result.status == "uploaded":
+                self.samples.append((result.size, result.seconds))
+
+    def upload_finished(self, results):
+        with self._lock:
+            self.pending.clear()
+
+    def remaining_seconds(self) -> float | None:
+        """Seconds until the upload is done, or None if there is no estimate yet."""
+        with self._lock:
+            if len(self.samples) < self.min_samples:
+                return None
+            throughput, overhead = scheduling.fit_throughput(self.samples)
+            now = time.perf_counter()
+            busy = [
+                max(0.0, overhead + size / throughput - (now - start))
+                for size, start in self.in_flight.values()
+            ]
+            sizes = sorted(self.pending.values(), reverse=True)
+            durations = [overhead + size / throughput for size in sizes]
+            return scheduling.makespan(durations, self.workers, busy)
+
+
+class UploadReport(UploadObserver):
+    """
+    Collects the size, duration, throughput, retries and phase times of each file,
+    the phase times of the whole upload, and the number of files uploaded in
+    parallel over time, to be written as a JSON report at the end of the run.
+    """
+
+    def __init__(self):
+        self.total_bytes = 0
+        self.seconds = 0.0
+        self.phases: dict[str, float] = {}
+        self.file_phases: dict[str, dict[str, float]] = {}
+        self.results: list = []
+        self.concurrency: list[tuple[float, int]] = []  # seconds since start, limit
+        self._start: float | None = None
+        self._lock = threading.Lock()
+
+    def upload_started(self, files, total_bytes, sizes):
+        with self._lock:
+            self.total_bytes += total_bytes
+            if self._start is None:
+                self._start = time.perf_counter()
+
+    def phase_finished(self, phase, seconds, file=None):
+        with self._lock:
+            if file is None:
+                phases = self.phases
+            else:
+                phases = self.file_phases.setdefault(file, {})
+            phases[phase] = phases.get(phase, 0.0) + seconds
+
+    def file_started(self, file, size):
+        with self._lock:
+            self.file_phases[file] = {}
+
+    def concurrency_changed(self, limit):
+        with self._lock:
+            start = self._start if self._start is not None else time.perf_counter()
+            self.concurrency.append((time.perf_counter() - start, limit))
+
+    def upload_finished(self, results):
+        with self._lock:
+            self.results.extend(results)
+            if self._start is not None:
+                self.seconds = time.perf_counter() - self._start
+
+    def to_json(self) -> dict:
+        with self._lock:
+            files = [self._file_json(result) for result in self.results]
+            uploaded = sum(f["size"] for f in files if f["status"] == "uploaded")
+            return {
+                "files": files,
+                "total_files": len(files),
+                "uploaded_files": sum(f["status"] == "uploaded" for f in files),
+                "total_bytes": self.total_bytes,
+                "uploaded_bytes": uploaded,
+                "seconds": self.seconds,
+                "bytes_per_second": uploaded / self.seconds if self.seconds else None,
+                "retries": sum(f["retries"] for f in files),
+                "phases": dict(self.phases),
+                "concurrency": [list(change) for change in self.concurrency],
+            }
+
+    def _file_json(self, result) -> dict:
+        seconds = result.seconds
+        return {
+            "file": str(result.file),
+            "key": sources.key(result.file),
+            "status": result.status,
+            "size": result.size,
+            "seconds": seconds,
+            "bytes_per_second": result.size / seconds if seconds else None,
+            "retries": result.retries,
+            "phases": self.file_phases.get(result.file, {}),
+            "error": result.error,
+        }
+
+    def write(self, path: str):
+        with open(path, "w") as f:
+            json.dump(self.to_json(), f, indent=4)
+        print(f"Wrote upload report to {path}")
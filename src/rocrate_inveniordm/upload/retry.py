@@ -0,0 +1,125 @@
+"""
+    Retry policies for requests to the repository.
+
+    Repositories rate-limit bursts of requests (429) and sometimes fail behind a
+    proxy (502, 503, 504). A RetryPolicy decides which of these failures are retried,
+    and how long to wait before each retry.
+"""
+
+from __future__ import annotations
+
+import email.utils
+import random
+import time
+from dataclasses import dataclass
+
+RETRY_STATUSES = frozenset({408, 429, 500, 502, 503, 504})
+
+# statuses which mean that the repository did not act on the request
+NOT_PROCESSED_STATUSES = frozenset({429, 503})
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    """
+    When to retry a failed request, and how long to wait before each retry.
+
+    The wait before retry n grows exponentially with "full jitter": it is a random
+    time between 0 and min(max_backoff, backoff_factor * 2 ** n), which spreads out
+    the retries of parallel uploads instead of repeating the burst that was
+    rate-limited. If the response has a Retry-After header, at least that long is
+    waited, up to max_retry_after.
+    """
+
+    max_retries: int = 5
+    backoff_factor: float = 0.5
+    max_backoff: float = 60.0
+    max_retry_after: float = 300.0
+    statuses: frozenset = RETRY_STATUSES
+    connection_errors: bool = True
+    jitter: bool = True
+
+    def should_retry(self, retries: int, status: int | None = None) -> bool:
+        """
+        :param retries: Number of times the request has been retried already
+        :param status: Status code of the response, or None if the request failed
+            with a connection error
+        """
+        if retries >= self.max_retries:
+            return False
+        if status is None:
+            return self.connection_errors
+        return status in self.statuses
+
+    def delay(self, retries: int, retry_after: str | None = None) -> float:
+        """
+        :param retries: Number of times the request has been retried already
+        :param retry_after: Value of the response's Retry-After header, if any
+        :return: Seconds to wait before the next retry
+        """
+        backoff = min(self.max_backoff, self.backoff_factor * 2**retries)
+        if self.jitter:
+            backoff = random.uniform(0, backoff)
+        wait = parse_retry_after(retry_after)
+        if wait is None:
+            return backoff
+        return max(backoff, min(wait, self.max_retry_after))
+
+
+NO_RETRY = RetryPolicy(max_retries=0)
+
+NOT_PROCESSED = RetryPolicy(statuses=NOT_PROCESSED_STATUSES, connection_errors=False)
+
+# Creating a draft or a new version, publishing, initializing or importing files,
+# or deleting a file twice is not safe: a repeated request which already succeeded
+# fails, e.g. with a duplicate key or 404. Those requests are only retried when the
+# repository has refused to process them. Policies of a single method of an
+# endpoint are keyed "METHOD endpoint".
+DEFAULT_RETRY_POLICIES = {
+    "records": NOT_PROCESSED,
+    "versions": NOT_PROCESSED,
+    "publish": NOT_PROCESSED,
+    "POST draft/files": NOT_PROCESSED,
+    "DELETE draft/files": NOT_PROCESSED,
+}
+
+
+def get_policy(
+    endpoint: str,
+    policies: dict | None = None,
+    default: RetryPolicy | None = None,
+    method: str | None = None,
+) -> RetryPolicy:
+    """
+    :param endpoint: Endpoint label of the request, e.g. "records" or "content"
+    :param policies: Policies by endpoint, or by "METHOD endpoint", which override
+        DEFAULT_RETRY_POLICIES
+    :param default: Policy for endpoints without their own policy. Defaults to
+        RetryPolicy()
+    :param method: HTTP method of the request. A policy for the method of the
+        endpoint is preferred to one for the whole endpoint
+    """
+    keys = [f"{method} {endpoint}", endpoint] if method else [endpoint]
+    for table in (policies or {}, DEFAULT_RETRY_POLICIES):
+        for key in keys:
+            if key in table:
+                return table[key]
+    return default or RetryPolicy()
+
+
+def parse_retry_after(value: str | None) -> float | None:
+    """
+    Parse a Retry-After header, which is either a number of seconds or an HTTP date.
+
+    :return: Seconds to wait, or None if the value is missing or invalid
+    """
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        date = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, date.timestamp() - time.time())
@@ -0,0 +1,81 @@
+"""
+    Orders the files of an upload by size, and estimates how long uploading them
+    takes.
+
+    A pool of workers which takes files in the order they are listed can pick up a
+    huge file last, and then spends most of the deposit uploading it alone. Starting
+    the largest files first lets the workers finish at about the same time, as in
+    LPT (longest processing time first) scheduling, and interleaving small files
+    between the large ones keeps connections busy with requests while large uploads
+    are limited by throughput.
+"""
+
+from __future__ import annotations
+
+import heapq
+from collections import deque
+from typing import Sequence
+
+
+def schedule(sizes: list[int], workers: int) -> list[int]:
+    """
+    :param sizes: Size of each file in bytes
+    :param workers: Number of files uploaded in parallel
+    :return: The indices of the files in the order they should start uploading:
+        the largest file for each worker first, then the remaining files
+        alternately from the largest and from the smallest
+    """
+    by_size = sorted(range(len(sizes)), key=lambda i: sizes[i], reverse=True)
+    order = by_size[:workers]
+    rest = deque(by_size[workers:])
+    while rest:
+        order.append(rest.popleft())
+        if rest:
+            order.append(rest.pop())
+    return order
+
+
+def fit_throughput(samples: list[tuple[int, float]]) -> tuple[float, float]:
+    """
+    Fits the time to upload a file as a fixed time per file plus its size divided
+    by the throughput of one connection, by least squares.
+
+    :param samples: Size in bytes and upload time in seconds of uploaded files
+    :return: The throughput of one connection in bytes per second, and the fixed
+        time per file in seconds
+    """
+    total_size = sum(size for size, _ in samples)
+    total_seconds = sum(seconds for _, seconds in samples)
+    n = len(samples)
+    mean_size, mean_seconds = total_size / n, total_seconds / n
+    variance = sum((size - mean_size) ** 2 for size, _ in samples)
+    covariance = sum(
+        (size - mean_size) * (seconds - mean_seconds) for size, seconds in samples
+    )
+    if variance > 0 and covariance > 0:
+        slope = covariance / variance
+        overhead = mean_seconds - slope * mean_size
+        if overhead >= 0:
+            return 1 / slope, overhead
+    # all files of similar size, or too few samples for a fit
+    if total_size == 0:
+        return float("inf"), mean_seconds
+    return total_size / total_seconds if total_seconds else float("inf"), 0.0
+
+
+def makespan(
+    durations: Sequence[float], workers: int, busy: Sequence[float] = ()
+) -> float:
+    """
+    Simulates workers which each take the next file when they are done.
+
+    :param durations: Upload time of each file, in the order they start
+    :param workers: Number of files uploaded in parallel
+    :param busy: Remaining time of the files which are already uploading
+    :return: Seconds until all files are uploaded
+    """
+    free_at = list(busy) + [0.0] * max(0, workers - len(busy))
+    heapq.heapify(free_at)
+    for duration in durations:
+        heapq.heappush(free_at, heapq.heappop(free_at) + duration)
+    return max(free_at, default=0.0)
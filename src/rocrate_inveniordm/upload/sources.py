@@ -0,0 +1,95 @@
+"""
+    Accesses the files of a record. A file is either the path of a local file, or
+    a file generated while it is uploaded, such as a zipstream.ZipStream, which has
+    a key, a size and an open() method returning a binary reader. The size of a
+    generated file may be None if it is only known once the file is generated; it
+    then has an estimated_size.
+
+    The sizes and modification times of local files can be passed along as a
+    mapping of FileStat by path, e.g. those of the walk which listed them, so that
+    the steps of a deposit do not stat each file again.
+"""
+
+from __future__ import annotations
+
+import os
+from typing import Mapping, NamedTuple
+
+READ_SIZE = 1024 * 1024
+
+
+class FileStat(NamedTuple):
+    """What is kept of a local file's stat result."""
+
+    size: int
+    mtime_ns: int
+
+
+def file_stat(path, stats: Mapping[str, FileStat] | None = None) -> FileStat:
+    """
+    :param path: Path of a local file
+    :param stats: FileStat by path to look the file up in before it is stat'ed
+    """
+    known = stats.get(os.fspath(path)) if stats else None
+    if known is not None:
+        return known
+    result = os.stat(path)
+    return FileStat(result.st_size, result.st_mtime_ns)
+
+
+def is_path(file) -> bool:
+    """Whether the file is the path of a local file."""
+    return isinstance(file, (str, os.PathLike))
+
+
+def key(file) -> str:
+    """:return: The file's name in the record"""
+    if is_path(file):
+        return os.path.basename(file)
+    return file.key
+
+
+def size(file, stats: Mapping[str, FileStat] | None = None) -> int:
+    """
+    :param stats: FileStat of local files by path, see file_stat()
+    :return: The file's size in bytes, or an estimate if it is not known
+    """
+    if is_path(file):
+        return file_stat(file, stats).size
+    return file.size if file.size is not None else file.estimated_size
+
+
+def exact_size(file, stats: Mapping[str, FileStat] | None = None) -> int | None:
+    """
+    :param stats: FileStat of local files by path, see file_stat()
+    :return: The file's size in bytes, or None if it is not known before the file
+        is generated
+    """
+    if is_path(file):
+        return file_stat(file, stats).size
+    return file.size
+
+
+def open_source(file):
+    """:return: A binary reader of the file's content, to be used with "with"."""
+    if is_path(file):
+        return open(file, "rb")
+    return file.open()
+
+
+class ChunkedBody:
+    """
+    A request body whose length is not known before it is read. It has neither a
+    length nor tell(), so requests sends it with chunked transfer encoding, but it
+    can be rewound with seek(0) to send it again.
+    """
+
+    def __init__(self, reader):
+        """:param reader: A binary reader of the body, which can seek to its start"""
+        self._reader = reader
+
+    def __iter__(self):
+        return iter(lambda: self._reader.read(READ_SIZE), b"")
+
+    def seek(self, offset: int, whence: int = 0) -> int:
+        return self._reader.seek(offset, whence)
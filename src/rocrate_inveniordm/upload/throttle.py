@@ -0,0 +1,80 @@
+"""
+    Limits the bandwidth used by uploads, so that a deposit does not starve other
+    traffic on a shared uplink.
+
+    A TokenBucket is shared by all the threads of a client, so the limit applies to
+    the total throughput of the files and parts uploaded in parallel. Clients given
+    the same rate share the process's bucket for it, see shared_bucket(), so that
+    concurrent deposits stay within one limit.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+
+
+class TokenBucket:
+    """
+    A token bucket which holds up to capacity bytes and is refilled at rate bytes
+    per second.
+
+    Sending more bytes than the bucket holds puts it into debt, and the sender
+    waits until the debt is paid back. This lets chunks larger than the bucket
+    through, and makes concurrent senders wait their turn instead of polling.
+    """
+
+    def __init__(
+        self, rate: float, capacity: float | None = None, clock=time.monotonic
+    ):
+        """
+        :param rate: Bytes per second
+        :param capacity: Size of a burst in bytes which may be sent at full speed.
+            Defaults to the bytes of a quarter of a second
+        :param clock: Returns the current time in seconds
+        """
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate / 4
+        self._clock = clock
+        self._tokens = self.capacity
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def reserve(self, count: int) -> float:
+        """
+        Takes count bytes from the bucket.
+
+        :return: Seconds to wait before sending them
+        """
+        with self._lock:
+            now = self._clock()
+            elapsed = now - self._updated
+            self._tokens = min(self.capacity, self._tokens + elapsed * self.rate)
+            self._updated = now
+            self._tokens -= count
+            return max(0.0, -self._tokens / self.rate)
+
+    def consume(self, count: int):
+        """Takes count bytes from the bucket, and waits until they may be sent."""
+        wait = self.reserve(count)
+        if wait > 0:
+            time.sleep(wait)
+
+
+_shared: dict[float, TokenBucket] = {}
+_shared_lock = threading.Lock()
+
+
+def shared_bucket(rate: float) -> TokenBucket:
+    """
+    :param rate: Bytes per second
+    :return: The process's bucket for the rate, which all uploads limited to that
+        rate share
+    """
+    with _shared_lock:
+        bucket = _shared.get(rate)
+        if bucket is None:
+            bucket = _shared[rate] = TokenBucket(rate)
+        return bucket
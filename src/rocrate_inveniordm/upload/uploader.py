@@ -6,12 +6,47 @@
     :author: Milan Szente
 """
 
+from __future__ import annotations
+
 import json
 import os
-import sys
+import threading
+import time
+from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from dataclasses import dataclass, field
 
 import requests
+import rocrate_inveniordm.metrics as metrics
+import rocrate_inveniordm.tracing as tracing
+import rocrate_inveniordm.upload.checksum as checksum
+import rocrate_inveniordm.upload.concurrency as concurrency_control
 import rocrate_inveniordm.upload.credentials as credentials
+import rocrate_inveniordm.upload.multipart as multipart
+import rocrate_inveniordm.upload.progress as progress
+import rocrate_inveniordm.upload.retry as retry
+import rocrate_inveniordm.upload.scheduling as scheduling
+import rocrate_inveniordm.upload.sources as sources
+import rocrate_inveniordm.upload.throttle as throttle
+from rocrate_inveniordm.exceptions import (
+    ChecksumMismatchError,
+    FilesUploadError,
+    RepositoryError,
+    UploadError,
+)
+
+
+@dataclass
+class FileUploadResult:
+    """Outcome of uploading one file of a record."""
+
+    file: str
+    status: str = "cancelled"  # "uploaded", "failed" or "cancelled"
+    size: int = 0
+    seconds: float = 0.0
+    error: str | None = None
+    retries: int = 0
+    checksums: dict = field(default_factory=dict)  # computed while uploading
 
 
 def get_headers(content_type: str):
@@ -23,139 +58,1110 @@ def get_headers(content_type: str):
     return headers
 
 
-def deposit(metadata, files, publish=False):
+def check_status(status, body, expected, message, endpoint):
     """
-    Entry point.
-    Uploads and publishes a record to the repository.
+    Raises an exception if a response from the repository has an unexpected status.
 
-    :param metadata: The record's DataCite metadata.
-    :param files: The record's files.
-    :param publish: Whether to publish the record after uploading.
+    :param status: The response's status code.
+    :param body: The response's body.
+    :param expected: The status code of a successful response.
+    :param message: Describes the failure, e.g. "Could not create record".
+    :param endpoint: Endpoint label of the request, e.g. "records" or "content".
+    :raises RepositoryError: If status is not the expected status code.
     """
-    record_id = upload(metadata, files)
-    if publish:
-        publish_record(record_id)
-    return record_id
+    if status != expected:
+        raise RepositoryError.from_response(message, endpoint, status, body)
 
 
-def create_draft_record(metadata):
-    """
-    Creates a draft record in the repository.
-    Exits the program if the request fails.
+DEFAULT_POOL_SIZE = 10
+DEFAULT_INIT_BATCH_SIZE = 1000
+# seconds to wait for a connection, and for the repository to respond: a commit of a
+# large file can take minutes while the repository computes its checksum
+DEFAULT_TIMEOUT = (10.0, 300.0)
 
-    :param metadata: The record's metadata.
-    :param files: The record's files.
-    :returns: The record's id.
-    """
-    api_url = credentials.get_repository_base_url()
-    resp = requests.post(
-        f"{api_url}/api/records",
-        data=json.dumps(metadata),
-        headers=get_headers("application/json"),
-    )
 
-    if resp.status_code != 201:
-        print(f"Could not create record: {resp.status_code} {resp.text}")
-        sys.exit(1)
-    return resp.json().get("id")
+def batched(items, size):
+    """Splits a list into consecutive lists of at most size items."""
+    batches = []
+    for start in range(0, len(items), size):
+        end = start + size
+        batches.append(items[start:end])
+    return batches
 
 
-def start_draft_files_upload(record_id, files):
+class InvenioRDMClient:
     """
-    Starts the draft file upload.
-    This function does NOT upload any files, but initializes the upload process.
-    Exits the program if the request fails.
+    Client for the records API of one InvenioRDM repository.
+
+    Holds the repository's base URL and API token, and a requests.Session which
+    keeps connections alive and pools them, so that consecutive requests, and
+    consecutive deposits, reuse warm connections instead of opening a new TCP and
+    TLS connection for each request. The session is shared by the threads of
+    upload_files.
+
+    Requests which fail with a connection error or a status such as 429 or 503 are
+    retried according to the client's retry policies. The body of a retried file
+    upload is streamed again from the file.
+
+    The progress of uploads is reported to the client's observers, see
+    progress.UploadObserver. If the client has a bandwidth limit, the file contents
+    sent by all its threads together are throttled to it.
 
-    :param record_id: The record's id.
-    :param files: The files to be uploaded.
+    A client can be used as a context manager, which closes its connections on
+    exit.
     """
-    payload = []
-    for file in files:
-        _, filename = os.path.split(file)
-        payload.append({"key": filename})
-
-    api_url = credentials.get_repository_base_url()
-    resp = requests.post(
-        f"{api_url}/api/records/{record_id}/draft/files",
-        data=json.dumps(payload),
-        headers=get_headers("application/json"),
-    )
-    if resp.status_code != 201:
-        print(f"Could not initiate file upload: {resp.status_code} {resp.text}")
-        sys.exit(1)
-    return
 
+    def __init__(
+        self,
+        base_url,
+        api_key,
+        pool_size=DEFAULT_POOL_SIZE,
+        keep_alive=True,
+        retry_policy=None,
+        retry_policies=None,
+        part_size=None,
+        part_concurrency=4,
+        checksum_algorithms=("md5",),
+        checksum_retries=1,
+        init_batch_size=DEFAULT_INIT_BATCH_SIZE,
+        observers=(),
+        max_bandwidth=None,
+        max_concurrency=None,
+        inventory=None,
+        timeout=DEFAULT_TIMEOUT,
+        file_stats=None,
+    ):
+        """
+        :param base_url: The repository's base URL, e.g. "https://sandbox.zenodo.org".
+        :param api_key: The API token to authenticate with.
+        :param pool_size: Maximum number of connections kept open to the
+            repository. Should be at least the number of files uploaded in parallel.
+        :param keep_alive: Whether to reuse connections between requests.
+        :param retry_policy: The RetryPolicy for requests to endpoints without their
+            own policy. Defaults to RetryPolicy().
+        :param retry_policies: RetryPolicy by endpoint label, e.g. "content", or by
+            "METHOD endpoint", e.g. "POST draft/files", which overrides
+            retry.DEFAULT_RETRY_POLICIES.
+        :param part_size: If set, files larger than this many bytes are uploaded with
+            InvenioRDM's multipart transfer, in parts of this size. Requires
+            InvenioRDM 13 or later. Defaults to None, which uploads every file with
+            a single request.
+        :param part_concurrency: Number of parts of a file to upload in parallel.
+        :param checksum_algorithms: hashlib algorithms to compute while uploading
+            each file. md5 is compared with the checksum returned by the repository.
+        :param checksum_retries: How often to upload a file again if its checksum
+            does not match the repository's.
+        :param init_batch_size: Maximum number of files initialized per request.
+        :param observers: UploadObservers to report the progress of uploads to.
+        :param max_bandwidth: Maximum bytes per second to send file contents at,
+            in total with the other clients of the process given the same rate, or
+            a throttle.TokenBucket. Defaults to None, which does not limit the
+            bandwidth.
+        :param max_concurrency: If set, the number of files uploaded in parallel is
+            adapted to the repository's responses, from the requested concurrency
+            up to this many. See concurrency.AdaptiveLimit.
+        :param inventory: An Inventory of the local files. Their checksums are
+            compared with the repository's for files uploaded in parts, and used
+            to find unchanged files of a new version without reading them.
+        :param timeout: Seconds to wait for a connection and for each read from the
+            repository, as a (connect, read) tuple or a single number for both. A
+            request which times out is retried like one which failed to connect.
+        :param file_stats: sources.FileStat of the local files by path, e.g. from
+            the walk which listed them, so that their sizes are not looked up again.
+            Files without one are stat'ed.
+        """
+        self.base_url = base_url.rstrip("/")
+        self.api_key = api_key
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=1, pool_maxsize=max(1, pool_size)
+        )
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        if not keep_alive:
+            self.session.headers["Connection"] = "close"
+        self.retry_policy = retry_policy
+        self.retry_policies = retry_policies or {}
+        if part_size is not None and part_size < multipart.MIN_PART_SIZE:
+            raise ValueError(
+                f"part_size must be at least {multipart.MIN_PART_SIZE} bytes"
+            )
+        self.part_size = part_size
+        self.part_concurrency = part_concurrency
+        self.checksum_algorithms = checksum_algorithms
+        self.checksum_retries = checksum_retries
+        self.init_batch_size = max(1, init_batch_size)
+        self.observers = list(observers)
+        if max_bandwidth is None or isinstance(max_bandwidth, throttle.TokenBucket):
+            self.bandwidth = max_bandwidth
+        else:
+            self.bandwidth = throttle.shared_bucket(max_bandwidth)
+        self.max_concurrency = max_concurrency
+        self.inventory = inventory
+        self.timeout = timeout
+        self.file_stats = file_stats
+        self._limits: set[concurrency_control.AdaptiveLimit] = set()
+
+    @classmethod
+    def from_environment(cls, **kwargs):
+        """
+        Creates a client for the repository configured by the INVENIORDM_BASE_URL and
+        INVENIORDM_API_KEY environment variables.
+
+        :param kwargs: Passed on to InvenioRDMClient.
+        """
+        return cls(
+            credentials.get_repository_base_url(), credentials.get_api_key(), **kwargs
+        )
+
+    def close(self):
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def size(self, file):
+        """:return: The size of a file, see sources.size"""
+        return sources.size(file, self.file_stats)
+
+    def notify(self, event, *args):
+        """Calls the hook named event of each observer with args."""
+        for observer in self.observers:
+            getattr(observer, event)(*args)
+
+    @contextmanager
+    def phase(self, name, file=None):
+        """Reports the time the enclosed block takes to the observers."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.notify("phase_finished", name, time.perf_counter() - start, file)
+
+    def track(self, body, file_path):
+        """
+        Wraps a request body so that the bytes sent from it are throttled to the
+        bandwidth limit and reported to the observers. Returns the body itself if
+        there is neither.
+        """
+        if not self.observers and self.bandwidth is None:
+            return body
+
+        def sent(count):
+            if count > 0 and self.bandwidth is not None:
+                self.bandwidth.consume(count)
+            self.notify("bytes_sent", file_path, count)
+
+        return progress.ProgressReader(body, sent)
+
+    def get_headers(self, content_type: str):
+        return {
+            "Accept": "application/json",
+            "Content-Type": content_type,
+            "Authorization": f"Bearer {self.api_key}",
+        }
+
+    def send_request(self, method, path, name, endpoint, trace_args=None, **kwargs):
+        """
+        Sends a request to the repository, recording it in the trace and metrics.
+        Retries the request according to the endpoint's retry policy. The number of
+        retries is stored in the response's `retries` attribute.
+
+        :param method: The HTTP method.
+        :param path: The path to send the request to, relative to the base URL, or
+            an absolute URL.
+        :param name: Name of the request in the trace.
+        :param endpoint: Endpoint label for metrics, e.g. "records" or "content".
+        :param trace_args: Extra details to attach to the trace event.
+        :param kwargs: Passed on to requests.Session.request. The timeout defaults to
+            the client's timeout.
+        :returns: The response.
+        :raises UploadError: If the request still fails with a connection error or
+            timeout after the last retry.
+        """
+        url = path if "://" in path else f"{self.base_url}{path}"
+        kwargs.setdefault("timeout", self.timeout)
+        policy = retry.get_policy(
+            endpoint, self.retry_policies, self.retry_policy, method
+        )
+        body = kwargs.get("data")
+        offset = None
+        if hasattr(body, "seek"):
+            # a sources.ChunkedBody has no tell(), and is sent from its start
+            offset = body.tell() if hasattr(body, "tell") else 0
+        retries = 0
+        while True:
+            if offset is not None:
+                body.seek(offset)  # re-stream the file from the start
+            args = dict(trace_args or {}, retry=retries) if retries else trace_args
+            try:
+                resp = self._send_once(method, url, name, endpoint, args, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if not policy.should_retry(retries):
+                    raise UploadError(f"Request to {url} failed: {e}") from e
+                delay = policy.delay(retries)
+            else:
+                if resp.status_code in retry.NOT_PROCESSED_STATUSES:
+                    for limit in list(self._limits):
+                        limit.throttled()
+                if not policy.should_retry(retries, resp.status_code):
+                    resp.retries = retries
+                    return resp
+                delay = policy.delay(retries, resp.headers.get("Retry-After"))
+            retries += 1
+            metrics.RETRIES.labels(endpoint).inc()
+            time.sleep(delay)
+
+    def _send_once(self, method, url, name, endpoint, trace_args, **kwargs):
+        with tracing.span(name, cat="upload", **(trace_args or {})) as args:
+            with metrics.REQUEST_SECONDS.labels(endpoint).time():
+                resp = self.session.request(method, url, **kwargs)
+            args["status"] = resp.status_code
+        metrics.RESPONSES.labels(endpoint, str(resp.status_code)).inc()
+        return resp
+
+    def deposit(
+        self,
+        metadata,
+        files,
+        publish=False,
+        concurrency=1,
+        journal=None,
+        new_version_of=None,
+    ):
+        """
+        Uploads and publishes a record to the repository.
+
+        :param metadata: The record's DataCite metadata.
+        :param files: The record's files.
+        :param publish: Whether to publish the record after uploading.
+        :param concurrency: Number of files to upload in parallel.
+        :param journal: A Journal to record the progress in. If it was loaded from an
+            earlier deposit, that deposit is resumed.
+        :param new_version_of: The id of a published record to deposit a new version
+            of, reusing its unchanged files.
+        :returns: The record's id.
+        """
+        if journal is not None and journal.published:
+            # a published record has no draft to resume
+            print(f"Record {journal.record_id} was already published.")
+            return journal.record_id
+        record_id = self.upload(metadata, files, concurrency, journal, new_version_of)
+        if publish:
+            with self.phase("publish"):
+                self.publish_record(record_id)
+            if journal is not None:
+                journal.record_published()
+        return record_id
+
+    def create_draft_record(self, metadata):
+        """
+        Creates a draft record in the repository.
+        Raises a RepositoryError if the request fails.
+
+        :param metadata: The record's metadata.
+        :returns: The record's id.
+        """
+        resp = self.send_request(
+            "POST",
+            "/api/records",
+            "create_draft_record",
+            "records",
+            data=json.dumps(metadata),
+            headers=self.get_headers("application/json"),
+        )
+
+        check_status(
+            resp.status_code, resp.text, 201, "Could not create record", "records"
+        )
+        return resp.json().get("id")
+
+    def is_multipart(self, size):
+        """Whether a file of the given size is uploaded with multipart transfer."""
+        return self.part_size is not None and size > self.part_size
+
+    def start_draft_files_upload(self, record_id, files):
+        """
+        Starts the draft file upload.
+        This function does NOT upload any files, but initializes the upload process.
+        Files uploaded with multipart transfer are initialized with their size and
+        number of parts.
+        Raises a RepositoryError if the request fails.
+
+        :param record_id: The record's id.
+        :param files: The files to be uploaded.
+        """
+        payload = []
+        for file in files:
+            entry = {"key": sources.key(file)}
+            size = self.size(file)
+            if sources.is_path(file) and self.is_multipart(size):
+                entry["size"] = size
+                entry["transfer"] = multipart.transfer(size, self.part_size)
+            payload.append(entry)
+
+        resp = self.send_request(
+            "POST",
+            f"/api/records/{record_id}/draft/files",
+            "start_draft_files_upload",
+            "draft/files",
+            trace_args={"files": len(payload)},
+            data=json.dumps(payload),
+            headers=self.get_headers("application/json"),
+        )
+        check_status(
+            resp.status_code,
+            resp.text,
+            201,
+            "Could not initiate file upload",
+            "draft/files",
+        )
+        return
+
+    def upload_file(self, record_id, file_path, journal=None):
+        """
+        Uploads a file to the record.
+        The file's checksums are computed while its content is sent, and the md5
+        checksum is compared with the one the repository returns on commit. If they
+        differ, the file is deleted from the draft and uploaded again, up to
+        checksum_retries times. Checksums are not computed for files uploaded in
+        parts, which are sent out of order; those are compared with the checksums
+        of the client's inventory, if it has one.
+        Raises a RepositoryError if a request fails, or a ChecksumMismatchError if
+        the checksums still differ after the last retry.
+
+        :param record_id: The record's id.
+        :param file_path: The path of the file to upload, or a generated file such
+            as a zipstream.ZipStream, which is never uploaded in parts.
+        :param journal: A Journal to record the committed file in.
+        :returns: A tuple of the number of times requests for the file were retried,
+            and the file's checksums by algorithm.
+        """
+        file_name = sources.key(file_path)
+        print(file_name)
+
+        retries = 0
+        attempt = 0
+        while True:
+            n, digests, server_checksum = self.upload_and_commit(record_id, file_path)
+            retries += n
+            if checksum.matches(server_checksum, digests):
+                break
+            metrics.CHECKSUM_MISMATCHES.inc()
+            if attempt >= self.checksum_retries:
+                raise ChecksumMismatchError(file_name, server_checksum, digests)
+            print(f"Checksum mismatch for {file_name}, uploading it again")
+            attempt += 1
+            self.delete_draft_file(record_id, file_name)
+            self.start_draft_files_upload(record_id, [file_path])
+
+        if journal is not None:
+            journal.record_committed(file_name, server_checksum, digests)
+        return retries, digests
+
+    def upload_and_commit(self, record_id, file_path):
+        """
+        Uploads the content of a file and commits it.
+        Raises a RepositoryError if a request fails.
+
+        :param record_id: The record's id.
+        :param file_path: The path of the file to upload.
+        :returns: A tuple of the number of times requests were retried, the
+            checksums computed while uploading, and the checksum returned by the
+            repository.
+        """
+        file_name = sources.key(file_path)
+
+        # Upload file content; generated files are always sent in one request
+        in_parts = sources.is_path(file_path) and self.is_multipart(
+            self.size(file_path)
+        )
+        if in_parts:
+            with self.phase("parts", file_path):
+                retries = self.upload_parts(record_id, file_path)
+            # parts are sent out of order, so only the inventory has checksums
+            digests = self.inventory.digests(file_path) if self.inventory else {}
+        else:
+            with self.phase("content", file_path):
+                retries, digests = self.upload_content(record_id, file_path)
+
+        # Complete draft file upload
+        with self.phase("commit", file_path):
+            resp = self.send_request(
+                "POST",
+                f"/api/records/{record_id}/draft/files/{file_name}/commit",
+                "upload_file commit",
+                "commit",
+                trace_args={"file": file_name},
+                headers=self.get_headers("application/json"),
+            )
+        check_status(
+            resp.status_code, resp.text, 200, "Could not commit file upload", "commit"
+        )
+        return retries + resp.retries, digests, resp.json().get("checksum")
+
+    def upload_content(self, record_id, file_path):
+        """
+        Uploads the content of a file with a single request, computing its
+        checksums while it is sent. A generated file whose size is not known is
+        sent with chunked transfer encoding.
+        Raises a RepositoryError if the request fails.
+
+        :param record_id: The record's id.
+        :param file_path: The path of the file to upload.
+        :returns: A tuple of the number of times the request was retried, and the
+            file's checksums by algorithm.
+        """
+        file_name = sources.key(file_path)
+        with sources.open_source(file_path) as f:
+            reader = checksum.HashingReader(f, self.checksum_algorithms)
+            body = self.track(reader, file_path)
+            size = sources.exact_size(file_path, self.file_stats)
+            if size is None:
+                body = sources.ChunkedBody(body)
+            resp = self.send_request(
+                "PUT",
+                f"/api/records/{record_id}/draft/files/{file_name}/content",
+                "upload_file content",
+                "content",
+                trace_args={"file": file_name},
+                data=body,
+                headers=self.get_headers("application/octet-stream"),
+            )
+            if size is None:
+                size = reader.tell()  # all of it was sent
+
+        check_status(
+            resp.status_code, resp.text, 200, "Could not upload file content", "content"
+        )
+        metrics.UPLOADED_BYTES.inc(size)
+        return resp.retries, reader.hexdigests()
+
+    def upload_parts(self, record_id, file_path):
+        """
+        Uploads the content of a file initialized for multipart transfer, with up to
+        part_concurrency parts in parallel. Each part is retried on its own. Fails
+        fast: after the first failed part, parts which have not started are
+        cancelled.
+        Raises a RepositoryError if a request fails.
+
+        :param record_id: The record's id.
+        :param file_path: The path of the file to upload.
+        :returns: The number of times requests for the parts were retried.
+        """
+        _, file_name = os.path.split(file_path)
+        resp = self.send_request(
+            "GET",
+            f"/api/records/{record_id}/draft/files/{file_name}",
+            "get_draft_file",
+            "draft/files",
+            trace_args={"file": file_name},
+            headers=self.get_headers("application/json"),
+        )
+        check_status(
+            resp.status_code, resp.text, 200, "Could not get part links", "draft/files"
+        )
+        links = resp.json().get("links", {}).get("parts", [])
+        if not links:
+            raise UploadError(f"The repository returned no part links for {file_name}")
+        retries = resp.retries
+
+        with ThreadPoolExecutor(
+            max_workers=max(1, self.part_concurrency), thread_name_prefix="part"
+        ) as executor:
+            futures = [
+                executor.submit(self.upload_part, file_path, link) for link in links
+            ]
+            done, not_done = wait(futures, return_when=FIRST_EXCEPTION)
+            for future in not_done:
+                future.cancel()
+        for future in futures:
+            if future in done:
+                retries += future.result()  # raises if the part failed
+        return retries
+
+    def upload_part(self, file_path, link):
+        """
+        Uploads one part of a file.
+        Raises a RepositoryError if the request fails.
+
+        :param file_path: The path of the file.
+        :param link: The part's entry in the "parts" links of the draft file, with
+            the part's number and the URL to upload it to.
+        :returns: The number of times the request was retried.
+        """
+        _, file_name = os.path.split(file_path)
+        number = link["part"]
+        offset = (number - 1) * self.part_size
+        length = min(self.part_size, self.size(file_path) - offset)
+        if link["url"].startswith(self.base_url):
+            headers = self.get_headers("application/octet-stream")
+        else:
+            # e.g. a pre-signed URL of S3 storage, which must not get the API token
+            headers = {"Content-Type": "application/octet-stream"}
+
+        with multipart.FilePart(file_path, offset, length) as part:
+            resp = self.send_request(
+                "PUT",
+                link["url"],
+                "upload_file part",
+                "part",
+                trace_args={"file": file_name, "part": number},
+                data=self.track(part, file_path),
+                headers=headers,
+            )
+        check_status(
+            resp.status_code,
+            resp.text,
+            200,
+            f"Could not upload part {number} of {file_name}",
+            "part",
+        )
+        metrics.UPLOADED_BYTES.inc(length)
+        return resp.retries
+
+    def upload(self, metadata, files, concurrency=1, journal=None, new_version_of=None):
+        """
+        Uploads a draft record to the repository.
+        Raises a RepositoryError if a request fails, or a FilesUploadError if any
+        file could not be uploaded.
+
+        :param metadata: The record's metadata.
+        :param files: The record's files.
+        :param concurrency: Number of files to upload in parallel.
+        :param journal: A Journal to record the progress in. If it already holds a
+            draft record, that draft is reused and only the files which it does not
+            have yet are uploaded.
+        :param new_version_of: The id of a published record. If set, the draft is
+            created as a new version of that record, and only files which are new
+            or changed since that version are uploaded.
+        :returns: The draft record's id.
+        """
+        metrics.RECORD_FILES.observe(len(files))
+        if journal is not None and journal.record_id is not None:
+            record_id = journal.record_id
+            with self.phase("resume"):
+                files, uninitialized = self.resume_draft(record_id, files, journal)
+        else:
+            with self.phase("create_draft"):
+                if new_version_of is not None:
+                    record_id = self.create_new_version(new_version_of, metadata)
+                else:
+                    record_id = self.create_draft_record(metadata)
+            if journal is not None:
+                journal.start(self.base_url, record_id)
+            if new_version_of is not None:
+                with self.phase("sync"):
+                    files = self.sync_draft_files(record_id, files)
+            uninitialized = files
+
+        print(f"Uploading {len(files)} files with {concurrency} workers...")
+        sizes = [self.size(file) for file in files]
+        self.notify("upload_started", files, sum(sizes), sizes)
+        with self.phase("upload"):
+            results = self.upload_files(
+                record_id, files, concurrency, journal, uninitialized=uninitialized
+            )
+        self.notify("upload_finished", results)
+        print_upload_summary(results)
+        if any(result.status != "uploaded" for result in results):
+            raise FilesUploadError(record_id, results)
+
+        print(f"All {len(files)} files uploaded.")
+        return record_id
+
+    def create_new_version(self, record_id, metadata):
+        """
+        Creates a draft of a new version of a published record, sets its metadata,
+        and imports the files of the previous version into it.
+        Raises a RepositoryError if a request fails.
+
+        :param record_id: The id of a published version of the record.
+        :param metadata: The new version's metadata.
+        :returns: The new version's draft id.
+        """
+        resp = self.send_request(
+            "POST",
+            f"/api/records/{record_id}/versions",
+            "create_new_version",
+            "versions",
+            headers=self.get_headers("application/json"),
+        )
+        check_status(
+            resp.status_code, resp.text, 201, "Could not create new version", "versions"
+        )
+        draft_id = resp.json().get("id")
+        print(f"Created draft {draft_id} for a new version of record {record_id}")
+
+        resp = self.send_request(
+            "PUT",
+            f"/api/records/{draft_id}/draft",
+            "update_draft",
+            "draft",
+            data=json.dumps(metadata),
+            headers=self.get_headers("application/json"),
+        )
+        check_status(
+            resp.status_code, resp.text, 200, "Could not update draft metadata", "draft"
+        )
+
+        resp = self.send_request(
+            "POST",
+            f"/api/records/{draft_id}/draft/actions/files-import",
+            "import_files",
+            "draft/files",
+            headers=self.get_headers("application/json"),
+        )
+        check_status(
+            resp.status_code,
+            resp.text,
+            201,
+            "Could not import files of the previous version",
+            "draft/files",
+        )
+        return draft_id
+
+    def sync_draft_files(self, record_id, files):
+        """
+        Compares the files of a draft with the local files, by size and md5
+        checksum. Deletes files from the draft which are not among the local files,
+        or which have changed.
+
+        :param record_id: The draft record's id.
+        :param files: The local files.
+        :returns: The files which are not in the draft, or have changed.
+        """
+        entries = {entry["key"]: entry for entry in self.list_draft_files(record_id)}
+        local = {sources.key(file): file for file in files}
+
+        for key in entries.keys() - local.keys():
+            print(f"Removing {key}, which is not in the crate")
+            self.delete_draft_file(record_id, key)
+
+        changed = []
+        for key, file in local.items():
+            entry = entries.get(key)
+            if entry is not None and not is_unchanged(
+                entry, file, self.inventory, self.file_stats
+            ):
+                self.delete_draft_file(record_id, key)
+                entry = None
+            if entry is None:
+                changed.append(file)
+        print(f"{len(files) - len(changed)} of {len(files)} files are unchanged.")
+        return changed
+
+    def resume_draft(self, record_id, files, journal):
+        """
+        Prepares to resume uploading files to an existing draft record. Asks the
+        repository which files the draft has. Files which have changed since they
+        were committed, by size or by the checksum reported by the repository or
+        recorded in the journal, are deleted from the draft and uploaded again.
+
+        :param record_id: The draft record's id.
+        :param files: The record's files.
+        :param journal: The Journal of the earlier deposit.
+        :returns: A tuple of the files which still have to be uploaded, and those of
+            them which are not in the draft yet and have to be initialized.
+        :raises UploadError: If the journal is for a different repository.
+        """
+        if journal.base_url != self.base_url:
+            raise UploadError(
+                f"The journal {journal.path} is for a deposit to {journal.base_url}, "
+                f"not {self.base_url}"
+            )
+        print(f"Resuming upload to draft record {record_id}")
+        entries = {entry["key"]: entry for entry in self.list_draft_files(record_id)}
+
+        pending, missing = [], []
+        for file in files:
+            key = sources.key(file)
+            entry = entries.get(key)
+            if entry is not None and self.changed_since_commit(
+                entry, file, journal.committed.get(key)
+            ):
+                self.delete_draft_file(record_id, key)
+                entry = None
+            if entry is None:
+                missing.append(file)
+            if entry is None or entry.get("status") != "completed":
+                pending.append(file)
+
+        print(f"{len(files) - len(pending)} of {len(files)} files already uploaded.")
+        return pending, missing
+
+    def changed_since_commit(self, entry, file, journal_checksum=None):
+        """
+        Whether a local file differs from a file of a draft. The checksum of a
+        committed file is taken from the client's inventory if it has the file, and
+        computed otherwise.
+
+        :param entry: The draft's file entry.
+        :param file: The local file.
+        :param journal_checksum: The checksum recorded in the journal when the file
+            was committed, used if the entry has none.
+        """
+        size = self.size(file)
+        if entry.get("size") not in (None, size):
+            return True
+        server_checksum = entry.get("checksum") or journal_checksum
+        if entry.get("status") != "completed" or not server_checksum:
+            return False
+        entry = dict(entry, size=size, checksum=server_checksum)
+        return not is_unchanged(entry, file, self.inventory, self.file_stats)
+
+    def list_draft_files(self, record_id):
+        """
+        Lists the files of a draft record, including ones which are not committed.
+        Raises a RepositoryError if the request fails.
+
+        :param record_id: The draft record's id.
+        :returns: The file entries, each with at least a "key" and a "status", which
+            is "completed" for committed files.
+        """
+        resp = self.send_request(
+            "GET",
+            f"/api/records/{record_id}/draft/files",
+            "list_draft_files",
+            "draft/files",
+            headers=self.get_headers("application/json"),
+        )
+        check_status(
+            resp.status_code,
+            resp.text,
+            200,
+            "Could not list draft files",
+            "draft/files",
+        )
+        return resp.json().get("entries", [])
+
+    def delete_draft_file(self, record_id, key):
+        """
+        Deletes a file from a draft record.
+        Raises a RepositoryError if the request fails.
+
+        :param record_id: The draft record's id.
+        :param key: The file's key.
+        """
+        resp = self.send_request(
+            "DELETE",
+            f"/api/records/{record_id}/draft/files/{key}",
+            "delete_draft_file",
+            "draft/files",
+            trace_args={"file": key},
+            headers=self.get_headers("application/json"),
+        )
+        check_status(
+            resp.status_code,
+            resp.text,
+            204,
+            "Could not delete draft file",
+            "draft/files",
+        )
+
+    def upload_files(
+        self, record_id, files, concurrency=1, journal=None, uninitialized=()
+    ):
+        """
+        Uploads and commits files to the record using a pool of worker threads.
+        Files which are not initialized yet are initialized in batches of
+        init_batch_size, each just before its files are queued for upload, so that
+        the files of one batch are uploaded while the next batch is initialized.
+        If the client has a max_concurrency, the number of files uploaded in
+        parallel starts at concurrency and is adapted to the repository's responses.
+        Files start in the order of scheduling.schedule(): largest first, with small
+        files interleaved.
+        Fails fast: after the first failure, no further batches are initialized,
+        files that have not started uploading are cancelled, and files that are
+        already uploading are allowed to finish.
+        Raises a RepositoryError if initializing a batch fails.
+
+        :param record_id: The record's id.
+        :param files: The paths of the files to upload.
+        :param concurrency: Number of files to upload in parallel, or to start with
+            if the concurrency is adapted.
+        :param journal: A Journal to record the initialized and committed files in.
+        :param uninitialized: The files which have to be initialized before they
+            are uploaded.
+        :returns: A list of FileUploadResult, in the same order as files.
+        """
+        results = [FileUploadResult(file, size=self.size(file)) for file in files]
+        uninitialized = set(uninitialized)
+        limit = self.concurrency_limit(concurrency)
+        sizes = [result.size for result in results]
+        order = [results[i] for i in scheduling.schedule(sizes, limit.limit)]
+        stopped = threading.Event()
+
+        def timed_upload(result):
+            with limit:
+                if stopped.is_set():
+                    return  # cancelled while waiting for its turn
+                self.notify("file_started", result.file, result.size)
+                start = time.perf_counter()
+                try:
+                    outcome = self.upload_file(record_id, result.file, journal)
+                    result.retries, result.checksums = outcome or (0, {})
+                except BaseException as e:
+                    stopped.set()
+                    result.status, result.error = "failed", repr(e)
+                    raise
+                else:
+                    result.status = "uploaded"
+                    result.size = self.size(result.file)  # known once generated
+                finally:
+                    result.seconds = time.perf_counter() - start
+                    self.notify("file_finished", result)
+                limit.record(result.seconds, result.size)
 
-def upload_file(record_id, file_path):
+        self._limits.add(limit)
+        with ThreadPoolExecutor(
+            max_workers=limit.max_limit, thread_name_prefix="upload"
+        ) as executor:
+            futures = []
+            try:
+                for batch in batched(order, self.init_batch_size):
+                    if stopped.is_set():
+                        break
+                    to_initialize = [r.file for r in batch if r.file in uninitialized]
+                    self.initialize_files(record_id, to_initialize, journal)
+                    futures += [executor.submit(timed_upload, r) for r in batch]
+                wait(futures, return_when=FIRST_EXCEPTION)
+            finally:
+                stopped.set()
+                for future in futures:
+                    future.cancel()
+                self._limits.discard(limit)
+
+        return results
+
+    def concurrency_limit(self, concurrency):
+        """
+        Creates the limit of the files uploaded in parallel by upload_files. The
+        limit is fixed at concurrency, unless the client has a max_concurrency, up
+        to which it is adapted.
+        """
+
+        def changed(limit):
+            metrics.UPLOAD_CONCURRENCY.set(limit)
+            self.notify("concurrency_changed", limit)
+
+        concurrency = max(1, concurrency)
+        if self.max_concurrency is None:
+            limit = concurrency_control.AdaptiveLimit(
+                concurrency, concurrency, concurrency
+            )
+        else:
+            limit = concurrency_control.AdaptiveLimit(
+                concurrency, self.max_concurrency, on_change=changed
+            )
+        changed(limit.limit)
+        return limit
+
+    def initialize_files(self, record_id, files, journal=None):
+        """
+        Initializes files of a draft record in one request, and records them in the
+        journal.
+
+        :param record_id: The record's id.
+        :param files: The files to initialize. Nothing is sent if it is empty.
+        :param journal: A Journal to record the initialized files in.
+        """
+        if not files:
+            return
+        print(f"Preparing to upload {len(files)} files...")
+        with self.phase("initialize"):
+            self.start_draft_files_upload(record_id, files)
+        if journal is not None:
+            journal.record_initialized([sources.key(f) for f in files])
+
+    def publish_record(self, record_id):
+        """
+        Publishes a record.
+        Raises a RepositoryError if the request fails.
+
+        :param record_id: The record's id.
+        """
+        resp = self.send_request(
+            "POST",
+            f"/api/records/{record_id}/draft/actions/publish",
+            "publish_record",
+            "publish",
+            headers=self.get_headers("application/json"),
+        )
+        check_status(
+            resp.status_code, resp.text, 202, "Could not publish record", "publish"
+        )
+
+
+def is_unchanged(entry, file_path, inventory=None, stats=None):
     """
-    Uploads a file to the record.
-    Exits the program if the request fails.
+    Whether a local file has the same content as a file of a record. The checksum
+    is only computed if the sizes are equal, and the inventory does not have it.
 
-    :param record_id: The record's id.
-    :param file_path: The path of the file to upload.
+    :param entry: The record's file entry, with its "size" and "checksum".
+    :param file_path: The path of the local file.
+    :param inventory: An Inventory of the local files.
+    :param stats: sources.FileStat of the local files by path, if known.
     """
-    _, file_name = os.path.split(file_path)
-    print(file_name)
+    size = sources.size(file_path, stats)
+    if entry.get("size") != size or not entry.get("checksum"):
+        return False
+    digests = inventory.digests(file_path) if inventory is not None else {}
+    if "md5" not in digests:
+        with sources.open_source(file_path) as f:
+            digests = {"md5": checksum.digest(f, "md5")}
+    return checksum.matches(entry["checksum"], digests)
 
-    # Upload file content
-    api_url = credentials.get_repository_base_url()
-    upload_url = f"{api_url}/api/records/{record_id}/draft/files/{file_name}/content"
 
-    with open(file_path, "rb") as f:
-        resp = requests.put(
-            upload_url,
-            data=f,
-            headers=get_headers("application/octet-stream"),
-        )
+_default_client: InvenioRDMClient | None = None
+_default_client_lock = threading.Lock()
 
-    if resp.status_code != 200:
-        print(f"Could not upload file content: {resp.status_code} {resp.text}")
-        sys.exit(1)
 
-    # Complete draft file upload
-    resp = requests.post(
-        f"{api_url}/api/records/{record_id}/draft/files/{file_name}/commit",
-        headers=get_headers("application/json"),
-    )
-    if resp.status_code != 200:
-        print(f"Could not commit file upload: {resp.status_code} {resp.text}")
-        sys.exit(1)
+def get_default_client():
+    """
+    Returns a client for the repository configured in the environment. The client is
+    reused by later calls, unless the environment has changed since.
+    """
+    global _default_client
+    base_url = credentials.get_repository_base_url()
+    api_key = credentials.get_api_key()
+    with _default_client_lock:
+        client = _default_client
+        if client is None or (client.base_url, client.api_key) != (
+            base_url.rstrip("/"),
+            api_key,
+        ):
+            if client is not None:
+                client.close()
+            client = _default_client = InvenioRDMClient(base_url, api_key)
+        return client
 
 
-def upload(metadata, files):
+def deposit(
+    metadata,
+    files,
+    publish=False,
+    concurrency=1,
+    journal=None,
+    part_size=None,
+    part_concurrency=4,
+    checksum_algorithms=("md5",),
+    new_version_of=None,
+    init_batch_size=DEFAULT_INIT_BATCH_SIZE,
+    observers=(),
+    max_bandwidth=None,
+    max_concurrency=None,
+    inventory=None,
+    timeout=DEFAULT_TIMEOUT,
+    file_stats=None,
+):
     """
-    Uploads a draft record to the repository.
-    Exits the program if the request fails.
+    Entry point.
+    Uploads and publishes a record to the repository configured in the environment.
 
-    :param metadata: The record's metadata.
+    :param metadata: The record's DataCite metadata.
     :param files: The record's files.
-    :returns: The draft record's id.
+    :param publish: Whether to publish the record after uploading.
+    :param concurrency: Number of files to upload in parallel.
+    :param journal: A Journal to record the progress in. If it was loaded from an
+        earlier deposit, that deposit is resumed.
+    :param part_size: If set, files larger than this many bytes are uploaded with
+        multipart transfer, in parts of this size.
+    :param part_concurrency: Number of parts of a file to upload in parallel.
+    :param checksum_algorithms: hashlib algorithms to compute while uploading each
+        file.
+    :param new_version_of: The id of a published record to deposit a new version of,
+        reusing its unchanged files.
+    :param init_batch_size: Maximum number of files initialized per request.
+    :param observers: UploadObservers to report the progress of the upload to, see
+        progress.UploadObserver.
+    :param max_bandwidth: Maximum bytes per second to send file contents at, across
+        all files and parts uploaded in parallel, and all deposits of the process
+        with the same limit.
+    :param max_concurrency: If set, the number of files uploaded in parallel is
+        adapted to the repository's responses, from concurrency up to this many.
+    :param inventory: An Inventory of the local files, to verify files uploaded in
+        parts and find unchanged files of a new version with.
+    :param timeout: Seconds to wait for a connection and for each read from the
+        repository, as a (connect, read) tuple.
+    :param file_stats: sources.FileStat of the local files by path, e.g. from the
+        walk which listed them.
+    :returns: The record's id.
     """
+    workers = max(concurrency, max_concurrency or 0)
+    connections = workers * (part_concurrency if part_size else 1)
+    with InvenioRDMClient.from_environment(
+        pool_size=max(connections, DEFAULT_POOL_SIZE),
+        part_size=part_size,
+        part_concurrency=part_concurrency,
+        checksum_algorithms=checksum_algorithms,
+        init_batch_size=init_batch_size,
+        observers=observers,
+        max_bandwidth=max_bandwidth,
+        max_concurrency=max_concurrency,
+        inventory=inventory,
+        timeout=timeout,
+        file_stats=file_stats,
+    ) as client:
+        return client.deposit(
+            metadata, files, publish, concurrency, journal, new_version_of
+        )
+
+
+# The functions below call the corresponding method of the default client.
+
+
+def create_draft_record(metadata):
+    return get_default_client().create_draft_record(metadata)
+
 
-    record_id = create_draft_record(metadata)
-    print(f"Preparing to upload {len(files)} files...")
-    start_draft_files_upload(record_id, files)
+def start_draft_files_upload(record_id, files):
+    return get_default_client().start_draft_files_upload(record_id, files)
+
+
+def upload_file(record_id, file_path, journal=None):
+    return get_default_client().upload_file(record_id, file_path, journal)
 
-    print(f"Uploading {len(files)} files...")
-    for file in files:
-        upload_file(record_id, file)
 
-    print(f"All {len(files)} files uploaded.")
-    return record_id
+def upload(metadata, files, concurrency=1, journal=None):
+    return get_default_client().upload(metadata, files, concurrency, journal)
+
+
+def upload_files(record_id, files, concurrency=1, journal=None, uninitialized=()):
+    return get_default_client().upload_files(
+        record_id, files, concurrency, journal, uninitialized
+    )
 
 
 def publish_record(record_id):
+    return get_default_client().publish_record(record_id)
+
+
+def print_upload_summary(results):
     """
-    Publishes a record.
-    Exits the program if the request fails.
+    Prints the outcome of each file upload, and the number of files per outcome and
+    of retried requests.
 
-    :param record_id: The record's id.
+    :param results: A list of FileUploadResult.
     """
-    api_url = credentials.get_repository_base_url()
-    resp = requests.post(
-        f"{api_url}/api/records/{record_id}/draft/actions/publish",
-        headers=get_headers("application/json"),
-    )
-    if resp.status_code != 202:
-        print(f"Could not publish record: {resp.status_code} {resp.text}")
-        sys.exit(1)
+    if not results:
+        return
+    print("Upload summary:")
+    for result in results:
+        line = f"  {result.status:<9} {result.seconds:8.2f}s  {result.file}"
+        if result.retries:
+            line += f"  [{result.retries} retries]"
+        if result.error:
+            line += f"  ({result.error})"
+        print(line)
+    counts = {}
+    for result in results:
+        counts[result.status] = counts.get(result.status, 0) + 1
+    totals = [f"{n} {status}" for status, n in counts.items()]
+    retries = sum(result.retries for result in results)
+    if retries:
+        totals.append(f"{retries} retries")
+    print("  " + ", ".join(totals))
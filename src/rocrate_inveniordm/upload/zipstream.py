@@ -0,0 +1,716 @@
+"""
+    Generates a zip archive of a directory as a stream, which is uploaded as it is
+    generated instead of being written to disk first.
+
+    Members are stored uncompressed by default, so the exact size of the archive is
+    known before any file is read, and the upload can send a Content-Length header.
+    Each member's CRC-32 is computed while it is streamed and written in a data
+    descriptor after its content. Zip64 records are used for members and offsets
+    beyond 4 GiB, and for archives of more than 65535 members.
+
+    With compression, members are cut into blocks which are deflated by a pool of
+    threads (zlib releases the GIL) a bounded number of blocks ahead of the upload,
+    and streamed as they are done, so nothing is written to disk and the upload
+    starts right away. Each block continues the member's deflate stream, with the
+    end of the previous block as its dictionary. The size of the archive is then
+    only known once it has been generated, so it is uploaded with chunked transfer
+    encoding. Files of compressed formats, recognized by their extension, and files
+    whose content looks random are stored as they are.
+
+    Archives are deterministic: members are sorted, and get fixed timestamps and
+    permissions, so an archive only depends on the paths and contents of its files.
+    Archives can be kept in a cache, keyed by a fingerprint of the crate's files, so
+    that a deposit which is run again reuses the archive instead of compressing the
+    files again.
+
+    See https://pkware.cachefly.net/webdocs/casestudies/APPNOTE.TXT for the format.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import itertools
+import os
+import shutil
+import struct
+import tempfile
+import zlib
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager, suppress
+from dataclasses import dataclass, replace
+from typing import Callable, Generator, Iterable, Iterator
+
+from rocrate_inveniordm.exceptions import UploadError
+
+READ_SIZE = 1024 * 1024
+DEFAULT_COMPRESSION_LEVEL = 6
+
+# changed whenever archives of the same files change, to invalidate cached archives
+FORMAT_VERSION = 3
+# the timestamp of all members: 00:00 on 1980-01-01, the earliest DOS time and date
+DOS_TIME, DOS_DATE = 0, (1 << 5) | 1
+
+# values from which sizes, offsets and the number of members are stored in zip64
+# records, while the field of the classic record holds a marker
+ZIP64_LIMIT = 0xFFFFFFFF
+ZIP64_COUNT_LIMIT = 0xFFFF
+ZIP64_MARKER = 0xFFFFFFFF
+ZIP64_COUNT_MARKER = 0xFFFF
+VERSION = 20
+VERSION_ZIP64 = 45
+MADE_BY_UNIX = 3 << 8
+FLAG_DATA_DESCRIPTOR = 0x08
+FLAG_UTF8 = 0x800
+STORED = 0
+DEFLATED = 8
+
+# formats which are compressed already, and are stored without compression
+INCOMPRESSIBLE_EXTENSIONS = frozenset(
+    {
+        ".7z",
+        ".bz2",
+        ".gif",
+        ".gz",
+        ".h5",
+        ".hdf5",
+        ".jpeg",
+        ".jpg",
+        ".mkv",
+        ".mp3",
+        ".mp4",
+        ".ogg",
+        ".png",
+        ".tgz",
+        ".webp",
+        ".xz",
+        ".zip",
+        ".zst",
+    }
+)
+# a file of more than one block is stored if the first SAMPLE_SIZE bytes deflate at
+# level 1 to more than MAX_SAMPLE_RATIO of their size
+SAMPLE_SIZE = 64 * 1024
+MAX_SAMPLE_RATIO = 0.95
+# members are deflated in blocks of this size, and each worker thread has up to
+# BLOCKS_AHEAD blocks in flight, which bounds the memory held for the upload
+BLOCK_SIZE = 1024 * 1024
+BLOCKS_AHEAD = 4
+WINDOW_SIZE = 32 * 1024  # of deflate, carried from one block to the next
+
+
+@dataclass
+class Member:
+    """A file or directory in the archive."""
+
+    name: str  # path in the archive, with "/" separators
+    path: str | None  # path of the file on disk, or None for a directory
+    size: int
+    mtime: float
+    mode: int
+    method: int = STORED
+    compressed_size: int | None = None
+    # deflated while it is streamed, so its compressed size is not known before
+    streamed: bool = False
+
+    @property
+    def data_size(self) -> int:
+        """Size of the member's data in the archive."""
+        return self.size if self.compressed_size is None else self.compressed_size
+
+    @property
+    def zip64(self) -> bool:
+        # decided before a streamed member is compressed, from the largest size
+        # its compressed data can have
+        data_size = deflate_bound(self.size) if self.streamed else self.data_size
+        return max(self.size, data_size) >= ZIP64_LIMIT
+
+
+def deflate_bound(size: int) -> int:
+    """:return: The largest size of raw deflate data of size bytes, as in zlib"""
+    return size + (size >> 12) + (size >> 14) + (size >> 25) + 13
+
+
+def normalized_mode(member: Member) -> int:
+    """
+    :return: The permissions stored for a member: rwxr-xr-x for directories and
+        executable files, and rw-r--r-- for other files, as git does
+    """
+    if member.path is None:
+        return 0o40755
+    return 0o100755 if member.mode & 0o111 else 0o100644
+
+
+class ZipStream:
+    """
+    A zip archive of a directory, which is generated while it is read. Used as a
+    file of a record in place of a path: it has a key, a size, and open() returns a
+    new reader of the archive.
+
+    The size is exact unless the archive is compressed, see compress(). Then it is
+    None until the archive has been generated once, and estimated_size is the size
+    of the archive with all members stored.
+    """
+
+    def __init__(self, key: str, members: list[Member], root_dir: str | None = None):
+        """
+        :param key: The archive's file name in the record, e.g. "crate.zip"
+        :param members: The files and directories in the archive, in order
+        :param root_dir: Absolute path of the directory the archive is made of, if
+            any
+        """
+        self.key = key
+        self.members = members
+        self.root_dir = root_dir
+        self.level = 0
+        self.jobs: int | None = None
+        self._random: dict[str, bool] = {}  # by path, of members of several blocks
+        self.estimated_size = self._layout()
+        self.size: int | None = self.estimated_size
+
+    @classmethod
+    def from_directory(cls, key: str, root_dir: str) -> ZipStream:
+        """
+        Creates an archive of all files and directories in root_dir, with paths
+        relative to root_dir, sorted by directory and name.
+
+        :param key: The archive's file name in the record
+        :param root_dir: The directory to archive
+        """
+        members = []
+        for dirpath, dirnames, filenames in os.walk(root_dir):
+            dirnames.sort()
+            relative = os.path.relpath(dirpath, root_dir)
+            prefix = "" if relative == "." else relative.replace(os.sep, "/") + "/"
+            if prefix:
+                stat = os.stat(dirpath)
+                members.append(Member(prefix, None, 0, stat.st_mtime, stat.st_mode))
+            for filename in sorted(filenames):
+                path = os.path.join(dirpath, filename)
+                stat = os.stat(path)
+                members.append(
+                    Member(
+                        prefix + filename,
+                        path,
+                        stat.st_size,
+                        stat.st_mtime,
+                        stat.st_mode,
+                    )
+                )
+        return cls(key, members, os.path.abspath(root_dir))
+
+    def __str__(self) -> str:
+        return self.key
+
+    def open(self) -> ZipReader:
+        return ZipReader(self)
+
+    def compress(self, level: int = DEFAULT_COMPRESSION_LEVEL, jobs: int | None = None):
+        """
+        Deflates the members of the archive while it is generated, except those of
+        compressed formats. The size of the archive is then not known until it has
+        been generated once.
+
+        :param level: zlib compression level, from 1 (fastest) to 9 (smallest), or
+            0 to store all members
+        :param jobs: Number of threads compressing blocks. Defaults to the number of
+            CPUs
+        """
+        self.level, self.jobs = level, jobs
+        if any(self._deflates(member) for member in self.members):
+            self.size = None
+        else:
+            self.size = self.estimated_size
+
+    def _deflates(self, member: Member) -> bool:
+        """
+        Whether a member is deflated. A member of one block is stored after all if
+        deflating does not make it smaller; a larger one is sampled once instead.
+        """
+        if (
+            self.level <= 0
+            or member.path is None
+            or member.size == 0
+            or compressed_format(member.path)
+        ):
+            return False
+        if member.size <= BLOCK_SIZE:
+            return True
+        if member.path not in self._random:
+            with open(member.path, "rb") as f:
+                self._random[member.path] = looks_random(f.read(SAMPLE_SIZE))
+        return not self._random[member.path]
+
+    def fingerprint(self, level: int = 0) -> str:
+        """
+        :param level: The compression level the archive is written with
+        :return: A digest of the members' names, sizes, modification times and
+            permissions, which changes whenever a file of the archive may have
+            changed
+        """
+        digest = hashlib.sha256(f"{FORMAT_VERSION}:{level}".encode())
+        for member in self.members:
+            fields = (member.name, member.size, repr(member.mtime), member.mode)
+            digest.update("".join(f"\0{field}" for field in fields).encode())
+        return digest.hexdigest()[:32]
+
+    def write(self, path: str):
+        """
+        Writes the archive to a file, which appears once it is complete. Each call
+        writes to a temporary file of its own, so that concurrent writers of the
+        same path do not mix their data.
+        """
+        fd, part = tempfile.mkstemp(
+            ".part", os.path.basename(path), os.path.dirname(path)
+        )
+        try:
+            with self.open() as reader, os.fdopen(fd, "wb") as f:
+                shutil.copyfileobj(reader, f, READ_SIZE)
+            os.replace(part, path)
+        except BaseException:
+            os.remove(part)
+            raise
+
+    def _layout(self) -> int:
+        """:return: The size of the archive in bytes"""
+        offset = 0
+        central_size = 0
+        for member in self.members:
+            central_size += len(self._central_header(member, 0, offset))
+            offset += len(self._local_header(member)) + member.data_size
+            if member.path is not None:
+                offset += len(self._data_descriptor(member, 0))
+        end = self._end_records(len(self.members), central_size, offset)
+        return offset + central_size + len(end)
+
+    def generate(self) -> Iterator[bytes]:
+        """Yields the bytes of the archive, reading each file once."""
+        offset = 0
+        central = []
+        for member, blocks in self._encode():
+            header = self._local_header(member)
+            yield header
+            crc, data_size = 0, 0
+            for data, encoded in blocks:
+                crc = zlib.crc32(data, crc)
+                data_size += len(encoded)
+                yield encoded
+            if member.streamed:
+                member = replace(member, compressed_size=data_size)
+            if member.path is not None:
+                descriptor = self._data_descriptor(member, crc)
+                yield descriptor
+                header += descriptor
+            central.append(self._central_header(member, crc, offset))
+            offset += len(header) + data_size
+        central_directory = b"".join(central)
+        yield central_directory
+        end_records = self._end_records(
+            len(self.members), len(central_directory), offset
+        )
+        yield end_records
+        self.size = offset + len(central_directory) + len(end_records)
+
+    def _encode(self) -> Iterator[tuple[Member, Iterator[tuple[bytes, bytes]]]]:
+        """
+        :return: Each member as it is written, with its blocks of data, each as
+            read and as written to the archive
+        """
+        if not any(self._deflates(member) for member in self.members):
+            for member in self.members:
+                yield member, self._stored(member)
+            return
+        workers = self.jobs or os.cpu_count() or 1
+        with ThreadPoolExecutor(workers, thread_name_prefix="deflate") as executor:
+            ahead = BLOCKS_AHEAD * workers
+            blocks = ordered_map(executor, deflate_block, self._blocks(), ahead)
+            try:
+                for member in self.members:
+                    if not self._deflates(member):
+                        yield member, self._stored(member)
+                    elif member.size <= BLOCK_SIZE:
+                        yield self._deflated_block(member, next(blocks))
+                    else:
+                        count = -(-member.size // BLOCK_SIZE)
+                        member = replace(member, method=DEFLATED, streamed=True)
+                        yield member, itertools.islice(blocks, count)
+            finally:
+                blocks.close()
+
+    def _blocks(self) -> Iterator[tuple]:
+        """:return: The arguments of deflate_block for each block to deflate"""
+        for member in self.members:
+            if self._deflates(member):
+                for offset in range(0, member.size, BLOCK_SIZE):
+                    length = min(BLOCK_SIZE, member.size - offset)
+                    last = offset + length == member.size
+                    yield member.path, offset, length, self.level, last
+
+    @staticmethod
+    def _deflated_block(member: Member, block: tuple[bytes, bytes]):
+        """A member of one block is stored if deflating does not make it smaller."""
+        data, compressed = block
+        if len(compressed) >= len(data):
+            return member, iter([(data, data)])
+        member = replace(member, method=DEFLATED, compressed_size=len(compressed))
+        return member, iter([block])
+
+    @staticmethod
+    def _stored(member: Member) -> Iterator[tuple[bytes, bytes]]:
+        if member.path is None:
+            return
+        count = 0
+        with open(member.path, "rb") as f:
+            for chunk in iter(lambda: f.read(READ_SIZE), b""):
+                count += len(chunk)
+                if count > member.size:
+                    break
+                yield chunk, chunk
+        if count != member.size:
+            raise UploadError(f"{member.path} changed while it was being uploaded")
+
+    @staticmethod
+    def _flags(member: Member) -> int:
+        flags = 0 if member.path is None else FLAG_DATA_DESCRIPTOR
+        if not member.name.isascii():
+            flags |= FLAG_UTF8
+        return flags
+
+    def _local_header(self, member: Member) -> bytes:
+        name = member.name.encode("utf-8")
+        size, data_size, extra = member.size, member.data_size, b""
+        if member.streamed:
+            size, data_size = 0, 0  # they follow in the data descriptor
+        if member.zip64:
+            extra = struct.pack("<HHQQ", 1, 16, size, data_size)
+            size, data_size = ZIP64_MARKER, ZIP64_MARKER
+        return (
+            struct.pack(
+                "<IHHHHHIIIHH",
+                0x04034B50,
+                VERSION_ZIP64 if member.zip64 else VERSION,
+                self._flags(member),
+                member.method,
+                DOS_TIME,
+                DOS_DATE,
+                0,  # the CRC-32 follows in the data descriptor
+                data_size,
+                size,
+                len(name),
+                len(extra),
+            )
+            + name
+            + extra
+        )
+
+    @staticmethod
+    def _data_descriptor(member: Member, crc: int) -> bytes:
+        fmt = "<IIQQ" if member.zip64 else "<IIII"
+        return struct.pack(fmt, 0x08074B50, crc, member.data_size, member.size)
+
+    def _central_header(self, member: Member, crc: int, offset: int) -> bytes:
+        name = member.name.encode("utf-8")
+        size, data_size, fields = member.size, member.data_size, []
+        if member.zip64:
+            size, data_size = ZIP64_MARKER, ZIP64_MARKER
+            fields = [member.size, member.data_size]
+        header_offset = offset
+        if offset >= ZIP64_LIMIT:
+            header_offset = ZIP64_MARKER
+            fields.append(offset)
+        extra = b""
+        if fields:
+            extra = struct.pack(f"<HH{len(fields)}Q", 1, 8 * len(fields), *fields)
+        version = VERSION_ZIP64 if fields else VERSION
+        external = normalized_mode(member) << 16
+        if member.path is None:
+            external |= 0x10  # MS-DOS directory attribute
+        return (
+            struct.pack(
+                "<IHHHHHHIIIHHHHHII",
+                0x02014B50,
+                MADE_BY_UNIX | version,
+                version,
+                self._flags(member),
+                member.method,
+                DOS_TIME,
+                DOS_DATE,
+                crc,
+                data_size,
+                size,
+                len(name),
+                len(extra),
+                0,  # comment length
+                0,  # disk number
+                0,  # internal attributes
+                external,
+                header_offset,
+            )
+            + name
+            + extra
+        )
+
+    @staticmethod
+    def _end_records(count: int, central_size: int, central_offset: int) -> bytes:
+        records = b""
+        if count >= ZIP64_COUNT_LIMIT:
+            count_field = ZIP64_COUNT_MARKER
+        else:
+            count_field = count
+        size_field, offset_field = (
+            value if value < ZIP64_LIMIT else ZIP64_MARKER
+            for value in (central_size, central_offset)
+        )
+        zip64 = (count_field, size_field, offset_field) != (
+            count,
+            central_size,
+            central_offset,
+        )
+        if zip64:
+            end_offset = central_offset + central_size
+            records = struct.pack(
+                "<IQHHIIQQQQ",
+                0x06064B50,
+                44,  # size of the rest of the record
+                MADE_BY_UNIX | VERSION_ZIP64,
+                VERSION_ZIP64,
+                0,
+                0,
+                count,
+                count,
+                central_size,
+                central_offset,
+            ) + struct.pack("<IIQI", 0x07064B50, 0, end_offset, 1)
+        return records + struct.pack(
+            "<IHHHHIIH",
+            0x06054B50,
+            0,
+            0,
+            count_field,
+            count_field,
+            size_field,
+            offset_field,
+            0,  # comment length
+        )
+
+
+class ZipReader:
+    """
+    A file-like reader of a ZipStream, used as a request body. If the size of the
+    archive is known, it has a length, so requests sets the Content-Length header.
+    Seeking regenerates the archive from the start, so a failed upload can be sent
+    again.
+    """
+
+    def __init__(self, stream: ZipStream):
+        self.stream = stream
+        self._chunks: Iterator[bytes] = iter(())
+        self._restart()
+
+    def _restart(self, chunks: Iterator[bytes] | None = None):
+        self.close()
+        self._chunks = self.stream.generate() if chunks is None else chunks
+        # the chunk being read, and the offset of the next byte to read from it; the
+        # rest of a chunk is not copied on each read
+        self._chunk = b""
+        self._offset = 0
+        self._position = 0
+
+    def __len__(self) -> int:
+        if self.stream.size is None:
+            raise TypeError("The size of a compressed archive is not known")
+        return self.stream.size
+
+    def read(self, size: int = -1) -> bytes:
+        parts = []
+        remaining = size
+        while remaining != 0:
+            if self._offset == len(self._chunk):
+                chunk = next(self._chunks, None)
+                if chunk is None:
+                    break
+                self._chunk, self._offset = chunk, 0
+                continue
+            start, end = self._offset, len(self._chunk)
+            if remaining > 0:
+                end = min(end, start + remaining)
+                remaining -= end - start
+            parts.append(self._chunk[start:end])
+            self._offset = end
+        data = parts[0] if len(parts) == 1 else b"".join(parts)
+        self._position += len(data)
+        return data
+
+    def __iter__(self):
+        while True:
+            chunk = self.read(READ_SIZE)
+            if not chunk:
+                return
+            yield chunk
+
+    def close(self):
+        close = getattr(self._chunks, "close", None)
+        if close is not None:
+            close()
+
+    def __enter__(self) -> ZipReader:
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def tell(self) -> int:
+        return self._position
+
+    def seek(self, offset: int, whence: int = 0) -> int:
+        if whence == 1:
+            offset += self._position
+        elif whence == 2:
+            offset += len(self)
+        offset = max(offset, 0)
+        if self.stream.size is not None and offset >= self.stream.size:
+            # e.g. requests measuring the body; nothing is read until it seeks back
+            self._restart(iter(()))
+            self._position = self.stream.size
+            return self._position
+        if offset < self._position or offset == 0:
+            self._restart()
+        while self._position < offset:
+            if not self.read(min(READ_SIZE, offset - self._position)):
+                break
+        return self._position
+
+
+def compressed_format(path: str) -> bool:
+    """Whether a file has the extension of a compressed format."""
+    return os.path.splitext(path)[1].lower() in INCOMPRESSIBLE_EXTENSIONS
+
+
+def looks_random(data: bytes) -> bool:
+    """Whether a sample of the data hardly shrinks when it is deflated quickly."""
+    sample = data[:SAMPLE_SIZE]
+    return len(zlib.compress(sample, 1)) > MAX_SAMPLE_RATIO * len(sample)
+
+
+def deflate_block(
+    path: str, offset: int, length: int, level: int, last: bool
+) -> tuple[bytes, bytes]:
+    """
+    Reads a block of a file and deflates it as a part of the raw deflate stream of
+    the whole file: a block which is not the last ends with a sync flush instead of
+    finishing the stream, and the data before the block is its dictionary. Runs in
+    a worker thread.
+
+    :param path: Path of the file
+    :param offset: Offset of the block in the file
+    :param length: Length of the block
+    :param level: zlib compression level
+    :param last: Whether this is the last block of the file
+    :return: The block's data, and the deflated data
+    :raises UploadError: If the file is shorter than expected, or longer than
+        expected at its last block
+    """
+    with open(path, "rb") as f:
+        start = max(0, offset - WINDOW_SIZE)
+        f.seek(start)
+        dictionary = f.read(offset - start)
+        data = f.read(length)
+        if len(data) != length or (last and f.read(1)):
+            raise UploadError(f"{path} changed while it was being uploaded")
+    compressor = zlib.compressobj(
+        level, zlib.DEFLATED, -zlib.MAX_WBITS, zdict=dictionary
+    )
+    flush = zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH
+    return data, compressor.compress(data) + compressor.flush(flush)
+
+
+def ordered_map(
+    executor, fn: Callable, arguments: Iterable[tuple], ahead: int
+) -> Generator:
+    """
+    Like executor.map, but submits at most ahead calls before their results are
+    taken, so that a long or endless iterable of arguments is not all submitted at
+    once. Calls which are still pending when the iterator is closed are cancelled.
+
+    :param executor: The executor to call fn in
+    :param fn: The function to call
+    :param arguments: The arguments of each call
+    :param ahead: Maximum number of calls submitted before their results are taken
+    :return: The results of the calls, in order
+    """
+    pending: deque[Future] = deque()
+    try:
+        for args in arguments:
+            pending.append(executor.submit(fn, *args))
+            if len(pending) >= ahead:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+@contextmanager
+def prepare_archives(
+    streams: list[ZipStream],
+    level: int = 0,
+    jobs: int | None = None,
+    cache_dir: str | None = None,
+) -> Iterator[list]:
+    """
+    Prepares archives to be uploaded.
+
+    :param streams: The archives
+    :param level: zlib compression level, or 0 to store members uncompressed
+    :param jobs: Number of threads compressing members. Defaults to the number of
+        CPUs
+    :param cache_dir: A directory to keep the archives in. If None, they are
+        streamed while they are uploaded
+    :return: The files to upload in place of the archives: the streams, or the
+        paths of the archives in the cache
+    """
+    for stream in streams:
+        stream.compress(level, jobs)
+    if cache_dir is None:
+        yield list(streams)
+    else:
+        yield [cached_archive(stream, cache_dir, level, jobs) for stream in streams]
+
+
+def cached_archive(
+    stream: ZipStream, cache_dir: str, level: int = 0, jobs: int | None = None
+) -> str:
+    """
+    Writes an archive to the cache, unless the cache holds it already. Archives are
+    kept per name and directory, so that crates of the same name do not share
+    entries. Archives of earlier fingerprints are left in place, as another deposit
+    may still be uploading them; only what this call fails to write is removed.
+
+    :param stream: The archive
+    :param cache_dir: The cache directory
+    :param level: zlib compression level, or 0 to store members uncompressed
+    :param jobs: Number of threads compressing members
+    :return: Path of the archive in the cache, as
+        cache_dir/name-location/fingerprint/key
+    """
+    location = hashlib.sha256((stream.root_dir or "").encode()).hexdigest()[:16]
+    name = os.path.splitext(stream.key)[0]
+    fingerprint_dir = os.path.join(
+        cache_dir, f"{name}-{location}", stream.fingerprint(level)
+    )
+    path = os.path.join(fingerprint_dir, stream.key)
+    if os.path.isfile(path):
+        print(f"Reusing cached zip file {path}")
+        return path
+
+    print(f"Writing zip file {path}")
+    os.makedirs(fingerprint_dir, exist_ok=True)
+    stream.compress(level, jobs)
+    try:
+        stream.write(path)
+    except BaseException:
+        with suppress(OSError):
+            os.rmdir(fingerprint_dir)  # unless another deposit wrote to it
+        raise
+    return path
@@ -0,0 +1,194 @@
+"""
+    Walks a crate directory with os.scandir, yielding its files one at a time with
+    their stat results, instead of listing all paths first and stat-ing each of them
+    again.
+
+    Files are selected with gitignore-style patterns, matched against their paths
+    relative to the crate directory:
+
+    - a pattern without a "/" matches a file or directory name at any depth, while
+      a pattern with a "/" matches from the crate directory, e.g. "/data/*.csv"
+    - "*" matches anything but "/", "?" one character but "/", "[...]" a character
+      class, and "**" any number of directories
+    - a pattern ending in "/" only matches directories
+    - a pattern starting with "!" re-includes what an earlier pattern excluded
+
+    Excluded directories are not walked into. A file matched by an include pattern,
+    or inside a directory matched by one, is kept.
+"""
+
+from __future__ import annotations
+
+import os
+import re
+from typing import Iterator, Sequence
+
+from rocrate_inveniordm.exceptions import InvalidCrateError
+
+# what to do with symbolic links in a crate
+SYMLINK_POLICIES = ("follow", "skip", "error")
+
+# hidden files and directories, which are not uploaded unless re-included with "!"
+DEFAULT_EXCLUDE = (".*",)
+
+# the RO-Crate metadata file and website, excluded by --omit-roc-files
+ROC_FILE_PATTERNS = ("ro-crate-metadata.json", "*ro-crate-preview*")
+
+
+def translate(pattern: str) -> str:
+    """:return: A regular expression matching the same paths as a glob pattern"""
+    regex = ""
+    i = 0
+    while i < len(pattern):
+        if pattern.startswith("**/", i):
+            regex += "(?:.*/)?"
+            i += 3
+        elif pattern.startswith("**", i):
+            regex += ".*"
+            i += 2
+        elif pattern[i] == "*":
+            regex += "[^/]*"
+            i += 1
+        elif pattern[i] == "?":
+            regex += "[^/]"
+            i += 1
+        elif pattern[i] == "[" and pattern.find("]", i + 2) != -1:
+            start, end = i + 1, pattern.find("]", i + 2)
+            members = pattern[start:end].replace("\\", "\\\\")
+            if members.startswith("!"):
+                members = "^" + members[1:]
+            regex += f"[{members}]"
+            i = end + 1
+        else:
+            regex += re.escape(pattern[i])
+            i += 1
+    return regex
+
+
+class PathPattern:
+    """A gitignore-style pattern."""
+
+    def __init__(self, pattern: str):
+        self.pattern = pattern
+        self.negated = pattern.startswith("!")
+        pattern = pattern[1:] if self.negated else pattern
+        self.directory_only = pattern.endswith("/")
+        pattern = pattern.rstrip("/")
+        anchored = "/" in pattern
+        regex = translate(pattern.lstrip("/"))
+        if not anchored:
+            regex = "(?:.*/)?" + regex
+        self._regex = re.compile(regex + r"\Z", re.DOTALL)
+
+    def matches(self, relative: str, is_dir: bool) -> bool:
+        """
+        :param relative: Path relative to the crate directory, with "/" separators
+        :param is_dir: Whether the path is a directory
+        """
+        if self.directory_only and not is_dir:
+            return False
+        return self._regex.match(relative) is not None
+
+
+class PathFilter:
+    """Decides which files of a crate to keep, by include and exclude patterns."""
+
+    def __init__(self, include: Sequence[str] = (), exclude: Sequence[str] = ()):
+        """
+        :param include: If not empty, only files matching these patterns are kept
+        :param exclude: Files and directories matching these patterns are skipped
+        """
+        self.include = [PathPattern(p) for p in include]
+        self.exclude = [PathPattern(p) for p in exclude]
+
+    @staticmethod
+    def _decide(patterns: list[PathPattern], relative: str, is_dir: bool):
+        """:return: Whether the last matching pattern is not negated, or None"""
+        for pattern in reversed(patterns):
+            if pattern.matches(relative, is_dir):
+                return not pattern.negated
+        return None
+
+    def excluded(self, relative: str, is_dir: bool) -> bool:
+        return bool(self._decide(self.exclude, relative, is_dir))
+
+    def included(self, relative: str) -> bool:
+        if not self.include:
+            return True
+        parts = relative.split("/")
+        # the file itself, then its directories from the innermost
+        candidates = [(relative, False)] + [
+            ("/".join(parts[:depth]), True) for depth in range(len(parts) - 1, 0, -1)
+        ]
+        for path, is_dir in candidates:
+            decision = self._decide(self.include, path, is_dir)
+            if decision is not None:
+                return decision
+        return False
+
+
+def walk_files(
+    root_dir: str,
+    path_filter: PathFilter | None = None,
+    symlinks: str = "follow",
+) -> Iterator[tuple[str, os.stat_result]]:
+    """
+    Walks a directory depth first, in order of names.
+
+    :param root_dir: The directory to walk
+    :param path_filter: Decides which files to yield. Defaults to all files
+    :param symlinks: "follow" to treat symbolic links as the files and directories
+        they point to, "skip" to ignore them, or "error" to raise an
+        InvalidCrateError. A link to a directory which is already being walked is
+        never followed
+    :return: The path of each file, and its stat result
+    :raises InvalidCrateError: If symlinks is "error" and there is a symbolic link
+    """
+    if symlinks not in SYMLINK_POLICIES:
+        raise ValueError(f"symlinks must be one of {', '.join(SYMLINK_POLICIES)}")
+    path_filter = path_filter or PathFilter()
+    root_stat = os.stat(root_dir)
+    yield from _walk(
+        root_dir, "", path_filter, symlinks, {(root_stat.st_dev, root_stat.st_ino)}
+    )
+
+
+def _walk(
+    directory: str,
+    prefix: str,
+    path_filter: PathFilter,
+    symlinks: str,
+    ancestors: set[tuple[int, int]],
+) -> Iterator[tuple[str, os.stat_result]]:
+    with os.scandir(directory) as it:
+        entries = sorted(it, key=lambda entry: entry.name)
+    for entry in entries:
+        relative = prefix + entry.name
+        if entry.is_symlink() and _skip_symlink(entry, symlinks):
+            continue
+        is_dir = entry.is_dir()
+        if path_filter.excluded(relative, is_dir):
+            continue
+        try:
+            if is_dir:
+                stat = entry.stat()
+                node = (stat.st_dev, stat.st_ino)
+                if node in ancestors:
+                    continue  # a link back to a directory being walked
+                yield from _walk(
+                    entry.path,
+                    relative + "/",
+                    path_filter,
+                    symlinks,
+                    ancestors | {node},
+                )
+            elif entry.is_file() and path_filter.included(relative):
+                yield entry.path, entry.stat()
+        except FileNotFoundError:
+            continue  # removed during the walk
+
+
+def _skip_symlink(entry: os.DirEntry, symlinks: str) -> bool:
+    if symlinks == "error":
+        raise InvalidCrateError(f"'{entry.path}' is a symbolic link")
+    return symlinks == "skip"
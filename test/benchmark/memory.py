@@ -0,0 +1,209 @@
+"""
+    Memory benchmark for the conversion and deposit (--no-upload) paths.
+
+    Runs converter.convert and deposit.deposit under tracemalloc on synthetic crates of
+    increasing size, and reports peak memory, allocations per entity and the top
+    allocation sites. Budgets for memory per entity are stored in memory_budgets.json
+    and checked by test_memory_budgets.py.
+
+    Usage: python -m test.benchmark.memory [--sizes N [N ...]] [--top N]
+"""
+
+from __future__ import annotations
+
+import argparse
+import contextlib
+import json
+import os
+import tempfile
+import tracemalloc
+
+from rocrate_inveniordm import deposit
+from rocrate_inveniordm.mapping import converter
+
+BUDGETS_FILE = os.path.join(os.path.dirname(__file__), "memory_budgets.json")
+DEFAULT_SIZES = [100, 1000, 5000]
+
+
+def make_crate(n: int) -> dict:
+    """Create RO-Crate metadata with roughly n entities: authors with a shared
+    affiliation, files, and keywords on the root."""
+    authors: list[dict] = []
+    parts: list[dict] = []
+    rde = {
+        "@id": "./",
+        "@type": "Dataset",
+        "name": "Synthetic crate",
+        "description": "Synthetic crate for memory benchmarks",
+        "datePublished": "2024-01-01",
+        "license": {"@id": "https://spdx.org/licenses/CC-BY-4.0"},
+        "keywords": [f"keyword {i}" for i in range(n // 10)],
+        "author": authors,
+        "hasPart": parts,
+    }
+    graph: list[dict] = [
+        {
+            "@id": "ro-crate-metadata.json",
+            "@type": "CreativeWork",
+            "conformsTo": {"@id": "https://w3id.org/ro/crate/1.1"},
+            "about": {"@id": "./"},
+        },
+        rde,
+        {
+            "@id": "https://spdx.org/licenses/CC-BY-4.0",
+            "@type": "CreativeWork",
+            "name": "CC BY 4.0",
+        },
+        {"@id": "https://ror.org/0abcdef00", "@type": "Organization", "name": "Uni"},
+    ]
+    n_authors = max(1, n // 2)
+    for i in range(n_authors):
+        author_id = f"https://orcid.org/0000-0000-{i // 10000:04}-{i % 10000:04}"
+        authors.append({"@id": author_id})
+        graph.append(
+            {
+                "@id": author_id,
+                "@type": "Person",
+                "givenName": f"Given {i}",
+                "familyName": f"Family {i}",
+                "affiliation": {"@id": "https://ror.org/0abcdef00"},
+            }
+        )
+    for i in range(n - n_authors):
+        parts.append({"@id": f"file-{i}.txt"})
+        graph.append(
+            {"@id": f"file-{i}.txt", "@type": "File", "encodingFormat": "text/plain"}
+        )
+    return {"@context": "https://w3id.org/ro/crate/1.1/context", "@graph": graph}
+
+
+def write_crate(rc: dict, crate_dir: str):
+    """Write RO-Crate metadata, and an empty file for every File entity, to a
+    directory."""
+    with open(os.path.join(crate_dir, "ro-crate-metadata.json"), "w") as f:
+        json.dump(rc, f)
+    for entity in rc["@graph"]:
+        if entity.get("@type") == "File":
+            open(os.path.join(crate_dir, entity["@id"]), "w").close()
+
+
+def measure(func, n_entities: int, top: int = 10) -> dict:
+    """Run func under tracemalloc and summarise its memory use.
+
+    :param func: Callable to measure, taking no arguments
+    :param n_entities: Number of entities in the crate, used for per-entity figures
+    :param top: Number of allocation sites to report
+    :return: Dictionary with peak bytes, allocations per entity and top sites
+    """
+    tracemalloc.start()
+    try:
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            result = func()
+        _, peak = tracemalloc.get_traced_memory()
+        # taken while the result is still referenced, so it shows retained memory
+        snapshot = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+    del result
+
+    snapshot = snapshot.filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)])
+    stats = snapshot.statistics("lineno")
+    allocations = sum(stat.count for stat in stats)
+    return {
+        "entities": n_entities,
+        "peak_bytes": peak,
+        "peak_bytes_per_entity": peak / n_entities,
+        "allocations_per_entity": allocations / n_entities,
+        "top_sites": [
+            {
+                "site": f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+                "bytes": stat.size,
+                "count": stat.count,
+            }
+            for stat in stats[:top]
+        ],
+    }
+
+
+def benchmark_convert(n: int, top: int = 10) -> dict:
+    """Measure converter.convert on a synthetic crate of n entities."""
+    rc = make_crate(n)
+    return measure(lambda: converter.convert(rc), len(rc["@graph"]), top)
+
+
+def benchmark_deposit(n: int, top: int = 10) -> dict:
+    """Measure deposit.deposit with no_upload on a synthetic crate of n entities,
+    written to a temporary directory."""
+    rc = make_crate(n)
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        crate_dir = os.path.join(tmp, "crate")
+        os.mkdir(crate_dir)
+        write_crate(rc, crate_dir)
+        os.chdir(tmp)  # deposit writes datacite-out.json to the working directory
+        try:
+            return measure(
+                lambda: deposit.deposit(crate_dir, no_upload=True),
+                len(rc["@graph"]),
+                top,
+            )
+        finally:
+            os.chdir(cwd)
+
+
+BENCHMARKS = {"convert": benchmark_convert, "deposit": benchmark_deposit}
+
+
+def load_budgets(file: str = BUDGETS_FILE) -> dict:
+    with open(file) as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Measure memory use of conversion and deposit (--no-upload) on "
+        "synthetic crates of increasing size"
+    )
+    parser.add_argument(
+        "--sizes",
+        help="Crate sizes (number of entities) to benchmark",
+        type=int,
+        nargs="+",
+        default=DEFAULT_SIZES,
+    )
+    parser.add_argument(
+        "--top", help="Number of allocation sites to report", type=int, default=10
+    )
+    parser.add_argument(
+        "--json", help="Write the full results to this file", type=str, default=None
+    )
+    args = parser.parse_args()
+
+    budgets = load_budgets()
+    results: dict[str, list] = {}
+    for name, benchmark in BENCHMARKS.items():
+        results[name] = []
+        budget = budgets[name]["peak_bytes_per_entity"]
+        print(f"{name} (budget {budget:.0f} peak bytes/entity)")
+        for n in args.sizes:
+            result = benchmark(n, args.top)
+            results[name].append(result)
+            print(
+                f"  {result['entities']:>8} entities: "
+                f"peak {result['peak_bytes'] / 1024 ** 2:8.2f} MiB, "
+                f"{result['peak_bytes_per_entity']:8.0f} B/entity, "
+                f"{result['allocations_per_entity']:6.1f} allocations/entity"
+            )
+        print("  top allocation sites (largest crate):")
+        for site in results[name][-1]["top_sites"]:
+            print(
+                f"    {site['bytes'] / 1024:10.1f} KiB {site['count']:>8} {site['site']}"
+            )
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,22 @@
+import pytest
+
+from test.benchmark.memory import BENCHMARKS, load_budgets
+
+BUDGETS = load_budgets()
+
+
+@pytest.mark.parametrize("name", [*BENCHMARKS])
+def test_peak_memory_per_entity_within_budget(name, tmp_path, monkeypatch):
+    # Arrange
+    monkeypatch.chdir(tmp_path)
+    budget = BUDGETS[name]["peak_bytes_per_entity"]
+
+    # Act
+    result = BENCHMARKS[name](BUDGETS["size"], top=5)
+
+    # Assert
+    sites = "\n".join(f"{s['bytes']:>10} B {s['site']}" for s in result["top_sites"])
+    assert result["peak_bytes_per_entity"] <= budget, (
+        f"{name} used {result['peak_bytes_per_entity']:.0f} peak bytes per entity, "
+        f"over the budget of {budget}. Top allocation sites:\n{sites}"
+    )
@@ -3,11 +3,13 @@ import hashlib
 import os
 import pytest
 import pathlib
+import pstats
 import re
 import requests
 import shutil
 from subprocess import check_output, CalledProcessError, STDOUT
 
+from rocrate_inveniordm.upload.zipstream import ZipStream
 from test.unit.utils import get_request_headers, fetch_inveniordm_record
 
 CRATES = ["minimal-ro-crate", "test-ro-crate", "real-world-example", "utf-8-csv-crate"]
@@ -130,7 +132,7 @@ def test_cli__zip():
     # Arrange
     crate_name = "test-ro-crate"
     crate_path = os.path.join(TEST_DATA_FOLDER, crate_name)
-    expected_log_pattern_1 = "Creating zipped crate"
+    expected_log_pattern_1 = "Streaming zipped crate"
     expected_log_pattern_2 = r"^Successfully created record (?P<id>[0-9]*)$"
 
     # Act
@@ -140,9 +142,6 @@ def test_cli__zip():
     )
     match = re.search(expected_log_pattern_2, log, flags=re.MULTILINE)
     record_id = match.group("id")
-    shutil.copyfile(
-        f"{crate_name}.zip", os.path.join(TEST_OUTPUT_FOLDER, f"{crate_name}.zip")
-    )
 
     record = fetch_inveniordm_record(record_id)
 
@@ -152,8 +151,9 @@ def test_cli__zip():
     # check filename
     result_zip = record["files"][0]
     assert result_zip["filename"] == f"{crate_name}.zip"
-    # check MD5 checksum
-    with open(f"{crate_name}.zip", "rb") as local_file:
+    # check MD5 checksum of the same archive generated locally
+    stream = ZipStream.from_directory(f"{crate_name}.zip", crate_path)
+    with stream.open() as local_file:
         local_checksum = hashlib.md5(local_file.read()).hexdigest()
     assert result_zip["checksum"] == local_checksum
 
@@ -245,3 +245,50 @@ def test_cli__publish():
     # Assert
     assert record["state"] == "done"
     assert record["submitted"] is True
+
+
+def test_cli__profile():
+    """Test writing cProfile and sampling profiler output for a deposit."""
+    # Arrange
+    crate_path = os.path.join(TEST_DATA_FOLDER, "minimal-ro-crate")
+    pstats_path = os.path.join(TEST_OUTPUT_FOLDER, "profile-minimal-ro-crate.pstats")
+    folded_path = os.path.join(TEST_OUTPUT_FOLDER, "profile-minimal-ro-crate.folded")
+
+    # Act
+    # note - check_output raises CalledProcessError if exit code is non-zero
+    log = check_output(
+        f"rocrate_inveniordm {crate_path} --no-upload --profile {pstats_path} "
+        f"--profile-sample {folded_path} --profile-interval 0.001",
+        shell=True,
+        text=True,
+        stderr=STDOUT,
+    )
+
+    # Assert
+    assert f"Wrote profile to {pstats_path}" in log
+    stats = pstats.Stats(pstats_path)
+    assert any(name == "deposit" for _, _, name in stats.stats)  # type: ignore
+    assert os.path.exists(folded_path)
+
+
+def test_cli__trace():
+    """Test writing a Trace Event Format timeline of a deposit."""
+    # Arrange
+    crate_path = os.path.join(TEST_DATA_FOLDER, "test-ro-crate")
+    trace_path = os.path.join(TEST_OUTPUT_FOLDER, "trace-test-ro-crate.json")
+
+    # Act
+    # note - check_output raises CalledProcessError if exit code is non-zero
+    log = check_output(
+        f"rocrate_inveniordm {crate_path} --no-upload --trace {trace_path}",
+        shell=True,
+        text=True,
+        stderr=STDOUT,
+    )
+
+    # Assert
+    assert f"Wrote trace to {trace_path}" in log
+    with open(trace_path) as f:
+        trace = json.load(f)
+    names = {event["name"] for event in trace["traceEvents"]}
+    assert {"walk", "load metadata", "convert", "creators_mapping"} <= names
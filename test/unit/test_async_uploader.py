@@ -0,0 +1,266 @@
+import asyncio
+import hashlib
+import json
+import os
+from unittest import mock
+
+import pytest
+
+aiohttp = pytest.importorskip("aiohttp")
+from aiohttp import web  # noqa: E402
+from aiohttp.test_utils import TestServer  # noqa: E402
+
+import rocrate_inveniordm.upload.async_uploader as async_uploader  # noqa: E402
+from rocrate_inveniordm.exceptions import FilesUploadError  # noqa: E402
+
+
+def make_app(received, fail_file=None, delay=0.0, throttle=0, corrupt_file=None):
+    """A minimal InvenioRDM API which records what it receives. Rejects the content
+    of fail_file, and rate-limits the first `throttle` content uploads."""
+    active = [0]
+    throttled = [0]
+
+    @web.middleware
+    async def record_authorization(request, handler):
+        received.setdefault("authorization", set()).add(
+            request.headers.get("Authorization")
+        )
+        return await handler(request)
+
+    async def create_record(request):
+        received["metadata"] = await request.json()
+        return web.json_response({"id": "abc-123"}, status=201)
+
+    async def init_files(request):
+        received["keys"] = [entry["key"] for entry in await request.json()]
+        return web.json_response({}, status=201)
+
+    async def upload_content(request):
+        name = request.match_info["name"]
+        active[0] += 1
+        received["max_active"] = max(received.get("max_active", 0), active[0])
+        body = await request.read()
+        await asyncio.sleep(delay)
+        active[0] -= 1
+        if name == fail_file:
+            return web.json_response({"message": "boom"}, status=400)
+        if throttled[0] < throttle:
+            throttled[0] += 1
+            return web.json_response({}, status=429, headers={"Retry-After": "0"})
+        received.setdefault("content", {})[name] = body
+        return web.json_response({}, status=200)
+
+    async def commit_file(request):
+        name = request.match_info["name"]
+        received.setdefault("committed", []).append(name)
+        content = b"corrupt" if name == corrupt_file else received["content"][name]
+        checksum = f"md5:{hashlib.md5(content).hexdigest()}"
+        return web.json_response({"checksum": checksum}, status=200)
+
+    async def publish(request):
+        received["published"] = True
+        return web.json_response({}, status=202)
+
+    app = web.Application(
+        client_max_size=16 * 1024 * 1024, middlewares=[record_authorization]
+    )
+    files = "/api/records/{id}/draft/files"
+    app.router.add_post("/api/records", create_record)
+    app.router.add_post(files, init_files)
+    app.router.add_put(files + "/{name}/content", upload_content)
+    app.router.add_post(files + "/{name}/commit", commit_file)
+    app.router.add_post("/api/records/{id}/draft/actions/publish", publish)
+    return app
+
+
+def run_deposit(app, *args, **kwargs):
+    async def main():
+        async with TestServer(app) as server:
+            env = {
+                "INVENIORDM_BASE_URL": str(server.make_url("")).rstrip("/"),
+                "INVENIORDM_API_KEY": "test-key",
+            }
+            with mock.patch.dict(os.environ, env):
+                return await async_uploader.deposit(*args, **kwargs)
+
+    return asyncio.run(main())
+
+
+def write_files(tmp_path, count, size=10):
+    files = []
+    for i in range(count):
+        path = tmp_path / f"file-{i}.bin"
+        path.write_bytes(bytes([i]) * size)
+        files.append(str(path))
+    return files
+
+
+def test_deposit(tmp_path):
+    files = write_files(tmp_path, 3, size=3 * async_uploader.CHUNK_SIZE // 2)
+    received = {}
+
+    record_id = run_deposit(make_app(received), {"title": "x"}, files, publish=True)
+
+    assert record_id == "abc-123"
+    assert received["metadata"] == {"title": "x"}
+    assert received["keys"] == [os.path.basename(f) for f in files]
+    for file in files:
+        with open(file, "rb") as f:
+            assert received["content"][os.path.basename(file)] == f.read()
+    assert sorted(received["committed"]) == sorted(received["keys"])
+    assert received["published"]
+
+
+def test_deposit__reads_credentials_once(tmp_path):
+    files = write_files(tmp_path, 3)
+    received = {}
+
+    with mock.patch.object(
+        async_uploader.credentials,
+        "get_api_key",
+        wraps=async_uploader.credentials.get_api_key,
+    ) as get_api_key, mock.patch.object(
+        async_uploader.credentials,
+        "get_repository_base_url",
+        wraps=async_uploader.credentials.get_repository_base_url,
+    ) as get_base_url:
+        run_deposit(make_app(received), {"title": "x"}, files, publish=True)
+
+    assert get_api_key.call_count == 1
+    assert get_base_url.call_count == 1
+    assert received["authorization"] == {"Bearer test-key"}
+
+
+def test_deposit__traces_each_upload_on_its_own_track(tmp_path):
+    files = write_files(tmp_path, 3)
+    path = tmp_path / "trace.json"
+
+    with async_uploader.tracing.tracing(str(path)):
+        run_deposit(make_app({}, delay=0.05), {"title": "x"}, files, concurrency=3)
+
+    events = json.loads(path.read_text())["traceEvents"]
+    tracks = {
+        e["args"]["file"]: e["tid"]
+        for e in events
+        if e["name"] == "upload_file content"
+    }
+    assert len(set(tracks.values())) == 3
+    names = {e["args"]["name"] for e in events if e["name"] == "thread_name"}
+    assert {f"upload {name}" for name in tracks} <= names
+
+
+def test_deposit__max_bandwidth(tmp_path):
+    files = write_files(tmp_path, 2, size=3 * async_uploader.CHUNK_SIZE // 2)
+    bucket = mock.Mock(spec=async_uploader.throttle.TokenBucket)
+    bucket.reserve.return_value = 0.0
+
+    run_deposit(make_app({}), {"title": "x"}, files, max_bandwidth=bucket)
+
+    assert sum(call.args[0] for call in bucket.reserve.call_args_list) == sum(
+        os.path.getsize(file) for file in files
+    )
+
+
+def test_deposit__bounded_concurrency(tmp_path):
+    files = write_files(tmp_path, 8)
+    received = {}
+
+    run_deposit(make_app(received, delay=0.05), {}, files, concurrency=3)
+
+    assert received["max_active"] == 3
+    assert "published" not in received
+
+
+def test_deposit__raises_on_failure(tmp_path, capsys):
+    files = write_files(tmp_path, 4)
+    received = {}
+    app = make_app(received, fail_file="file-1.bin")
+
+    with pytest.raises(FilesUploadError) as excinfo:
+        run_deposit(app, {}, files, concurrency=1)
+
+    error = excinfo.value.results[1].error
+    assert error.startswith("ClientError('Could not upload file content: 400")
+    out = capsys.readouterr().out
+    assert "Upload summary:" in out
+    assert "1 uploaded, 1 failed, 2 cancelled" in out
+    assert "published" not in received
+
+
+def test_deposit__retries_throttled_uploads(tmp_path, capsys):
+    files = write_files(tmp_path, 2, size=3 * async_uploader.CHUNK_SIZE // 2)
+    received = {}
+    retries_before = async_uploader.metrics.RETRIES.labels("content").value
+
+    with mock.patch("random.uniform", return_value=0.0):
+        run_deposit(make_app(received, throttle=3), {}, files, concurrency=1)
+
+    for file in files:
+        with open(file, "rb") as f:
+            assert received["content"][os.path.basename(file)] == f.read()
+    assert async_uploader.metrics.RETRIES.labels("content").value == retries_before + 3
+    assert "3 retries" in capsys.readouterr().out
+
+
+def test_deposit__checksum_mismatch(tmp_path):
+    files = write_files(tmp_path, 2)
+    app = make_app({}, corrupt_file="file-0.bin")
+
+    with pytest.raises(FilesUploadError) as excinfo:
+        run_deposit(app, {}, files, concurrency=1)
+
+    assert excinfo.value.results[0].error.startswith("ChecksumMismatchError(")
+
+
+def test_read_chunks(tmp_path):
+    path = tmp_path / "data.bin"
+    path.write_bytes(b"abcdefghij")
+
+    async def collect():
+        return [chunk async for chunk in async_uploader.read_chunks(path, 4)]
+
+    assert asyncio.run(collect()) == [b"abcd", b"efgh", b"ij"]
+
+
+def test_open_session__without_aiohttp():
+    with mock.patch.object(async_uploader, "aiohttp", None):
+        with pytest.raises(ImportError, match=r"rocrate-inveniordm\[async\]"):
+            async_uploader.open_session()
+
+
+def test_open_session__timeout():
+    async def main():
+        session = async_uploader.open_session(timeout=(5.0, 60.0), api_key="key")
+        async with session:
+            return session.timeout
+
+    timeout = asyncio.run(main())
+
+    assert timeout.total is None
+    assert (timeout.sock_connect, timeout.sock_read) == (5.0, 60.0)
+
+
+def test_send_request__records_metrics():
+    received = {}
+
+    async def main():
+        async with TestServer(make_app(received)) as server:
+            async with async_uploader.open_session(api_key="key") as session:
+                return await async_uploader.send_request(
+                    session,
+                    "POST",
+                    str(server.make_url("/api/records")),
+                    "create_draft_record",
+                    "records",
+                    data=json.dumps({}),
+                    headers={"Content-Type": "application/json"},
+                )
+
+    counter = async_uploader.metrics.RESPONSES.labels("records", "201")
+    before = counter.value
+    status, text, retries = asyncio.run(main())
+
+    assert status == 201
+    assert json.loads(text) == {"id": "abc-123"}
+    assert retries == 0
+    assert counter.value == before + 1
@@ -0,0 +1,106 @@
+import os
+import zipfile
+
+from rocrate_inveniordm.upload import bundling, sources
+from test.unit.utils import make_crate
+
+
+def test_plan_bundles(tmp_path):
+    crate_dir, files = make_crate(
+        tmp_path,
+        {
+            "ro-crate-metadata.json": 10,
+            "big.bin": 1000,
+            "a/1.txt": 40,
+            "a/2.txt": 40,
+            "a/3.txt": 40,
+            "b/1.txt": 10,
+        },
+    )
+
+    individual, bundles = bundling.plan_bundles(
+        crate_dir, files, threshold=100, max_bundle_size=100
+    )
+
+    assert individual == files[:2]
+    assert [(b.name, b.files, b.size) for b in bundles] == [
+        ("bundle-0001.zip", ["a/1.txt", "a/2.txt"], 80),
+        ("bundle-0002.zip", ["a/3.txt", "b/1.txt"], 50),
+    ]
+
+
+def test_plan_bundles__by_directory(tmp_path):
+    crate_dir, files = make_crate(tmp_path, {"a/1.txt": 1, "a/2.txt": 1, "b/1.txt": 1})
+
+    _, bundles = bundling.plan_bundles(crate_dir, files, 100, by_directory=True)
+
+    assert [b.files for b in bundles] == [["a/1.txt", "a/2.txt"], ["b/1.txt"]]
+
+
+def test_plan_bundles__given_stats(tmp_path):
+    crate_dir, files = make_crate(tmp_path, {"a.txt": 1, "b.txt": 1})
+    stats = {files[0]: sources.FileStat(1000, 0), files[1]: sources.FileStat(1, 0)}
+
+    individual, bundles = bundling.plan_bundles(crate_dir, files, 100, stats=stats)
+
+    assert individual == files[:1]
+    assert [b.files for b in bundles] == [["b.txt"]]
+
+
+def test_plan_bundles__by_directory_nested(tmp_path):
+    crate_dir, files = make_crate(
+        tmp_path, {"a/b.txt": 1, "a/c/d.txt": 1, "a/e.txt": 1, "a/c/f.txt": 1}
+    )
+
+    _, bundles = bundling.plan_bundles(crate_dir, files, 100, by_directory=True)
+
+    assert [b.files for b in bundles] == [
+        ["a/b.txt", "a/e.txt"],
+        ["a/c/d.txt", "a/c/f.txt"],
+    ]
+
+
+def test_plan_bundles__name_taken(tmp_path):
+    crate_dir, files = make_crate(
+        tmp_path, {"data/bundle-0001.zip": 1000, "a.txt": 1, "b.txt": 1}
+    )
+
+    _, bundles = bundling.plan_bundles(crate_dir, files, 100, max_bundle_size=1)
+
+    assert [b.name for b in bundles] == ["bundle-0002.zip", "bundle-0003.zip"]
+
+
+def test_write_bundles(tmp_path):
+    crate_dir, files = make_crate(tmp_path, {"a/1.txt": 1, "2.txt": 2})
+    _, bundles = bundling.plan_bundles(crate_dir, files, 100)
+
+    with bundling.write_bundles(bundles, crate_dir) as paths:
+        assert [os.path.basename(path) for path in paths] == ["bundle-0001.zip"]
+        with zipfile.ZipFile(paths[0]) as archive:
+            assert archive.namelist() == ["2.txt", "a/1.txt"]
+            assert archive.read("a/1.txt") == b"x"
+
+    assert not os.path.exists(paths[0])
+
+
+def test_describe_bundles():
+    metadata = {
+        "metadata": {
+            "additional_descriptions": [
+                {"description": "Other", "type": {"id": "other"}},
+                {"description": f"{bundling.DESCRIPTION_HEADING}<ul></ul>"},
+            ]
+        }
+    }
+    bundles = [bundling.Bundle("bundle-0001.zip", ["a/<1>.txt", "b.txt"], 3)]
+
+    bundling.describe_bundles(metadata, bundles)
+
+    assert metadata["metadata"]["additional_descriptions"] == [
+        {"description": "Other", "type": {"id": "other"}},
+        {
+            "description": f"{bundling.DESCRIPTION_HEADING}<ul>"
+            "<li>bundle-0001.zip: a/&lt;1&gt;.txt, b.txt</li></ul>",
+            "type": bundling.DESCRIPTION_TYPE,
+        },
+    ]
@@ -0,0 +1,62 @@
+import hashlib
+import io
+
+import pytest
+import requests
+
+from rocrate_inveniordm.upload import checksum
+
+
+def test_hashing_reader():
+    reader = checksum.HashingReader(io.BytesIO(b"hello world"), ("md5", "sha256"))
+
+    assert b"".join(reader) == b"hello world"
+    assert reader.hexdigests() == {
+        "md5": hashlib.md5(b"hello world").hexdigest(),
+        "sha256": hashlib.sha256(b"hello world").hexdigest(),
+    }
+
+
+def test_hashing_reader__rewind_restarts_hashes():
+    reader = checksum.HashingReader(io.BytesIO(b"hello world"))
+    reader.read(5)
+
+    reader.seek(0)
+    reader.read()
+
+    assert reader.hexdigests() == {"md5": hashlib.md5(b"hello world").hexdigest()}
+
+
+def test_hashing_reader__seek_elsewhere():
+    reader = checksum.HashingReader(io.BytesIO(b"hello world"))
+
+    with pytest.raises(ValueError):
+        reader.seek(3)
+
+
+def test_hashing_reader__content_length():
+    file = io.BytesIO(b"hello world")
+    reader = checksum.HashingReader(file)
+
+    # requests takes the length of the body without reading from it
+    assert requests.utils.super_len(reader) == 11
+    assert file.tell() == 0
+    reader.read(5)
+    assert requests.utils.super_len(reader) == 6
+
+
+@pytest.mark.parametrize(
+    "server_checksum,expected",
+    [
+        ("md5:5eb63bbbe01eeed093cb22bb8f5acdc3", True),
+        ("md5:5EB63BBBE01EEED093CB22BB8F5ACDC3", True),
+        ("md5:00000000000000000000000000000000", False),
+        ("sha1:0000", True),
+        (None, True),
+        ("", True),
+    ],
+)
+def test_matches(server_checksum, expected):
+    digests = {"md5": hashlib.md5(b"hello world").hexdigest()}
+
+    assert checksum.matches(server_checksum, digests) is expected
@@ -0,0 +1,197 @@
+"""Complexity regression tests for the converter.
+
+Each test builds an adversarial crate at two sizes and checks that conversion time
+grows within a declared bound when the crate is made SCALE times larger. A linear
+algorithm should grow by roughly SCALE; the bounds leave headroom for timer noise while
+still catching quadratic behaviour (SCALE ** 2).
+"""
+
+import contextlib
+import os
+import threading
+import time
+
+import pytest
+
+from rocrate_inveniordm.mapping.converter import convert
+
+SCALE = 4
+LINEAR_BOUND = SCALE * 2.5
+REPEATS = 3
+CYCLE_TIMEOUT = 10  # seconds
+
+
+def base_crate():
+    rde = {
+        "@id": "./",
+        "@type": "Dataset",
+        "name": "Adversarial crate",
+        "datePublished": "2024-01-01",
+    }
+    rc = {
+        "@context": "https://w3id.org/ro/crate/1.1/context",
+        "@graph": [
+            {
+                "@id": "ro-crate-metadata.json",
+                "@type": "CreativeWork",
+                "about": {"@id": "./"},
+            },
+            rde,
+        ],
+    }
+    return rc, rde
+
+
+def many_authors_crate(n):
+    """n authors sharing one affiliation, all referenced from the root."""
+    rc, rde = base_crate()
+    rde["author"] = [
+        {"@id": f"https://orcid.org/0000-0000-0000-{i:04}"} for i in range(n)
+    ]
+    for ref in rde["author"]:
+        rc["@graph"].append(
+            {
+                "@id": ref["@id"],
+                "@type": "Person",
+                "givenName": "Given",
+                "familyName": "Family",
+                "affiliation": {"@id": "https://ror.org/0abcdef00"},
+            }
+        )
+    rc["@graph"].append(
+        {"@id": "https://ror.org/0abcdef00", "@type": "Organization", "name": "Uni"}
+    )
+    return rc
+
+
+def many_identifiers_crate(n):
+    """A single author with n identifier entities."""
+    rc, rde = base_crate()
+    identifiers = [{"@id": f"#identifier-{i}"} for i in range(n)]
+    rde["author"] = {"@id": "#author"}
+    rc["@graph"].append(
+        {"@id": "#author", "@type": "Person", "name": "A", "identifier": identifiers}
+    )
+    for ref in identifiers:
+        rc["@graph"].append(
+            {"@id": ref["@id"], "@type": "PropertyValue", "value": ref["@id"]}
+        )
+    return rc
+
+
+def wide_graph_crate(n):
+    """n entities in the @graph that are never referenced."""
+    rc, rde = base_crate()
+    rde["hasPart"] = [{"@id": f"file-{i}.txt"} for i in range(n)]
+    for ref in rde["hasPart"]:
+        rc["@graph"].append(
+            {"@id": ref["@id"], "@type": "File", "encodingFormat": "text/plain"}
+        )
+    return rc
+
+
+def affiliation_chain_crate(n):
+    """An author whose affiliation starts a chain of n organizations."""
+    rc, rde = base_crate()
+    rde["author"] = {"@id": "#author"}
+    rc["@graph"].append(
+        {"@id": "#author", "@type": "Person", "name": "A", "affiliation": {"@id": "#0"}}
+    )
+    for i in range(n):
+        rc["@graph"].append(
+            {
+                "@id": f"#{i}",
+                "@type": "Organization",
+                "name": f"Organization {i}",
+                "affiliation": {"@id": f"#{i + 1}"},
+            }
+        )
+    return rc
+
+
+def nested_lists_crate(n):
+    """Root properties containing lists nested n levels deep."""
+    rc, rde = base_crate()
+    nested: object = "leaf"
+    for _ in range(n):
+        nested = [nested]
+    rde["keywords"] = ["keyword", nested]
+    rde["temporalCoverage"] = nested
+    rde["author"] = nested
+    return rc
+
+
+def cyclic_crate():
+    """References that form cycles: the root is its own author and publisher, and two
+    organizations are affiliated with each other."""
+    rc, rde = base_crate()
+    rde["author"] = [{"@id": "./"}, {"@id": "#person"}]
+    rde["publisher"] = {"@id": "./"}
+    rc["@graph"] += [
+        {
+            "@id": "#person",
+            "@type": "Person",
+            "name": "P",
+            "affiliation": [{"@id": "#person"}, {"@id": "#a"}],
+        },
+        {
+            "@id": "#a",
+            "@type": "Organization",
+            "name": "A",
+            "affiliation": {"@id": "#b"},
+        },
+        {
+            "@id": "#b",
+            "@type": "Organization",
+            "name": "B",
+            "affiliation": {"@id": "#a"},
+        },
+    ]
+    return rc
+
+
+def time_convert(rc):
+    """Best-of-REPEATS wall time of converting rc, with the converter log discarded."""
+    best = float("inf")
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        for _ in range(REPEATS):
+            start = time.perf_counter()
+            convert(rc)
+            best = min(best, time.perf_counter() - start)
+    return best
+
+
+@pytest.mark.parametrize(
+    "make_crate,n,bound",
+    [
+        (many_authors_crate, 250, LINEAR_BOUND),
+        (many_identifiers_crate, 2500, LINEAR_BOUND),
+        (wide_graph_crate, 2500, LINEAR_BOUND),
+        (affiliation_chain_crate, 2500, LINEAR_BOUND),
+        (nested_lists_crate, 100, LINEAR_BOUND),
+    ],
+)
+def test_conversion_time_growth(make_crate, n, bound):
+    small = time_convert(make_crate(n))
+    large = time_convert(make_crate(n * SCALE))
+
+    assert large / small <= bound, (
+        f"{make_crate.__name__}: {n * SCALE} took {large:.4f}s vs {small:.4f}s for "
+        f"{n}, growth {large / small:.1f} exceeds bound {bound}"
+    )
+
+
+def test_reference_cycles_terminate():
+    result = {}
+
+    def run():
+        result["dc"] = convert(cyclic_crate())
+
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        thread.join(CYCLE_TIMEOUT)
+
+    assert not thread.is_alive(), "conversion did not finish on a cyclic crate"
+    creators = result["dc"]["metadata"]["creators"]
+    assert creators[1]["person_or_org"]["name"] == "P"
@@ -0,0 +1,108 @@
+import threading
+import time
+
+from rocrate_inveniordm.upload.concurrency import AdaptiveLimit
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def complete_window(limit, clock, seconds, size):
+    """Completes as many uploads as the limit, which take seconds in total."""
+    clock.now += seconds
+    for _ in range(limit.limit):
+        limit.record(seconds, size)
+
+
+def test_adaptive_limit__grows_while_throughput_improves():
+    clock = FakeClock()
+    changes = []
+    limit = AdaptiveLimit(2, max_limit=4, on_change=changes.append, clock=clock)
+
+    complete_window(limit, clock, 1.0, 100)  # 200 B/s
+    assert limit.limit == 3
+    complete_window(limit, clock, 1.0, 100)  # 300 B/s
+    assert limit.limit == 4
+    complete_window(limit, clock, 1.0, 100)  # at max_limit
+    assert limit.limit == 4
+    complete_window(limit, clock, 1.0, 50)  # throughput dropped, so hold
+    assert limit.limit == 4
+
+    assert changes == [3, 4]
+    assert limit.history == [(0.0, 2), (1.0, 3), (2.0, 4)]
+
+
+def test_adaptive_limit__cuts_on_latency():
+    clock = FakeClock()
+    limit = AdaptiveLimit(4, max_limit=8, clock=clock)
+
+    complete_window(limit, clock, 1.0, 100)
+    assert limit.limit == 5
+    complete_window(limit, clock, 3.0, 120)
+
+    assert limit.limit == 2
+
+
+def test_adaptive_limit__compares_windows_of_similar_sizes():
+    clock = FakeClock()
+    limit = AdaptiveLimit(2, max_limit=2, clock=clock)
+
+    # windows alternate between large and small files, at the same bandwidth plus
+    # a fixed cost per file
+    for _ in range(3):
+        complete_window(limit, clock, 10.0, 1_000_000)
+        complete_window(limit, clock, 0.1, 100)
+
+    assert limit.limit == 2
+    complete_window(limit, clock, 0.5, 100)
+    assert limit.limit == 1
+
+
+def test_adaptive_limit__throttled_cuts_once_per_window():
+    clock = FakeClock()
+    limit = AdaptiveLimit(8, max_limit=8, clock=clock)
+
+    limit.throttled()
+    limit.throttled()
+    assert limit.limit == 4
+
+    complete_window(limit, clock, 1.0, 100)
+    limit.throttled()
+    assert limit.limit == 2
+
+
+def test_adaptive_limit__min_limit():
+    limit = AdaptiveLimit(1, max_limit=4, clock=FakeClock())
+
+    limit.throttled()
+
+    assert limit.limit == 1
+
+
+def test_adaptive_limit__blocks_beyond_limit():
+    limit = AdaptiveLimit(2, max_limit=2)
+    lock = threading.Lock()
+    active = []
+    max_active = []
+
+    def upload():
+        with limit:
+            with lock:
+                active.append(1)
+                max_active.append(len(active))
+            time.sleep(0.02)
+            with lock:
+                active.pop()
+
+    threads = [threading.Thread(target=upload) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert max(max_active) == 2
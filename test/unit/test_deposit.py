@@ -0,0 +1,216 @@
+import io
+import json
+import os
+import shutil
+import zipfile
+from unittest import mock
+
+import pytest
+
+import rocrate_inveniordm.deposit as deposit
+import rocrate_inveniordm.upload.sources as sources
+from rocrate_inveniordm.exceptions import DepositError, InvalidCrateError, ServerError
+
+
+def test_deposit__not_a_crate(tmp_path):
+    with pytest.raises(InvalidCrateError, match="not a RO-Crate directory"):
+        deposit.deposit(str(tmp_path), no_upload=True)
+
+
+def test_main__exits_on_deposit_error(tmp_path, capsys):
+    error = ServerError("Could not create record", "records", 502, "Bad Gateway")
+
+    with mock.patch("sys.argv", ["rocrate_inveniordm", str(tmp_path)]), mock.patch(
+        "rocrate_inveniordm.deposit.deposit", side_effect=error
+    ):
+        with pytest.raises(SystemExit) as excinfo:
+            deposit.main()
+
+    assert excinfo.value.code == 1
+    assert "Could not create record: 502 Bad Gateway" in capsys.readouterr().out
+
+
+def test_deposit__bundles_small_files(tmp_path):
+    crate_dir = tmp_path / "crate"
+    (crate_dir / "data").mkdir(parents=True)
+    (crate_dir / "ro-crate-metadata.json").write_text("{}")
+    (crate_dir / "data" / "small.txt").write_text("small")
+    (crate_dir / "data" / "big.bin").write_bytes(b"x" * 2048)
+    datacite_file = tmp_path / "datacite.json"
+    datacite_file.write_text('{"metadata": {"title": "Crate"}}')
+    uploaded = {}
+
+    def fake_deposit(metadata, files, **kwargs):
+        uploaded["metadata"] = metadata
+        uploaded["files"] = sorted(os.path.basename(file) for file in files)
+        uploaded["bundle_exists"] = all(os.path.exists(file) for file in files)
+        return "abc-123"
+
+    with mock.patch.object(deposit.uploader, "deposit", side_effect=fake_deposit):
+        deposit.deposit(
+            str(crate_dir), datacite_file=str(datacite_file), bundle_threshold=1024
+        )
+
+    assert uploaded["files"] == ["big.bin", "bundle-0001.zip", "ro-crate-metadata.json"]
+    assert uploaded["bundle_exists"]
+    (description,) = uploaded["metadata"]["metadata"]["additional_descriptions"]
+    assert "bundle-0001.zip: data/small.txt" in description["description"]
+
+
+def test_deposit__compressed_zip(tmp_path):
+    crate_dir = tmp_path / "crate"
+    crate_dir.mkdir()
+    (crate_dir / "ro-crate-metadata.json").write_text("{}" + " " * 1000)
+    datacite_file = tmp_path / "datacite.json"
+    datacite_file.write_text('{"metadata": {"title": "Crate"}}')
+    uploaded = {}
+
+    def fake_deposit(metadata, files, **kwargs):
+        (archive,) = files
+        uploaded["key"] = archive.key
+        with archive.open() as reader, zipfile.ZipFile(io.BytesIO(reader.read())) as z:
+            uploaded["members"] = [(i.filename, i.compress_type) for i in z.infolist()]
+        return "abc-123"
+
+    with mock.patch.object(deposit.uploader, "deposit", side_effect=fake_deposit):
+        deposit.deposit(
+            str(crate_dir),
+            datacite_file=str(datacite_file),
+            use_zip=True,
+            zip_compression_level=6,
+            zip_jobs=1,
+        )
+
+    assert uploaded["key"] == "crate.zip"
+    assert uploaded["members"] == [("ro-crate-metadata.json", zipfile.ZIP_DEFLATED)]
+
+
+def test_deposit__cached_zip(tmp_path):
+    crate_dir = tmp_path / "crate"
+    crate_dir.mkdir()
+    (crate_dir / "ro-crate-metadata.json").write_text("{}")
+    datacite_file = tmp_path / "datacite.json"
+    datacite_file.write_text('{"metadata": {"title": "Crate"}}')
+    cache_dir = tmp_path / "cache"
+    uploaded = []
+
+    def fake_deposit(metadata, files, **kwargs):
+        uploaded.extend(files)
+        return "abc-123"
+
+    with mock.patch.object(deposit.uploader, "deposit", side_effect=fake_deposit):
+        for _ in range(2):
+            deposit.deposit(
+                str(crate_dir),
+                datacite_file=str(datacite_file),
+                use_zip=True,
+                zip_cache=str(cache_dir),
+            )
+
+    first, second = uploaded
+    assert first == second
+    assert first.startswith(str(cache_dir)) and first.endswith("crate.zip")
+    with zipfile.ZipFile(first) as archive:
+        assert archive.namelist() == ["ro-crate-metadata.json"]
+
+
+def test_list_crate_files(tmp_path):
+    for name in [
+        "ro-crate-metadata.json",
+        "ro-crate-preview.html",
+        "data/a.csv",
+        "data/b.txt",
+        ".git/config",
+        ".zenodo.json",
+    ]:
+        path = tmp_path / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(name)
+
+    def listed(*args, **kwargs):
+        files = deposit.list_crate_files(str(tmp_path), *args, **kwargs)
+        return [os.path.relpath(file, tmp_path) for file in files]
+
+    assert listed() == [
+        "data/a.csv",
+        "data/b.txt",
+        "ro-crate-metadata.json",
+        "ro-crate-preview.html",
+    ]
+    assert listed(omit_roc_files=True) == ["data/a.csv", "data/b.txt"]
+    assert listed(include=["*.csv"]) == ["data/a.csv"]
+    assert listed(exclude=["data/", "!.zenodo.json"]) == [
+        ".zenodo.json",
+        "ro-crate-metadata.json",
+        "ro-crate-preview.html",
+    ]
+
+
+def test_list_crate_files__stats_reused(tmp_path):
+    (tmp_path / "a.txt").write_text("data")
+    stats = deposit.list_crate_files(str(tmp_path))
+    path = str(tmp_path / "a.txt")
+    (tmp_path / "a.txt").write_text("changed")
+
+    assert stats[path] == sources.FileStat(4, stats[path].mtime_ns)
+    with mock.patch.object(
+        sources.os, "stat", side_effect=AssertionError("stat called again")
+    ):
+        assert sources.size(path, stats) == 4
+
+    assert sources.size(path) == 7  # not given the walked stats
+
+
+def test_deposit__inventory(tmp_path, monkeypatch):
+    crate_dir = tmp_path / "crate"
+    shutil.copytree("test/data/minimal-ro-crate", crate_dir)
+    (crate_dir / "data.csv").write_text("a,b\n")
+    monkeypatch.chdir(tmp_path)
+
+    deposit.deposit(str(crate_dir), no_upload=True, inventory=True)
+
+    assert os.path.isfile(f"{crate_dir}.inveniordm-inventory")
+    with open(tmp_path / "datacite-out.json") as f:
+        metadata = json.load(f)["metadata"]
+    assert "text/csv" in metadata["formats"]
+    assert metadata["sizes"][0].endswith(" bytes")
+
+
+def test_open_journal(tmp_path):
+    crate_dir = str(tmp_path / "crate")
+
+    with pytest.raises(DepositError, match="no upload journal found"):
+        deposit.open_journal(crate_dir, resume=True)
+
+    journal = deposit.open_journal(crate_dir, resume=False)
+    assert journal.path == crate_dir + ".inveniordm-journal"
+    journal.start("https://example.org", "abc-123")
+
+    journal.close()
+
+    assert deposit.open_journal(crate_dir, resume=True).record_id == "abc-123"
+
+
+def test_open_journal__path(tmp_path):
+    crate_dir = str(tmp_path / "crate")
+    path = str(tmp_path / "journal")
+
+    with deposit.open_journal(crate_dir, resume=False, path=path) as journal:
+        assert os.path.isfile(path)  # created before the draft record
+        journal.start("https://example.org", "abc-123")
+
+    assert deposit.open_journal(crate_dir, True, path).record_id == "abc-123"
+    with pytest.raises(DepositError, match="Cannot create the upload journal"):
+        deposit.open_journal(crate_dir, False, str(tmp_path / "missing" / "journal"))
+
+
+def test_upload_journal__opt_in(tmp_path):
+    crate_dir = str(tmp_path / "crate")
+
+    with deposit.upload_journal(crate_dir, resume=False, keep_journal=False) as journal:
+        assert journal is None
+    assert os.listdir(tmp_path) == []
+
+    with deposit.upload_journal(crate_dir, resume=False, keep_journal=True) as journal:
+        assert journal.path == crate_dir + ".inveniordm-journal"
+    assert os.listdir(tmp_path) == ["crate.inveniordm-journal"]
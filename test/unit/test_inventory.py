@@ -0,0 +1,104 @@
+import hashlib
+import os
+import threading
+from unittest import mock
+
+from rocrate_inveniordm import inventory
+from rocrate_inveniordm.inventory import Inventory
+from test.unit.utils import make_crate
+
+CONTENTS = {"a.csv": b"a,b\n", "b.txt": b"hello"}
+
+
+def test_hash_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(inventory, "READ_SIZE", 3)
+    path = tmp_path / "a.bin"
+    path.write_bytes(b"0123456789")
+
+    assert inventory.hash_file(str(path), ("md5", "sha256")) == {
+        "md5": hashlib.md5(b"0123456789").hexdigest(),
+        "sha256": hashlib.sha256(b"0123456789").hexdigest(),
+    }
+
+
+def test_hash_file__reuses_buffer(tmp_path, monkeypatch):
+    monkeypatch.setattr(inventory, "READ_SIZE", 3)
+    monkeypatch.setattr(inventory, "_buffers", threading.local())
+    _, files = make_crate(tmp_path, CONTENTS)
+
+    with mock.patch.object(inventory, "bytearray", create=True, wraps=bytearray) as new:
+        digests = [inventory.hash_file(file) for file in files]
+
+    assert new.call_count == 1
+    assert digests[1] == {"md5": hashlib.md5(b"hello").hexdigest()}
+
+
+def test_inventory__scan(tmp_path):
+    _, files = make_crate(tmp_path, CONTENTS)
+    file_inventory = Inventory()
+
+    file_inventory.scan(files, jobs=2)
+
+    info = file_inventory.get(files[0])
+    assert (info.size, info.mime_type) == (4, "text/csv")
+    assert info.digests == {"md5": hashlib.md5(b"a,b\n").hexdigest()}
+    assert file_inventory.digests(files[1]) == {
+        "md5": hashlib.md5(b"hello").hexdigest()
+    }
+    assert file_inventory.get(str(tmp_path / "other")) is None
+
+
+def test_inventory__get_changed_file(tmp_path):
+    _, files = make_crate(tmp_path, CONTENTS)
+    file_inventory = Inventory()
+    file_inventory.scan(files)
+
+    with open(files[0], "ab") as f:
+        f.write(b"c,d\n")
+
+    assert file_inventory.get(files[0]) is None
+    assert file_inventory.digests(files[0]) == {}
+
+
+def test_inventory__reuses_saved(tmp_path):
+    _, files = make_crate(tmp_path, CONTENTS)
+    path = inventory.inventory_path(str(tmp_path / "crate"))
+    first = Inventory.load(path)
+    first.scan(files)
+    first.save()
+    os.utime(files[1], ns=(0, 1_000_000_000))
+
+    second = Inventory.load(path)
+    with mock.patch.object(
+        inventory, "hash_file", wraps=inventory.hash_file
+    ) as hash_file:
+        second.scan(files)
+
+    hash_file.assert_called_once_with(files[1], ("md5",))
+    assert second.files[files[0]] == first.files[files[0]]
+    assert second.files[files[1]].mtime_ns == 1_000_000_000
+
+
+def test_inventory__load_unreadable(tmp_path, capsys):
+    path = tmp_path / "crate.inveniordm-inventory"
+    path.write_text("{not json")
+
+    assert Inventory.load(str(path)).files == {}
+    assert "Ignoring the unreadable file inventory" in capsys.readouterr().out
+
+
+def test_inventory__describe(tmp_path):
+    _, files = make_crate(tmp_path, CONTENTS)
+    file_inventory = Inventory()
+    file_inventory.scan(files)
+    metadata = {"metadata": {"formats": ["application/json"]}}
+
+    file_inventory.describe(metadata)
+
+    assert metadata["metadata"] == {
+        "formats": ["application/json"],
+        "sizes": ["9 bytes"],
+    }
+    del metadata["metadata"]["formats"]
+    file_inventory.describe(metadata)
+    assert metadata["metadata"]["formats"] == ["text/csv", "text/plain"]
@@ -0,0 +1,73 @@
+import json
+
+import pytest
+
+from rocrate_inveniordm.upload.journal import Journal, journal_path
+
+
+def test_journal_path():
+    assert journal_path("/data/my-crate/") == "/data/my-crate.inveniordm-journal"
+
+
+def test_journal__replay(tmp_path):
+    path = str(tmp_path / "crate.inveniordm-journal")
+    journal = Journal(path)
+    journal.start("https://example.org", "abc-123")
+    journal.record_initialized(["a.txt", "b.txt"])
+    journal.record_committed("a.txt", "md5:0123")
+    journal.record_published()
+
+    loaded = Journal.load(path)
+
+    assert loaded.base_url == "https://example.org"
+    assert loaded.record_id == "abc-123"
+    assert loaded.initialized == {"a.txt", "b.txt"}
+    assert loaded.committed == {"a.txt": "md5:0123"}
+    assert loaded.published
+
+
+def test_journal__start_replaces_earlier_journal(tmp_path):
+    path = str(tmp_path / "crate.inveniordm-journal")
+    old = Journal(path)
+    old.start("https://example.org", "old-id")
+    old.record_committed("a.txt", None)
+
+    Journal(path).start("https://example.org", "new-id")
+
+    loaded = Journal.load(path)
+    assert loaded.record_id == "new-id"
+    assert loaded.committed == {}
+
+
+def test_journal__truncated_last_line(tmp_path):
+    path = tmp_path / "crate.inveniordm-journal"
+    journal = Journal(str(path))
+    journal.start("https://example.org", "abc-123")
+    journal.record_committed("a.txt", "md5:0123")
+    with open(path, "a") as f:
+        f.write(json.dumps({"event": "committed", "key": "b.txt"})[:20])
+
+    loaded = Journal.load(str(path))
+
+    assert loaded.committed == {"a.txt": "md5:0123"}
+
+
+def test_journal__missing(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        Journal.load(str(tmp_path / "missing"))
+
+
+def test_journal__create(tmp_path):
+    path = tmp_path / "crate.inveniordm-journal"
+    path.write_text(json.dumps({"event": "published"}) + "\n")
+
+    with Journal(str(path)) as journal:
+        journal.create()
+        assert path.read_text() == ""
+        journal.start("https://example.org", "abc-123")
+        journal.record_committed("a.txt", "md5:0123")
+
+    loaded = Journal.load(str(path))
+    assert loaded.record_id == "abc-123"
+    assert loaded.committed == {"a.txt": "md5:0123"}
+    assert not loaded.published
@@ -0,0 +1,146 @@
+import os
+import urllib.request
+from unittest import mock
+
+import pytest
+
+import rocrate_inveniordm.metrics as metrics
+import rocrate_inveniordm.upload.uploader as uploader
+from rocrate_inveniordm.mapping.converter import convert
+from test.unit.utils import load_template_rc
+
+
+def test_counter__render():
+    counter = metrics.Counter("test_total", "A test counter.", ["endpoint", "status"])
+
+    counter.labels("records", "201").inc()
+    counter.labels("records", "201").inc(2)
+    counter.labels("content", '5"0\n0').inc()
+
+    assert counter.render() == (
+        "# HELP test_total A test counter.\n"
+        "# TYPE test_total counter\n"
+        'test_total{endpoint="records",status="201"} 3.0\n'
+        'test_total{endpoint="content",status="5\\"0\\n0"} 1.0\n'
+    )
+
+
+def test_counter__negative():
+    counter = metrics.Counter("test_total", "A test counter.")
+
+    with pytest.raises(ValueError):
+        counter.inc(-1)
+
+
+def test_counter__wrong_labels():
+    counter = metrics.Counter("test_total", "A test counter.", ["endpoint"])
+
+    with pytest.raises(ValueError):
+        counter.labels("records", "201")
+
+
+def test_gauge__render():
+    gauge = metrics.Gauge("test_workers", "A test gauge.")
+
+    gauge.set(4)
+    gauge.set(2)
+
+    assert gauge.render() == (
+        "# HELP test_workers A test gauge.\n"
+        "# TYPE test_workers gauge\n"
+        "test_workers 2.0\n"
+    )
+
+
+def test_histogram__render():
+    histogram = metrics.Histogram("test_seconds", "A test histogram.", buckets=(1, 5))
+
+    histogram.observe(0.5)
+    histogram.observe(3)
+    histogram.observe(10)
+
+    assert histogram.render() == (
+        "# HELP test_seconds A test histogram.\n"
+        "# TYPE test_seconds histogram\n"
+        'test_seconds_bucket{le="1.0"} 1.0\n'
+        'test_seconds_bucket{le="5.0"} 2.0\n'
+        'test_seconds_bucket{le="+Inf"} 3.0\n'
+        "test_seconds_sum 13.5\n"
+        "test_seconds_count 3.0\n"
+    )
+
+
+def test_histogram__labels_keep_buckets():
+    histogram = metrics.Histogram("test_seconds", "Test.", ["endpoint"], buckets=(1,))
+
+    with histogram.labels("records").time():
+        pass
+
+    assert 'test_seconds_bucket{endpoint="records",le="1.0"} 1.0' in histogram.render()
+
+
+def test_registry__duplicate():
+    registry = metrics.Registry()
+    registry.register(metrics.Counter("test_total", "Test."))
+
+    with pytest.raises(ValueError):
+        registry.register(metrics.Counter("test_total", "Test."))
+
+
+def test_write_textfile(tmp_path):
+    registry = metrics.Registry()
+    registry.register(metrics.Counter("test_total", "Test.")).inc()
+    path = tmp_path / "deposit.prom"
+
+    metrics.write_textfile(str(path), registry)
+
+    assert path.read_text() == registry.render()
+    assert os.listdir(tmp_path) == ["deposit.prom"]
+
+
+def test_start_http_server():
+    registry = metrics.Registry()
+    registry.register(metrics.Counter("test_total", "Test.")).inc()
+    server = metrics.start_http_server(0, addr="127.0.0.1", registry=registry)
+
+    try:
+        port = server.server_address[1]
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics") as resp:
+            body = resp.read().decode()
+            content_type = resp.headers["Content-Type"]
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert body == registry.render()
+    assert content_type == metrics.CONTENT_TYPE
+
+
+def test_conversion_seconds():
+    child = metrics.CONVERSION_SECONDS.labels("title_mapping")
+    count_before = sum(child.counts)
+
+    convert(load_template_rc())
+
+    assert sum(child.counts) == count_before + 1
+
+
+@mock.patch.dict(
+    "os.environ",
+    {"INVENIORDM_API_KEY": "test-key", "INVENIORDM_BASE_URL": "https://example.org"},
+)
+def test_upload_file_metrics(tmp_path):
+    file_path = tmp_path / "data.txt"
+    file_path.write_text("data")
+    response = mock.Mock(status_code=200, headers={})
+    response.json.return_value = {}
+    uploaded_before = metrics.UPLOADED_BYTES.value
+    content_before = metrics.RESPONSES.labels("content", "200").value
+    commit_before = sum(metrics.REQUEST_SECONDS.labels("commit").counts)
+
+    with mock.patch.object(uploader.requests.Session, "request", return_value=response):
+        uploader.upload_file("abc-123", str(file_path))
+
+    assert metrics.UPLOADED_BYTES.value == uploaded_before + 4
+    assert metrics.RESPONSES.labels("content", "200").value == content_before + 1
+    assert sum(metrics.REQUEST_SECONDS.labels("commit").counts) == commit_before + 1
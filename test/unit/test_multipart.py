@@ -0,0 +1,38 @@
+import requests
+
+from rocrate_inveniordm.upload import multipart
+
+
+def test_part_count():
+    assert multipart.part_count(10, 5) == 2
+    assert multipart.part_count(11, 5) == 3
+    assert multipart.part_count(0, 5) == 1
+
+
+def test_transfer():
+    assert multipart.transfer(11, 5) == {"type": "M", "parts": 3, "part_size": 5}
+
+
+def test_file_part(tmp_path):
+    path = tmp_path / "data.bin"
+    path.write_bytes(b"0123456789")
+
+    with multipart.FilePart(str(path), 3, 4) as part:
+        assert len(part) == 4
+        assert part.read(3) == b"345"
+        assert part.read() == b"6"
+        assert part.read() == b""
+        assert part.tell() == 4
+        part.seek(0)
+        assert b"".join(part) == b"3456"
+
+
+def test_file_part__content_length(tmp_path):
+    path = tmp_path / "data.bin"
+    path.write_bytes(b"0123456789")
+
+    with multipart.FilePart(str(path), 8, 2) as part:
+        request = requests.Request("PUT", "https://example.org", data=part).prepare()
+
+    assert request.headers["Content-Length"] == "2"
+    assert "Transfer-Encoding" not in request.headers
@@ -0,0 +1,67 @@
+import pstats
+import sys
+import time
+
+import rocrate_inveniordm.profiling as profiling
+
+
+def busy_function():
+    end = time.perf_counter() + 0.2
+    while time.perf_counter() < end:
+        pass
+
+
+def test_cprofile__writes_pstats(tmp_path):
+    path = str(tmp_path / "out.pstats")
+
+    with profiling.cprofile(path):
+        busy_function()
+
+    stats = pstats.Stats(path)
+    functions = [name for _, _, name in stats.stats]  # type: ignore[attr-defined]
+    assert "busy_function" in functions
+
+
+def test_cprofile__writes_pstats_on_exit(tmp_path):
+    path = str(tmp_path / "out.pstats")
+
+    try:
+        with profiling.cprofile(path):
+            raise SystemExit(1)
+    except SystemExit:
+        pass
+
+    assert pstats.Stats(path)
+
+
+def test_sampling_profiler__collapsed_stacks(tmp_path):
+    path = tmp_path / "out.folded"
+
+    with profiling.SamplingProfiler(str(path), interval=0.005):
+        busy_function()
+
+    lines = path.read_text().splitlines()
+    assert lines
+    stack, count = lines[0].rsplit(" ", 1)
+    assert int(count) > 0
+    assert any("test_profiling.py:busy_function" in line for line in lines)
+
+
+def test_sampling_profiler__excludes_sampler_thread(tmp_path):
+    profiler = profiling.SamplingProfiler(str(tmp_path / "out.folded"))
+
+    with profiler:
+        busy_function()
+
+    assert not any("profiling.py:_run" in stack for stack in profiler.samples)
+
+
+def test_collapse_stack():
+    def inner():
+        return profiling.collapse_stack(sys._getframe())
+
+    result = inner()
+
+    assert result.endswith(
+        "test_profiling.py:test_collapse_stack;test_profiling.py:inner"
+    )
@@ -0,0 +1,107 @@
+import io
+import json
+from types import SimpleNamespace
+from unittest import mock
+
+import pytest
+
+from rocrate_inveniordm.upload import progress
+
+
+def test_progress_reader__reports_reads_and_rewinds():
+    counts = []
+    reader = progress.ProgressReader(io.BytesIO(b"hello world"), counts.append)
+
+    assert reader.read(5) == b"hello"
+    reader.seek(0)
+    assert b"".join(reader) == b"hello world"
+
+    assert counts == [5, -5, 11]
+    assert sum(counts) == 11
+
+
+def test_terminal_progress():
+    stream = io.StringIO()
+    display = progress.TerminalProgress(stream, interval=0)
+
+    display.upload_started(
+        ["a.txt", "b.txt"], 4 * 1024 * 1024, [1024 * 1024, 3 * 1024 * 1024]
+    )
+    display.bytes_sent("a.txt", 1024 * 1024)
+    display.file_finished(SimpleNamespace(file="a.txt"))
+
+    assert display.line().startswith("1.0 MiB of 4.0 MiB (25%), 1/2 files, ")
+    assert "ETA" in display.line()
+    display.upload_finished([])
+    assert stream.getvalue().endswith("\n")
+
+
+def test_upload_estimate():
+    files = ["a", "b", "c", "d"]
+    estimate = progress.UploadEstimate()
+
+    estimate.upload_started(files, 1500, [100, 100, 300, 1000])
+    estimate.concurrency_changed(2)
+    assert estimate.remaining_seconds() is None
+    for file, seconds in zip(files[:2], (1.0, 1.0)):
+        estimate.file_started(file, 100)
+        estimate.file_finished(
+            SimpleNamespace(file=file, status="uploaded", size=100, seconds=seconds)
+        )
+
+    # 100 bytes per second, on 2 workers
+    assert estimate.remaining_seconds() == pytest.approx(10.0)
+
+
+def test_terminal_progress__shows_estimate():
+    estimate = mock.Mock(spec=progress.UploadEstimate)
+    estimate.remaining_seconds.return_value = 3725
+    display = progress.TerminalProgress(io.StringIO(), estimate=estimate)
+
+    display.upload_started(["a.txt"], 100, [100])
+
+    assert display.line().endswith(", ETA 1:02:05")
+
+
+def test_format_seconds():
+    assert progress.format_seconds(3725.4) == "1:02:05"
+
+
+def test_upload_report(tmp_path):
+    report = progress.UploadReport()
+    result = SimpleNamespace(
+        file="/crate/a.txt",
+        status="uploaded",
+        size=100,
+        seconds=2.0,
+        retries=1,
+        error=None,
+    )
+
+    report.upload_started([result.file], 100, [100])
+    report.file_started(result.file, 100)
+    report.phase_finished("content", 1.5, result.file)
+    report.phase_finished("commit", 0.5, result.file)
+    report.phase_finished("initialize", 0.25)
+    report.upload_finished([result])
+    report.write(str(tmp_path / "report.json"))
+
+    with open(tmp_path / "report.json") as f:
+        data = json.load(f)
+    assert data["files"] == [
+        {
+            "file": "/crate/a.txt",
+            "key": "a.txt",
+            "status": "uploaded",
+            "size": 100,
+            "seconds": 2.0,
+            "bytes_per_second": 50.0,
+            "retries": 1,
+            "phases": {"content": 1.5, "commit": 0.5},
+            "error": None,
+        }
+    ]
+    assert data["uploaded_files"] == 1
+    assert data["uploaded_bytes"] == 100
+    assert data["retries"] == 1
+    assert data["phases"] == {"initialize": 0.25}
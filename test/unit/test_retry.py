@@ -0,0 +1,84 @@
+import email.utils
+import time
+from unittest import mock
+
+import pytest
+
+from rocrate_inveniordm.upload import retry
+
+
+def test_should_retry():
+    policy = retry.RetryPolicy(max_retries=2)
+
+    assert policy.should_retry(0, 429)
+    assert policy.should_retry(1, 503)
+    assert policy.should_retry(0, None)
+    assert not policy.should_retry(2, 503)
+    assert not policy.should_retry(0, 200)
+    assert not policy.should_retry(0, 400)
+
+
+def test_should_retry__not_processed_only():
+    policy = retry.DEFAULT_RETRY_POLICIES["records"]
+
+    assert policy.should_retry(0, 429)
+    assert not policy.should_retry(0, 502)
+    assert not policy.should_retry(0, None)
+
+
+def test_delay__exponential():
+    policy = retry.RetryPolicy(backoff_factor=0.5, max_backoff=3.0, jitter=False)
+
+    assert [policy.delay(n) for n in range(5)] == [0.5, 1.0, 2.0, 3.0, 3.0]
+
+
+def test_delay__jitter():
+    policy = retry.RetryPolicy(backoff_factor=1.0)
+
+    with mock.patch("random.uniform", return_value=0.25) as uniform:
+        assert policy.delay(2) == 0.25
+
+    uniform.assert_called_once_with(0, 4.0)
+
+
+def test_delay__retry_after():
+    policy = retry.RetryPolicy(jitter=False, max_retry_after=60.0)
+
+    assert policy.delay(0, "10") == 10.0
+    assert policy.delay(0, "3600") == 60.0
+    assert policy.delay(3, "1") == 4.0
+    assert policy.delay(0, "soon") == 0.5
+
+
+@pytest.mark.parametrize("value", [None, "", "soon", "-5"])
+def test_parse_retry_after__invalid(value):
+    assert retry.parse_retry_after(value) is None
+
+
+def test_parse_retry_after__date():
+    value = email.utils.formatdate(time.time() + 30, usegmt=True)
+
+    assert 28 <= retry.parse_retry_after(value) <= 30
+
+
+def test_get_policy():
+    custom = retry.RetryPolicy(max_retries=1)
+
+    assert retry.get_policy("content") == retry.RetryPolicy()
+    assert retry.get_policy("content", default=custom) is custom
+    assert retry.get_policy("records") is retry.DEFAULT_RETRY_POLICIES["records"]
+    assert retry.get_policy("records", {"records": custom}) is custom
+
+
+def test_get_policy__method():
+    custom = retry.RetryPolicy(max_retries=1)
+    not_processed = retry.DEFAULT_RETRY_POLICIES["POST draft/files"]
+
+    assert retry.get_policy("draft/files", method="GET") == retry.RetryPolicy()
+    assert retry.get_policy("draft/files", method="POST") is not_processed
+    assert retry.get_policy("draft/files", method="DELETE") is not_processed
+    assert not not_processed.should_retry(0, 502)
+    assert not not_processed.should_retry(0)  # connection error
+    assert retry.get_policy("draft/files", {"draft/files": custom}, None, "POST") is (
+        custom
+    )
@@ -0,0 +1,40 @@
+import pytest
+
+from rocrate_inveniordm.upload import scheduling
+
+
+def test_schedule__largest_first_with_small_files_interleaved():
+    sizes = [10, 500, 20, 1000, 30, 400, 5]
+
+    order = scheduling.schedule(sizes, workers=2)
+
+    assert [sizes[i] for i in order] == [1000, 500, 400, 5, 30, 10, 20]
+
+
+def test_schedule__keeps_order_of_equal_sizes():
+    assert scheduling.schedule([1, 1, 1], workers=1) == [0, 1, 2]
+    assert scheduling.schedule([], workers=4) == []
+
+
+def test_fit_throughput():
+    # 0.5 s per file, and 100 bytes per second
+    samples = [(100, 1.5), (300, 3.5), (1000, 10.5)]
+
+    throughput, overhead = scheduling.fit_throughput(samples)
+
+    assert throughput == pytest.approx(100)
+    assert overhead == pytest.approx(0.5)
+
+
+def test_fit_throughput__equal_sizes():
+    throughput, overhead = scheduling.fit_throughput([(100, 1.0), (100, 3.0)])
+
+    assert throughput == pytest.approx(50)
+    assert overhead == 0.0
+
+
+def test_makespan():
+    # the 2 s file goes to the free worker, then the 1 s files to whichever is free
+    assert scheduling.makespan([2.0, 1.0, 1.0], workers=2, busy=[1.0]) == 3.0
+    assert scheduling.makespan([4.0, 3.0, 2.0, 2.0, 1.0], workers=2) == 6.0
+    assert scheduling.makespan([], workers=2) == 0.0
@@ -0,0 +1,73 @@
+import threading
+from unittest import mock
+
+import pytest
+
+from rocrate_inveniordm.upload import throttle
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_token_bucket__burst_then_rate():
+    clock = FakeClock()
+    bucket = throttle.TokenBucket(1000, capacity=500, clock=clock)
+
+    assert bucket.reserve(500) == 0
+    assert bucket.reserve(250) == pytest.approx(0.25)
+    clock.now = 1.0
+    # the debt of 250 bytes is paid back, and the bucket refilled up to its capacity
+    assert bucket.reserve(500) == 0
+
+
+def test_token_bucket__chunks_larger_than_capacity():
+    bucket = throttle.TokenBucket(1000, capacity=100, clock=FakeClock())
+
+    assert bucket.reserve(2100) == pytest.approx(2.0)
+
+
+def test_token_bucket__shared_by_threads():
+    bucket = throttle.TokenBucket(1000, capacity=0, clock=FakeClock())
+    waits = []
+    lock = threading.Lock()
+
+    def send():
+        wait = bucket.reserve(100)
+        with lock:
+            waits.append(wait)
+
+    threads = [threading.Thread(target=send) for _ in range(10)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # each sender waits for its turn, so that the total rate stays at 1000 bytes/s
+    assert sorted(waits) == pytest.approx([0.1 * i for i in range(1, 11)])
+
+
+def test_token_bucket__consume_sleeps():
+    bucket = throttle.TokenBucket(1000, capacity=0, clock=FakeClock())
+
+    with mock.patch.object(throttle.time, "sleep") as sleep:
+        bucket.consume(500)
+
+    sleep.assert_called_once_with(pytest.approx(0.5))
+
+
+def test_token_bucket__invalid_rate():
+    with pytest.raises(ValueError):
+        throttle.TokenBucket(0)
+
+
+def test_shared_bucket():
+    bucket = throttle.shared_bucket(1234)
+
+    assert throttle.shared_bucket(1234) is bucket
+    assert throttle.shared_bucket(4321) is not bucket
+    assert bucket.rate == 1234
@@ -0,0 +1,90 @@
+import json
+import threading
+from unittest import mock
+
+import rocrate_inveniordm.tracing as tracing
+import rocrate_inveniordm.upload.uploader as uploader
+from rocrate_inveniordm.mapping.converter import convert
+from test.unit.utils import load_template_rc
+
+
+def test_span__inactive():
+    with tracing.span("phase", cat="test", key="value") as args:
+        args["status"] = 200
+
+    assert tracing._tracer is None
+
+
+def test_tracing__writes_trace_events(tmp_path):
+    path = tmp_path / "trace.json"
+
+    with tracing.tracing(str(path)):
+        with tracing.span("outer", cat="test", key="value") as args:
+            with tracing.span("inner", cat="test"):
+                pass
+            args["status"] = 201
+
+    trace = json.loads(path.read_text())
+    events = {e["name"]: e for e in trace["traceEvents"] if e["ph"] == "X"}
+    assert events["outer"]["args"] == {"key": "value", "status": 201}
+    assert events["outer"]["cat"] == "test"
+    assert events["outer"]["ts"] <= events["inner"]["ts"]
+    assert events["inner"]["ts"] + events["inner"]["dur"] <= (
+        events["outer"]["ts"] + events["outer"]["dur"]
+    )
+    assert tracing._tracer is None
+
+
+def test_tracing__threads(tmp_path):
+    path = tmp_path / "trace.json"
+
+    def work():
+        with tracing.span("work", cat="test"):
+            pass
+
+    with tracing.tracing(str(path)):
+        thread = threading.Thread(target=work, name="worker")
+        thread.start()
+        thread.join()
+        work()
+
+    trace = json.loads(path.read_text())
+    tids = {e["tid"] for e in trace["traceEvents"] if e["name"] == "work"}
+    thread_names = [
+        e["args"]["name"] for e in trace["traceEvents"] if e["name"] == "thread_name"
+    ]
+    assert len(tids) == 2
+    assert "worker" in thread_names
+
+
+def test_tracing__convert_rule_classes(tmp_path):
+    path = tmp_path / "trace.json"
+
+    with tracing.tracing(str(path)):
+        convert(load_template_rc())
+
+    trace = json.loads(path.read_text())
+    names = {e["name"] for e in trace["traceEvents"] if e.get("cat") == "convert"}
+    assert {"creators_mapping", "title_mapping"} <= names
+
+
+@mock.patch.dict(
+    "os.environ",
+    {"INVENIORDM_API_KEY": "test-key", "INVENIORDM_BASE_URL": "https://example.org"},
+)
+def test_tracing__upload_file(tmp_path):
+    path = tmp_path / "trace.json"
+    file_path = tmp_path / "data.txt"
+    file_path.write_text("data")
+    response = mock.Mock(status_code=200, headers={})
+    response.json.return_value = {}
+
+    with tracing.tracing(str(path)), mock.patch.object(
+        uploader.requests.Session, "request", return_value=response
+    ):
+        uploader.upload_file("abc-123", str(file_path))
+
+    trace = json.loads(path.read_text())
+    events = [e for e in trace["traceEvents"] if e.get("cat") == "upload"]
+    assert [e["name"] for e in events] == ["upload_file content", "upload_file commit"]
+    assert events[0]["args"] == {"file": "data.txt", "status": 200}
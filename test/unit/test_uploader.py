@@ -1,7 +1,33 @@
+import hashlib
+import json
 import os
+import socket
+import threading
+import time
 from unittest import mock
 
+import pytest
+import requests
+
+import rocrate_inveniordm.upload.multipart as multipart
+import rocrate_inveniordm.upload.retry as retry
+import rocrate_inveniordm.upload.sources as sources
+import rocrate_inveniordm.upload.throttle as throttle
 import rocrate_inveniordm.upload.uploader as uploader
+from rocrate_inveniordm.exceptions import (
+    AuthenticationError,
+    ChecksumMismatchError,
+    ClientError,
+    FilesUploadError,
+    RepositoryError,
+    ServerError,
+    UploadError,
+)
+from rocrate_inveniordm.inventory import Inventory
+from rocrate_inveniordm.upload.journal import Journal
+from rocrate_inveniordm.upload.progress import UploadObserver, UploadReport
+from rocrate_inveniordm.upload.zipstream import ZipStream
+from test.unit.utils import make_crate
 
 
 @mock.patch.dict(os.environ, {"INVENIORDM_API_KEY": "test-key"})
@@ -16,3 +42,951 @@ def test_get_headers():
     result = uploader.get_headers(input)
 
     assert result == expected
+
+
+def test_upload_files__concurrent(tmp_path):
+    _, files = make_crate(tmp_path, {f"file-{i}.txt": 1 for i in range(8)})
+    lock = threading.Lock()
+    active = []
+    max_active = []
+
+    def fake_upload_file(record_id, file_path, journal=None):
+        with lock:
+            active.append(file_path)
+            max_active.append(len(active))
+        time.sleep(0.05)
+        with lock:
+            active.remove(file_path)
+
+    with mock.patch.object(
+        uploader.InvenioRDMClient, "upload_file", side_effect=fake_upload_file
+    ):
+        client = uploader.InvenioRDMClient("https://example.org", "test-key")
+        results = client.upload_files("abc-123", files, concurrency=4)
+
+    assert [r.file for r in results] == files
+    assert all(r.status == "uploaded" for r in results)
+    assert max(max_active) == 4
+
+
+def test_upload_files__fails_fast(tmp_path):
+    _, files = make_crate(tmp_path, {f"file-{i}.txt": 1 for i in range(20)})
+
+    def fake_upload_file(record_id, file_path, journal=None):
+        if file_path == files[0]:
+            raise RepositoryError("Could not upload file content", "content", 500)
+        time.sleep(0.05)
+
+    with mock.patch.object(
+        uploader.InvenioRDMClient, "upload_file", side_effect=fake_upload_file
+    ):
+        client = uploader.InvenioRDMClient("https://example.org", "test-key")
+        results = client.upload_files("abc-123", files, concurrency=2)
+
+    statuses = [r.status for r in results]
+    assert results[0].status == "failed"
+    assert results[0].error.startswith("RepositoryError(")
+    assert statuses.count("cancelled") >= len(files) - 4
+
+
+@mock.patch.dict(os.environ, {"INVENIORDM_API_KEY": "test-key"})
+def test_upload__raises_on_failure(tmp_path, capsys):
+    _, files = make_crate(tmp_path, {"a.txt": 2, "b.txt": 1})
+
+    def fake_upload_file(record_id, file_path, journal=None):
+        if file_path == files[1]:
+            raise RepositoryError("Could not upload file content", "content", 500)
+
+    client = uploader.InvenioRDMClient("https://example.org", "test-key")
+    with mock.patch.object(
+        client, "create_draft_record", return_value="abc-123"
+    ), mock.patch.object(client, "start_draft_files_upload"), mock.patch.object(
+        client, "upload_file", side_effect=fake_upload_file
+    ):
+        with pytest.raises(FilesUploadError) as excinfo:
+            client.upload({}, files, concurrency=1)
+
+    assert excinfo.value.record_id == "abc-123"
+    assert [r.status for r in excinfo.value.results] == ["uploaded", "failed"]
+
+    out = capsys.readouterr().out
+    assert "Upload summary:" in out
+    assert "1 uploaded, 1 failed" in out
+
+
+def test_client__pooled_session():
+    client = uploader.InvenioRDMClient("https://example.org/", "test-key", pool_size=16)
+
+    adapter = client.session.get_adapter("https://example.org/api/records")
+    assert adapter._pool_maxsize == 16
+    assert client.session.get_adapter("http://example.org") is adapter
+    assert client.session.headers["Connection"] == "keep-alive"
+    assert client.get_headers("application/json")["Authorization"] == (
+        "Bearer test-key"
+    )
+
+
+def test_client__send_request():
+    client = uploader.InvenioRDMClient("https://example.org/", "test-key")
+    response = mock.Mock(status_code=201)
+
+    with mock.patch.object(client.session, "request", return_value=response) as req:
+        assert client.send_request("POST", "/api/records", "x", "records") is response
+
+    req.assert_called_once_with(
+        "POST", "https://example.org/api/records", timeout=uploader.DEFAULT_TIMEOUT
+    )
+
+
+def test_send_request__timeout():
+    # a server which accepts connections but never responds
+    server = socket.socket()
+    server.bind(("127.0.0.1", 0))
+    server.listen()
+    client = uploader.InvenioRDMClient(
+        f"http://127.0.0.1:{server.getsockname()[1]}",
+        "test-key",
+        retry_policy=retry.NO_RETRY,
+        timeout=(1.0, 0.1),
+    )
+
+    with server, client:
+        with pytest.raises(UploadError, match="timed out"):
+            client.send_request("POST", "/api/records", "x", "records")
+
+
+def test_client__without_keep_alive():
+    client = uploader.InvenioRDMClient("https://example.org", "k", keep_alive=False)
+
+    assert client.session.headers["Connection"] == "close"
+
+
+def test_client__several_repositories():
+    first = uploader.InvenioRDMClient("https://a.example.org", "key-a")
+    second = uploader.InvenioRDMClient("https://b.example.org", "key-b")
+
+    assert first.session is not second.session
+    assert first.get_headers("application/json")["Authorization"] == "Bearer key-a"
+    assert second.get_headers("application/json")["Authorization"] == "Bearer key-b"
+
+
+def test_get_default_client():
+    env = {"INVENIORDM_API_KEY": "key-a", "INVENIORDM_BASE_URL": "https://a.org/"}
+    with mock.patch.dict(os.environ, env):
+        client = uploader.get_default_client()
+        assert uploader.get_default_client() is client
+        assert client.base_url == "https://a.org"
+
+    env["INVENIORDM_API_KEY"] = "key-b"
+    with mock.patch.dict(os.environ, env):
+        other = uploader.get_default_client()
+    assert other is not client
+    assert other.api_key == "key-b"
+
+
+@pytest.mark.parametrize(
+    "status,error_class",
+    [
+        (400, ClientError),
+        (401, AuthenticationError),
+        (403, AuthenticationError),
+        (404, ClientError),
+        (500, ServerError),
+        (503, ServerError),
+        (302, RepositoryError),
+    ],
+)
+def test_create_draft_record__raises(status, error_class):
+    client = uploader.InvenioRDMClient(
+        "https://example.org", "test-key", retry_policies={"records": retry.NO_RETRY}
+    )
+    response = mock.Mock(status_code=status, text='{"message": "nope"}')
+
+    with mock.patch.object(client.session, "request", return_value=response):
+        with pytest.raises(error_class) as excinfo:
+            client.create_draft_record({})
+
+    assert type(excinfo.value) is error_class
+    assert excinfo.value.status == status
+    assert excinfo.value.endpoint == "records"
+    assert excinfo.value.body == '{"message": "nope"}'
+    assert (
+        str(excinfo.value) == f'Could not create record: {status} {{"message": "nope"}}'
+    )
+
+
+def test_publish_record__raises():
+    client = uploader.InvenioRDMClient("https://example.org", "test-key")
+    response = mock.Mock(status_code=400, text="invalid")
+
+    with mock.patch.object(client.session, "request", return_value=response):
+        with pytest.raises(ClientError, match="Could not publish record: 400"):
+            client.publish_record("abc-123")
+
+
+def make_response(status, headers=None):
+    return mock.Mock(status_code=status, text="", headers=headers or {})
+
+
+def test_send_request__retries(tmp_path):
+    client = uploader.InvenioRDMClient("https://example.org", "test-key")
+    responses = [
+        make_response(429, {"Retry-After": "7"}),
+        make_response(502),
+        make_response(200),
+    ]
+    retries_before = uploader.metrics.RETRIES.labels("content").value
+    file_path = tmp_path / "data.txt"
+    file_path.write_text("data")
+    bodies = []
+
+    def fake_request(method, url, data=None, **kwargs):
+        bodies.append(data.read())
+        return responses.pop(0)
+
+    with open(file_path, "rb") as f, mock.patch.object(
+        client.session, "request", side_effect=fake_request
+    ), mock.patch.object(uploader.time, "sleep") as sleep:
+        resp = client.send_request("PUT", "/x", "x", "content", data=f)
+
+    assert resp.status_code == 200
+    assert resp.retries == 2
+    assert bodies == [b"data", b"data", b"data"]
+    assert sleep.call_args_list[0] == mock.call(7.0)
+    assert uploader.metrics.RETRIES.labels("content").value == retries_before + 2
+
+
+def test_send_request__connection_error():
+    policy = retry.RetryPolicy(max_retries=2, jitter=False)
+    client = uploader.InvenioRDMClient(
+        "https://example.org", "test-key", retry_policy=policy
+    )
+    error = uploader.requests.ConnectionError("reset")
+
+    with mock.patch.object(
+        client.session, "request", side_effect=error
+    ) as request, mock.patch.object(uploader.time, "sleep") as sleep:
+        with pytest.raises(UploadError, match="reset"):
+            client.send_request("POST", "/x", "x", "commit")
+
+    assert request.call_count == 3
+    assert sleep.call_args_list == [mock.call(0.5), mock.call(1.0)]
+
+
+def test_send_request__create_record_not_retried_on_502():
+    client = uploader.InvenioRDMClient("https://example.org", "test-key")
+
+    with mock.patch.object(
+        client.session, "request", return_value=make_response(502)
+    ) as request:
+        resp = client.send_request("POST", "/api/records", "x", "records")
+
+    assert resp.status_code == 502
+    assert request.call_count == 1
+
+
+@pytest.mark.parametrize(
+    "method,retried", [("POST", False), ("DELETE", False), ("GET", True)]
+)
+def test_send_request__draft_files_retried_if_safe(method, retried):
+    client = uploader.InvenioRDMClient("https://example.org", "test-key")
+    responses = [make_response(502), make_response(200)]
+
+    with mock.patch.object(
+        client.session, "request", side_effect=lambda *args, **kwargs: responses.pop(0)
+    ) as request, mock.patch.object(uploader.time, "sleep"):
+        resp = client.send_request(
+            method, "/api/records/x/draft/files", "x", "draft/files"
+        )
+
+    assert resp.status_code == (200 if retried else 502)
+    assert request.call_count == (2 if retried else 1)
+
+
+def test_print_upload_summary__retries(capsys):
+    results = [
+        uploader.FileUploadResult("a.txt", "uploaded", 1.0, retries=2),
+        uploader.FileUploadResult("b.txt", "uploaded", 1.0),
+    ]
+
+    uploader.print_upload_summary(results)
+
+    out = capsys.readouterr().out
+    assert "a.txt  [2 retries]" in out
+    assert "2 uploaded, 2 retries" in out
+
+
+class FakeRepository:
+    """Routes the requests of an InvenioRDMClient to an in-memory draft record."""
+
+    def __init__(self, entries=None, fail_key=None):
+        self.entries = entries or {}
+        self.fail_key = fail_key
+        self.draft_published = False
+        self.requests = []
+
+    def request(self, method, url, data=None, **kwargs):
+        path = url[len("https://example.org/api/records") :]
+        self.requests.append((method, path))
+        parts = path.strip("/").split("/")
+        key = parts[3] if len(parts) > 3 else None
+        if method == "POST" and path == "":
+            return self.response(201, {"id": "abc-123"})
+        if (
+            method == "GET"
+            and path.endswith("/draft/files")
+            and not self.draft_published
+        ):
+            return self.response(200, {"entries": list(self.entries.values())})
+        if method == "POST" and path.endswith("/draft/files"):
+            for entry in json.loads(data):
+                self.entries[entry["key"]] = {"key": entry["key"], "status": "pending"}
+            return self.response(201, {})
+        if method == "PUT" and key != self.fail_key:
+            content = data.read() if hasattr(data, "read") else b"".join(data)
+            self.entries[key]["size"] = len(content)
+            self.entries[key]["checksum"] = f"md5:{hashlib.md5(content).hexdigest()}"
+            return self.response(200, {})
+        if method == "PUT":
+            return self.response(500, {})
+        if method == "POST" and path.endswith("/commit"):
+            self.entries[key]["status"] = "completed"
+            return self.response(200, {"checksum": self.entries[key].get("checksum")})
+        if method == "DELETE":
+            del self.entries[key]
+            return self.response(204, {})
+        if method == "POST" and path.endswith("/publish"):
+            self.draft_published = True
+            return self.response(202, {})
+        return self.response(404, {})
+
+    @staticmethod
+    def response(status, body):
+        return mock.Mock(
+            status_code=status, text=json.dumps(body), headers={}, json=lambda: body
+        )
+
+
+def test_deposit__resume(tmp_path):
+    # c.txt is the smallest file, so it is uploaded last
+    _, files = make_crate(tmp_path, {"a.txt": 3, "b.txt": 2, "c.txt": 1})
+    journal_file = str(tmp_path / "crate.inveniordm-journal")
+    repository = FakeRepository(fail_key="c.txt")
+    client = uploader.InvenioRDMClient(
+        "https://example.org", "test-key", retry_policy=retry.NO_RETRY
+    )
+
+    with mock.patch.object(client.session, "request", repository.request):
+        with pytest.raises(FilesUploadError):
+            client.deposit({}, files, publish=True, journal=Journal(journal_file))
+
+    journal = Journal.load(journal_file)
+    assert journal.record_id == "abc-123"
+    assert journal.initialized == {"a.txt", "b.txt", "c.txt"}
+    assert journal.committed == {
+        "a.txt": "md5:f561aaf6ef0bf14d4208bb46a4ccb3ad",  # "xxx"
+        "b.txt": "md5:9336ebf25087d91c818ee6e9ec29f8c1",  # "xx"
+    }
+
+    repository.fail_key = None
+    repository.requests.clear()
+    with mock.patch.object(client.session, "request", repository.request):
+        assert client.deposit({}, files, publish=True, journal=journal) == "abc-123"
+
+    assert ("POST", "") not in repository.requests
+    uploaded = [path for method, path in repository.requests if method == "PUT"]
+    assert uploaded == ["/abc-123/draft/files/c.txt/content"]
+    assert Journal.load(journal_file).published
+
+    # resuming a published deposit does not upload or publish again
+    repository.requests.clear()
+    with mock.patch.object(client.session, "request", repository.request):
+        client.deposit({}, files, publish=True, journal=Journal.load(journal_file))
+
+    assert repository.requests == []
+
+
+def test_deposit__resume_changed_file(tmp_path):
+    _, files = make_crate(tmp_path, {"a.txt": 3, "b.txt": 2})
+    journal_file = str(tmp_path / "crate.inveniordm-journal")
+    repository = FakeRepository(fail_key="b.txt")
+    client = uploader.InvenioRDMClient(
+        "https://example.org", "test-key", retry_policy=retry.NO_RETRY
+    )
+    with mock.patch.object(client.session, "request", repository.request):
+        with pytest.raises(FilesUploadError):
+            client.deposit({}, files, journal=Journal(journal_file))
+
+    # a.txt changes after it was committed, without changing its size
+    (tmp_path / "crate" / "a.txt").write_bytes(b"yyy")
+    repository.fail_key = None
+    repository.requests.clear()
+    with mock.patch.object(client.session, "request", repository.request):
+        client.deposit({}, files, journal=Journal.load(journal_file))
+
+    uploaded = [path for method, path in repository.requests if method == "PUT"]
+    assert sorted(uploaded) == [
+        "/abc-123/draft/files/a.txt/content",
+        "/abc-123/draft/files/b.txt/content",
+    ]
+    assert ("DELETE", "/abc-123/draft/files/a.txt") in repository.requests
+
+
+class RecordingObserver(UploadObserver):
+    def __init__(self):
+        self.events = []
+        self.sent = {}
+
+    def upload_started(self, files, total_bytes, sizes):
+        self.events.append(("upload_started", len(files), total_bytes))
+
+    def bytes_sent(self, file, count):
+        self.sent[file] = self.sent.get(file, 0) + count
+
+    def file_finished(self, result):
+        self.events.append(("file_finished", result.file, result.status))
+
+    def upload_finished(self, results):
+        self.events.append(("upload_finished", len(results)))
+
+
+def test_deposit__reports_progress(tmp_path):
+    _, files = make_crate(tmp_path, {"a.txt": 3, "b.txt": 5})
+    observer, report = RecordingObserver(), UploadReport()
+    client = uploader.InvenioRDMClient(
+        "https://example.org", "test-key", observers=[observer, report]
+    )
+
+    with mock.patch.object(client.session, "request", FakeRepository().request):
+        client.deposit({}, files, publish=True)
+
+    assert observer.events[0] == ("upload_started", 2, 8)
+    assert ("file_finished", files[1], "uploaded") in observer.events
+    assert observer.events[-1] == ("upload_finished", 2)
+    assert observer.sent == {files[0]: 3, files[1]: 5}
+    data = report.to_json()
+    assert [f["size"] for f in data["files"]] == [3, 5]
+    assert set(data["files"][0]["phases"]) == {"content", "commit"}
+    assert set(data["phases"]) == {"create_draft", "initialize", "upload", "publish"}
+
+
+def test_deposit__max_bandwidth(tmp_path):
+    _, files = make_crate(tmp_path, {"a.txt": 3, "b.txt": 5})
+    bucket = mock.Mock(spec=throttle.TokenBucket)
+    client = uploader.InvenioRDMClient(
+        "https://example.org", "test-key", max_bandwidth=bucket
+    )
+
+    with mock.patch.object(client.session, "request", FakeRepository().request):
+        client.deposit({}, files, concurrency=2)
+
+    assert sum(call.args[0] for call in bucket.consume.call_args_list) == 8
+
+
+def test_deposit__max_bandwidth_shared_by_concurrent_deposits(tmp_path):
+    # a rate of its own, so that no other test has used its bucket
+    rate = 40009
+    capacity = throttle.shared_bucket(rate).capacity
+    _, files = make_crate(tmp_path, {"a.txt": 10000, "b.txt": 10000})
+    assert 10000 < capacity < 20000  # each alone fits in one burst
+    repository = FakeRepository()
+    env = {"INVENIORDM_BASE_URL": "https://example.org", "INVENIORDM_API_KEY": "k"}
+    errors = []
+
+    def run(file):
+        try:
+            uploader.deposit({}, [file], max_bandwidth=rate)
+        except Exception as e:  # pragma: no cover
+            errors.append(e)
+
+    threads = [threading.Thread(target=run, args=(file,)) for file in files]
+    start = time.perf_counter()
+    with mock.patch.dict(os.environ, env), mock.patch.object(
+        requests.Session, "request", side_effect=repository.request
+    ):
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    elapsed = time.perf_counter() - start
+
+    assert errors == []
+    # together they exceed the burst, and the rest is sent at the shared rate
+    assert elapsed >= 0.8 * (20000 - capacity) / rate
+
+
+class FakeThrottlingRepository(FakeRepository):
+    """Responds to the first content upload with 429 Too Many Requests."""
+
+    def __init__(self):
+        super().__init__()
+        self.throttled = False
+
+    def request(self, method, url, data=None, **kwargs):
+        if method == "PUT" and not self.throttled:
+            self.throttled = True
+            self.requests.append((method, url))
+            return self.response(429, {})
+        return super().request(method, url, data, **kwargs)
+
+
+def test_upload_files__adapts_concurrency(tmp_path):
+    _, files = make_crate(tmp_path, {f"{i}.txt": 1 for i in range(4)})
+    limits = []
+    observer = UploadObserver()
+    observer.concurrency_changed = limits.append
+    client = uploader.InvenioRDMClient(
+        "https://example.org",
+        "test-key",
+        retry_policies={"content": retry.RetryPolicy(backoff_factor=0)},
+        max_concurrency=4,
+        observers=[observer],
+    )
+
+    with mock.patch.object(
+        client.session, "request", FakeThrottlingRepository().request
+    ):
+        results = client.upload_files("abc-123", files, 4, uninitialized=files)
+
+    assert [r.status for r in results] == ["uploaded"] * 4
+    assert limits[:2] == [4, 2]
+    assert sum(r.retries for r in results) == 1
+
+
+def test_client__max_bandwidth():
+    client = uploader.InvenioRDMClient(
+        "https://example.org", "test-key", max_bandwidth=1024
+    )
+
+    assert client.bandwidth.rate == 1024
+
+
+def test_resume_draft__changed_and_new_files(tmp_path):
+    _, files = make_crate(tmp_path, {"a.txt": 1, "b.txt": 5, "d.txt": 1})
+    journal = Journal(str(tmp_path / "crate.inveniordm-journal"))
+    journal.start("https://example.org", "abc-123")
+    repository = FakeRepository(
+        {
+            "a.txt": {"key": "a.txt", "status": "completed", "size": 1},
+            "b.txt": {"key": "b.txt", "status": "completed", "size": 2},
+        }
+    )
+    client = uploader.InvenioRDMClient("https://example.org", "test-key")
+
+    with mock.patch.object(client.session, "request", repository.request):
+        pending, missing = client.resume_draft("abc-123", files, journal)
+
+    assert pending == files[1:]
+    assert missing == files[1:]
+    assert ("DELETE", "/abc-123/draft/files/b.txt") in repository.requests
+
+
+def test_upload_files__initializes_in_batches(tmp_path):
+    _, files = make_crate(tmp_path, {f"{i}.txt": 1 for i in range(5)})
+    journal = Journal(str(tmp_path / "crate.inveniordm-journal"))
+    journal.start("https://example.org", "abc-123")
+    repository = FakeRepository({"0.txt": {"key": "0.txt", "status": "pending"}})
+    client = uploader.InvenioRDMClient(
+        "https://example.org", "test-key", init_batch_size=2
+    )
+
+    with mock.patch.object(client.session, "request", repository.request):
+        results = client.upload_files(
+            "abc-123", files, concurrency=2, journal=journal, uninitialized=files[1:]
+        )
+
+    assert [r.status for r in results] == ["uploaded"] * 5
+    inits = [r for r in repository.requests if r == ("POST", "/abc-123/draft/files")]
+    assert len(inits) == 3
+    assert journal.initialized == {f"{i}.txt" for i in range(1, 5)}
+
+
+class FakeBlockingRepository(FakeRepository):
+    """Holds the upload of the first file until the second batch is initialized."""
+
+    def __init__(self):
+        super().__init__()
+        self.second_batch_initialized = threading.Event()
+
+    def request(self, method, url, data=None, **kwargs):
+        if method == "POST" and url.endswith("/draft/files"):
+            if any(entry["key"] == "b.txt" for entry in json.loads(data)):
+                self.second_batch_initialized.set()
+        if method == "PUT" and url.endswith("/a.txt/content"):
+            assert self.second_batch_initialized.wait(timeout=5)
+        return super().request(method, url, data, **kwargs)
+
+
+def test_upload_files__pipelines_initialization(tmp_path):
+    _, files = make_crate(tmp_path, {"a.txt": 1, "b.txt": 1})
+    repository = FakeBlockingRepository()
+    client = uploader.InvenioRDMClient(
+        "https://example.org", "test-key", init_batch_size=1
+    )
+
+    with mock.patch.object(client.session, "request", repository.request):
+        results = client.upload_files("abc-123", files, 2, uninitialized=files)
+
+    assert [r.status for r in results] == ["uploaded", "uploaded"]
+
+
+def test_upload_files__largest_first(tmp_path):
+    _, files = make_crate(
+        tmp_path, {"small.txt": 1, "huge.txt": 100, "tiny.txt": 0, "big.txt": 50}
+    )
+    repository = FakeRepository()
+    client = uploader.InvenioRDMClient("https://example.org", "test-key")
+
+    with mock.patch.object(client.session, "request", repository.request):
+        results = client.upload_files("abc-123", files, uninitialized=files)
+
+    assert [r.file for r in results] == files
+    assert [r.size for r in results] == [1, 100, 0, 50]
+    uploaded = [path for method, path in repository.requests if method == "PUT"]
+    assert [path.split("/")[4] for path in uploaded] == [
+        "huge.txt",
+        "big.txt",
+        "tiny.txt",
+        "small.txt",
+    ]
+
+
+def test_upload_files__stops_initializing_after_failure(tmp_path):
+    _, files = make_crate(tmp_path, {"a.txt": 1, "b.txt": 1, "c.txt": 1})
+    repository = FakeRepository(fail_key="a.txt")
+    client = uploader.InvenioRDMClient(
+        "https://example.org",
+        "test-key",
+        init_batch_size=1,
+        retry_policies={"content": retry.NO_RETRY},
+    )
+    initialize_files = client.initialize_files
+
+    def wait_for_failure(record_id, files, journal=None):
+        failed_upload = ("PUT", "/abc-123/draft/files/a.txt/content")
+        if "a.txt" in repository.entries:
+            while failed_upload not in repository.requests:
+                time.sleep(0.01)
+            time.sleep(0.1)
+        initialize_files(record_id, files, journal)
+
+    with mock.patch.object(client.session, "request", repository.request):
+        with mock.patch.object(client, "initialize_files", wait_for_failure):
+            results = client.upload_files("abc-123", files, 2, uninitialized=files)
+
+    assert results[0].status == "failed"
+    assert "c.txt" not in repository.entries
+
+
+def test_resume_draft__other_repository(tmp_path):
+    journal = Journal(str(tmp_path / "crate.inveniordm-journal"))
+    journal.start("https://other.example.org", "abc-123")
+    client = uploader.InvenioRDMClient("https://example.org", "test-key")
+
+    with pytest.raises(UploadError, match="other.example.org"):
+        client.resume_draft("abc-123", [], journal)
+
+
+class FakeMultipartRepository(FakeRepository):
+    """Adds multipart transfer, with parts uploaded to part_url."""
+
+    def __init__(self, part_url, flaky_part=None):
+        super().__init__()
+        self.part_url = part_url
+        self.flaky_part = flaky_part
+        self.initialized = []
+        self.parts = {}
+        self.part_headers = []
+
+    def request(self, method, url, data=None, headers=None, **kwargs):
+        if method == "PUT" and "/content/" in url:
+            number = int(url.rsplit("/", 1)[1])
+            body = b"".join(data)
+            self.part_headers.append(headers)
+            if number == self.flaky_part:
+                self.flaky_part = None
+                return self.response(503, {})
+            self.parts[number] = body
+            return self.response(200, {})
+        path = url[len("https://example.org/api/records") :]
+        if method == "GET" and path.count("/") == 4:
+            self.requests.append((method, path))
+            key = path.rsplit("/", 1)[1]
+            count = self.initialized[0]["transfer"]["parts"]
+            links = [
+                {"part": n, "url": f"{self.part_url}/{key}/content/{n}"}
+                for n in range(1, count + 1)
+            ]
+            return self.response(200, {"key": key, "links": {"parts": links}})
+        if method == "POST" and path.endswith("/draft/files"):
+            self.initialized.extend(json.loads(data))
+        return super().request(method, url, data, **kwargs)
+
+
+@pytest.mark.parametrize(
+    "part_url,authorized",
+    [
+        ("https://example.org/api/records/abc-123/draft/files", True),
+        ("https://s3.example.org/bucket", False),
+    ],
+)
+def test_upload__multipart(tmp_path, part_url, authorized):
+    part_size = multipart.MIN_PART_SIZE
+    content = os.urandom(2 * part_size + 100)
+    (tmp_path / "big.bin").write_bytes(content)
+    (tmp_path / "small.txt").write_text("small")
+    files = [str(tmp_path / "big.bin"), str(tmp_path / "small.txt")]
+    repository = FakeMultipartRepository(part_url, flaky_part=2)
+    client = uploader.InvenioRDMClient(
+        "https://example.org",
+        "test-key",
+        retry_policy=retry.RetryPolicy(jitter=False, backoff_factor=0),
+        part_size=part_size,
+        part_concurrency=3,
+    )
+
+    with mock.patch.object(client.session, "request", repository.request):
+        client.upload({}, files)
+
+    assert repository.initialized == [
+        {
+            "key": "big.bin",
+            "size": len(content),
+            "transfer": {"type": "M", "parts": 3, "part_size": part_size},
+        },
+        {"key": "small.txt"},
+    ]
+    assert b"".join(repository.parts[n] for n in (1, 2, 3)) == content
+    assert len(repository.part_headers) == 4  # part 2 was retried
+    assert all(
+        ("Authorization" in headers) == authorized
+        for headers in repository.part_headers
+    )
+    assert ("PUT", "/abc-123/draft/files/small.txt/content") in repository.requests
+    assert repository.entries["big.bin"]["status"] == "completed"
+
+
+def test_client__part_size_too_small():
+    with pytest.raises(ValueError, match="part_size"):
+        uploader.InvenioRDMClient("https://example.org", "test-key", part_size=1024)
+
+
+class FakeCorruptingRepository(FakeRepository):
+    """Reports a wrong checksum for the first `corruptions` commits."""
+
+    def __init__(self, corruptions):
+        super().__init__()
+        self.corruptions = corruptions
+
+    def request(self, method, url, data=None, **kwargs):
+        resp = super().request(method, url, data, **kwargs)
+        if url.endswith("/commit") and self.corruptions:
+            self.corruptions -= 1
+            return self.response(200, {"checksum": "md5:" + "0" * 32})
+        return resp
+
+
+def test_upload_file__checksums(tmp_path):
+    (tmp_path / "a.txt").write_bytes(b"x")
+    journal = Journal(str(tmp_path / "crate.inveniordm-journal"))
+    journal.start("https://example.org", "abc-123")
+    repository = FakeRepository({"a.txt": {"key": "a.txt", "status": "pending"}})
+    client = uploader.InvenioRDMClient(
+        "https://example.org", "test-key", checksum_algorithms=("md5", "sha256")
+    )
+
+    with mock.patch.object(client.session, "request", repository.request):
+        retries, digests = client.upload_file(
+            "abc-123", str(tmp_path / "a.txt"), journal
+        )
+
+    assert retries == 0
+    assert digests == {
+        "md5": hashlib.md5(b"x").hexdigest(),
+        "sha256": hashlib.sha256(b"x").hexdigest(),
+    }
+    with open(journal.path) as f:
+        assert json.loads(f.readlines()[-1])["digests"] == digests
+
+
+@pytest.mark.parametrize("corruptions,uploaded", [(1, True), (2, False)])
+def test_upload_file__checksum_mismatch(tmp_path, corruptions, uploaded):
+    (tmp_path / "a.txt").write_bytes(b"x")
+    repository = FakeCorruptingRepository(corruptions)
+    repository.entries["a.txt"] = {"key": "a.txt", "status": "pending"}
+    client = uploader.InvenioRDMClient("https://example.org", "test-key")
+    mismatches_before = uploader.metrics.CHECKSUM_MISMATCHES.value
+
+    with mock.patch.object(client.session, "request", repository.request):
+        if uploaded:
+            client.upload_file("abc-123", str(tmp_path / "a.txt"))
+        else:
+            with pytest.raises(ChecksumMismatchError, match="md5:0000"):
+                client.upload_file("abc-123", str(tmp_path / "a.txt"))
+
+    puts = [path for method, path in repository.requests if method == "PUT"]
+    assert len(puts) == 2
+    assert ("DELETE", "/abc-123/draft/files/a.txt") in repository.requests
+    assert uploader.metrics.CHECKSUM_MISMATCHES.value == mismatches_before + corruptions
+
+
+class FakeVersionedRepository(FakeRepository):
+    """Adds a published record "abc-123", whose new version draft is "new-456"."""
+
+    def __init__(self, published_files):
+        super().__init__()
+        self.published = {
+            key: {
+                "key": key,
+                "status": "completed",
+                "size": len(content),
+                "checksum": f"md5:{hashlib.md5(content).hexdigest()}",
+            }
+            for key, content in published_files.items()
+        }
+        self.metadata = None
+
+    def request(self, method, url, data=None, **kwargs):
+        path = url[len("https://example.org/api/records") :]
+        if path == "/abc-123/versions" and method == "POST":
+            self.requests.append((method, path))
+            return self.response(201, {"id": "new-456"})
+        if path == "/new-456/draft" and method == "PUT":
+            self.requests.append((method, path))
+            self.metadata = json.loads(data)
+            return self.response(200, {})
+        if path.endswith("/files-import"):
+            self.requests.append((method, path))
+            self.entries = {k: dict(v) for k, v in self.published.items()}
+            return self.response(201, {"entries": list(self.entries.values())})
+        return super().request(method, url, data, **kwargs)
+
+
+def test_deposit__new_version(tmp_path):
+    published = {"same.txt": b"same", "changed.txt": b"old", "removed.txt": b"gone"}
+    local = {"same.txt": b"same", "changed.txt": b"new", "added.txt": b"added"}
+    files = []
+    for name, content in local.items():
+        (tmp_path / name).write_bytes(content)
+        files.append(str(tmp_path / name))
+    repository = FakeVersionedRepository(published)
+    client = uploader.InvenioRDMClient("https://example.org", "test-key")
+
+    with mock.patch.object(client.session, "request", repository.request):
+        record_id = client.deposit(
+            {"title": "v2"}, files, publish=True, new_version_of="abc-123"
+        )
+
+    assert record_id == "new-456"
+    assert repository.metadata == {"title": "v2"}
+    assert ("POST", "") not in repository.requests
+    assert ("DELETE", "/new-456/draft/files/removed.txt") in repository.requests
+    assert ("DELETE", "/new-456/draft/files/changed.txt") in repository.requests
+    uploaded = [path for method, path in repository.requests if method == "PUT"]
+    assert sorted(uploaded) == [
+        "/new-456/draft",
+        "/new-456/draft/files/added.txt/content",
+        "/new-456/draft/files/changed.txt/content",
+    ]
+    assert set(repository.entries) == set(local)
+    assert ("POST", "/new-456/draft/actions/publish") in repository.requests
+
+
+def test_is_unchanged(tmp_path):
+    path = tmp_path / "a.txt"
+    path.write_bytes(b"abc")
+    md5 = hashlib.md5(b"abc").hexdigest()
+
+    assert uploader.is_unchanged({"size": 3, "checksum": f"md5:{md5}"}, str(path))
+    assert not uploader.is_unchanged({"size": 3, "checksum": "md5:0"}, str(path))
+    assert not uploader.is_unchanged({"size": 4, "checksum": f"md5:{md5}"}, str(path))
+    assert not uploader.is_unchanged({"size": 3}, str(path))
+
+
+def test_deposit__zip_stream(tmp_path):
+    (tmp_path / "crate").mkdir()
+    (tmp_path / "crate" / "a.txt").write_bytes(b"x" * 100)
+    stream = ZipStream.from_directory("crate.zip", str(tmp_path / "crate"))
+    repository, report = FakeRepository(), UploadReport()
+    client = uploader.InvenioRDMClient(
+        "https://example.org", "test-key", observers=[report]
+    )
+
+    with mock.patch.object(client.session, "request", repository.request):
+        client.deposit({}, [stream])
+
+    entry = repository.entries["crate.zip"]
+    assert entry["size"] == stream.size
+    assert entry["checksum"] == f"md5:{hashlib.md5(stream.open().read()).hexdigest()}"
+    assert json.loads(json.dumps(report.to_json()))["files"][0]["key"] == "crate.zip"
+
+
+def test_deposit__compressed_zip_stream(tmp_path):
+    (tmp_path / "crate").mkdir()
+    (tmp_path / "crate" / "a.txt").write_bytes(b"x" * 10000)
+    stream = ZipStream.from_directory("crate.zip", str(tmp_path / "crate"))
+    stream.compress(level=6, jobs=1)
+    repository, report, bodies = FakeRepository(), UploadReport(), []
+    client = uploader.InvenioRDMClient(
+        "https://example.org", "test-key", observers=[report]
+    )
+
+    def request(method, url, data=None, **kwargs):
+        if method == "PUT":
+            bodies.append(data)
+        return repository.request(method, url, data=data, **kwargs)
+
+    uploaded_before = uploader.metrics.UPLOADED_BYTES.value
+    with mock.patch.object(client.session, "request", request):
+        client.deposit({}, [stream])
+
+    content = stream.open().read()
+    assert isinstance(bodies[0], sources.ChunkedBody)
+    prepared = requests.Request("PUT", "https://example.org", data=bodies[0]).prepare()
+    assert prepared.headers["Transfer-Encoding"] == "chunked"
+    assert repository.entries["crate.zip"]["size"] == len(content)
+    assert uploader.metrics.UPLOADED_BYTES.value - uploaded_before == len(content)
+    assert report.to_json()["files"][0]["size"] == len(content)
+
+
+@pytest.mark.parametrize("server_md5,verified", [(None, True), ("0" * 32, False)])
+def test_upload_file__multipart_verified_by_inventory(tmp_path, server_md5, verified):
+    part_size = multipart.MIN_PART_SIZE
+    content = b"x" * (part_size + 1)
+    (tmp_path / "big.bin").write_bytes(content)
+    file = str(tmp_path / "big.bin")
+    file_inventory = Inventory()
+    file_inventory.scan([file])
+    repository = FakeMultipartRepository("https://s3.example.org/bucket")
+    client = uploader.InvenioRDMClient(
+        "https://example.org",
+        "test-key",
+        part_size=part_size,
+        checksum_retries=0,
+        inventory=file_inventory,
+    )
+
+    with mock.patch.object(client.session, "request", repository.request):
+        client.start_draft_files_upload("abc-123", [file])
+        md5 = server_md5 or hashlib.md5(content).hexdigest()
+        repository.entries["big.bin"]["checksum"] = f"md5:{md5}"
+        if verified:
+            _, digests = client.upload_file("abc-123", file)
+            assert digests == {"md5": hashlib.md5(content).hexdigest()}
+        else:
+            with pytest.raises(ChecksumMismatchError):
+                client.upload_file("abc-123", file)
+
+
+def test_is_unchanged__inventory(tmp_path):
+    path = tmp_path / "a.txt"
+    path.write_bytes(b"abc")
+    md5 = hashlib.md5(b"abc").hexdigest()
+    file_inventory = Inventory()
+    file_inventory.scan([str(path)])
+
+    with mock.patch.object(uploader.checksum, "digest") as digest:
+        assert uploader.is_unchanged(
+            {"size": 3, "checksum": f"md5:{md5}"}, str(path), file_inventory
+        )
+    digest.assert_not_called()
@@ -0,0 +1,81 @@
+import os
+
+import pytest
+
+from rocrate_inveniordm import walk
+from rocrate_inveniordm.exceptions import InvalidCrateError
+
+
+@pytest.mark.parametrize(
+    "pattern,path,is_dir,matches",
+    [
+        ("*.csv", "a.csv", False, True),
+        ("*.csv", "data/deep/a.csv", False, True),
+        ("*.csv", "a.csv.bak", False, False),
+        ("/a.csv", "data/a.csv", False, False),
+        ("data/*.csv", "data/a.csv", False, True),
+        ("data/*.csv", "data/deep/a.csv", False, False),
+        ("data/**/*.csv", "data/deep/er/a.csv", False, True),
+        ("data/**/*.csv", "data/a.csv", False, True),
+        ("**/tmp", "a/b/tmp", True, True),
+        ("data/**", "data/a/b.txt", False, True),
+        ("file?.txt", "file1.txt", False, True),
+        ("file[0-9].txt", "filex.txt", False, False),
+        ("file[!0-9].txt", "filex.txt", False, True),
+        ("build/", "build", True, True),
+        ("build/", "build", False, False),
+    ],
+)
+def test_path_pattern(pattern, path, is_dir, matches):
+    assert walk.PathPattern(pattern).matches(path, is_dir) is matches
+
+
+def test_path_filter():
+    path_filter = walk.PathFilter(
+        include=["data/", "*.json"], exclude=["*.tmp", "!keep.tmp"]
+    )
+
+    assert path_filter.included("data/a/b.txt")
+    assert path_filter.included("ro-crate-metadata.json")
+    assert not path_filter.included("other/b.txt")
+    assert path_filter.excluded("data/a.tmp", False)
+    assert not path_filter.excluded("data/keep.tmp", False)
+
+
+def make_tree(tmp_path):
+    root = tmp_path / "crate"
+    for name in ["b.txt", "a/1.txt", "a/2.tmp", "c/3.txt", ".hidden/4.txt"]:
+        path = root / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(name)
+    return root
+
+
+def relative_paths(root, files):
+    return [os.path.relpath(path, root) for path, _ in files]
+
+
+def test_walk_files(tmp_path):
+    root = make_tree(tmp_path)
+    path_filter = walk.PathFilter(exclude=["*.tmp", "c/"])
+
+    files = list(walk.walk_files(str(root), path_filter))
+
+    assert relative_paths(root, files) == [".hidden/4.txt", "a/1.txt", "b.txt"]
+    assert files[-1][1].st_size == len("b.txt")
+
+
+def test_walk_files__symlinks(tmp_path):
+    root = make_tree(tmp_path)
+    (root / "link.txt").symlink_to(root / "b.txt")
+    (root / "a" / "loop").symlink_to(root)
+    (root / "broken").symlink_to(root / "missing")
+
+    followed = relative_paths(root, walk.walk_files(str(root), symlinks="follow"))
+    skipped = relative_paths(root, walk.walk_files(str(root), symlinks="skip"))
+
+    assert "link.txt" in followed
+    assert not any("loop" in path for path in followed)
+    assert "link.txt" not in skipped
+    with pytest.raises(InvalidCrateError, match="is a symbolic link"):
+        list(walk.walk_files(str(root), symlinks="error"))
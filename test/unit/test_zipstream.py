@@ -0,0 +1,325 @@
+import io
+import os
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+import pytest
+
+from rocrate_inveniordm.exceptions import UploadError
+from rocrate_inveniordm.upload import zipstream
+from test.unit.utils import make_crate
+
+
+CONTENTS = {
+    "ro-crate-metadata.json": b"{}",
+    "data/a.txt": b"a" * 1000,
+    "data/empty.txt": b"",
+    "data/sub/ü.txt": b"umlaut",
+}
+
+
+def test_zip_stream__from_directory(tmp_path):
+    stream = zipstream.ZipStream.from_directory(
+        "crate.zip", make_crate(tmp_path, CONTENTS)[0]
+    )
+
+    with stream.open() as reader:
+        data = reader.read()
+
+    assert len(data) == stream.size
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        assert archive.testzip() is None
+        assert archive.namelist() == [
+            "ro-crate-metadata.json",
+            "data/",
+            "data/a.txt",
+            "data/empty.txt",
+            "data/sub/",
+            "data/sub/ü.txt",
+        ]
+        for name, content in CONTENTS.items():
+            assert archive.read(name) == content
+        assert archive.getinfo("data/").is_dir()
+
+
+def test_zip_stream__zip64(tmp_path, monkeypatch):
+    monkeypatch.setattr(zipstream, "ZIP64_LIMIT", 500)
+    monkeypatch.setattr(zipstream, "ZIP64_COUNT_LIMIT", 3)
+    stream = zipstream.ZipStream.from_directory(
+        "crate.zip", make_crate(tmp_path, CONTENTS)[0]
+    )
+
+    data = stream.open().read()
+
+    assert len(data) == stream.size
+    assert b"PK\x06\x06" in data  # zip64 end of central directory record
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        assert archive.testzip() is None
+        assert len(archive.infolist()) == 6
+        assert archive.read("data/a.txt") == CONTENTS["data/a.txt"]
+        assert archive.read("data/sub/ü.txt") == CONTENTS["data/sub/ü.txt"]
+
+
+def test_zip_reader__seek(tmp_path):
+    stream = zipstream.ZipStream.from_directory(
+        "crate.zip", make_crate(tmp_path, CONTENTS)[0]
+    )
+    reader = stream.open()
+    data = reader.read()
+
+    assert len(reader) == stream.size
+    assert reader.seek(0, 2) == stream.size
+    assert reader.read(10) == b""
+    assert reader.seek(100) == 100
+    assert reader.read(50) == data[100:150]
+    assert reader.seek(0) == 0
+    assert b"".join(reader) == data
+
+
+def test_zip_reader__small_reads(tmp_path):
+    stream = zipstream.ZipStream.from_directory(
+        "crate.zip", make_crate(tmp_path, CONTENTS)[0]
+    )
+    data = stream.open().read()
+
+    with stream.open() as reader:
+        assert b"".join(iter(lambda: reader.read(7), b"")) == data
+        assert reader.tell() == stream.size
+        assert reader.read() == b""
+
+
+def test_zip_reader__close_after_seek_to_end(tmp_path):
+    stream = zipstream.ZipStream.from_directory(
+        "crate.zip", make_crate(tmp_path, CONTENTS)[0]
+    )
+
+    with stream.open() as reader:
+        reader.seek(0, 2)
+
+
+def test_zip_stream__file_changed(tmp_path):
+    crate_dir, _ = make_crate(tmp_path, CONTENTS)
+    stream = zipstream.ZipStream.from_directory("crate.zip", crate_dir)
+    (tmp_path / "crate" / "data" / "a.txt").write_bytes(b"a" * 1001)
+
+    with pytest.raises(UploadError, match="changed while it was being uploaded"):
+        stream.open().read()
+
+
+def test_compressed_format():
+    assert zipstream.compressed_format("data/a.GZ")
+    assert not zipstream.compressed_format("data/a.txt")
+
+
+def test_looks_random():
+    assert zipstream.looks_random(os.urandom(10000))
+    assert not zipstream.looks_random(b"hello world " * 1000)
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_compress(tmp_path, monkeypatch, jobs):
+    monkeypatch.setattr(zipstream, "BLOCK_SIZE", 1024)
+    random_data = os.urandom(5000)
+    mixed = b"hello world " * 200 + random_data + b"hello world " * 200
+    crate_dir, _ = make_crate(
+        tmp_path,
+        {
+            **CONTENTS,
+            "data/random.bin": random_data[:1000],
+            "data/mixed.bin": mixed,
+            "b.jpg": b"a" * 100,
+        },
+    )
+    stream = zipstream.ZipStream.from_directory("crate.zip", crate_dir)
+
+    stream.compress(level=6, jobs=jobs)
+    assert stream.size is None
+    with pytest.raises(TypeError):
+        len(stream.open())
+    data = stream.open().read()
+
+    assert stream.size == len(data) < stream.estimated_size
+    assert stream.open().read() == data  # deterministic
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        assert archive.testzip() is None
+        methods = {info.filename: info.compress_type for info in archive.infolist()}
+        assert methods["data/a.txt"] == zipfile.ZIP_DEFLATED
+        assert methods["data/mixed.bin"] == zipfile.ZIP_DEFLATED
+        assert methods["data/random.bin"] == zipfile.ZIP_STORED
+        assert methods["b.jpg"] == zipfile.ZIP_STORED
+        assert archive.read("data/a.txt") == CONTENTS["data/a.txt"]
+        assert archive.read("data/random.bin") == random_data[:1000]
+        assert archive.read("data/mixed.bin") == mixed
+
+
+def test_compress__random_member_stored(tmp_path, monkeypatch):
+    monkeypatch.setattr(zipstream, "BLOCK_SIZE", 1024)
+    random_data = os.urandom(5000)
+    crate_dir, _ = make_crate(tmp_path, {"random.bin": random_data})
+    stream = zipstream.ZipStream.from_directory("crate.zip", crate_dir)
+
+    with mock.patch.object(
+        zipstream, "looks_random", wraps=zipstream.looks_random
+    ) as looks_random:
+        stream.compress(level=6, jobs=2)
+        data = stream.open().read()
+        assert stream.open().read() == data
+
+    assert looks_random.call_count == 1  # once per member, not per block
+    assert len(data) <= stream.estimated_size
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        info = archive.getinfo("random.bin")
+        assert info.compress_type == zipfile.ZIP_STORED
+        assert info.compress_size == len(random_data)
+        assert archive.read("random.bin") == random_data
+
+
+def test_compress__zip64(tmp_path, monkeypatch):
+    monkeypatch.setattr(zipstream, "ZIP64_LIMIT", 500)
+    monkeypatch.setattr(zipstream, "BLOCK_SIZE", 256)
+    stream = zipstream.ZipStream.from_directory(
+        "crate.zip", make_crate(tmp_path, CONTENTS)[0]
+    )
+
+    stream.compress(level=9, jobs=1)
+    data = stream.open().read()
+
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        assert archive.testzip() is None
+        assert archive.read("data/a.txt") == CONTENTS["data/a.txt"]
+
+
+def test_compress__level_0(tmp_path):
+    stream = zipstream.ZipStream.from_directory(
+        "crate.zip", make_crate(tmp_path, CONTENTS)[0]
+    )
+
+    stream.compress(level=0)
+
+    assert stream.size == stream.estimated_size
+    assert len(stream.open().read()) == stream.size
+
+
+def test_compress__file_changed(tmp_path, monkeypatch):
+    monkeypatch.setattr(zipstream, "BLOCK_SIZE", 256)
+    crate_dir, _ = make_crate(tmp_path, CONTENTS)
+    stream = zipstream.ZipStream.from_directory("crate.zip", crate_dir)
+    stream.compress(level=6, jobs=2)
+    (tmp_path / "crate" / "data" / "a.txt").write_bytes(b"a" * 1001)
+
+    with pytest.raises(UploadError, match="changed while it was being uploaded"):
+        stream.open().read()
+
+
+def test_ordered_map__bounded():
+    submitted = []
+
+    def arguments():
+        for i in range(100):
+            submitted.append(i)
+            yield (i,)
+
+    with ThreadPoolExecutor(2) as executor:
+        results = zipstream.ordered_map(executor, lambda i: i * 2, arguments(), 4)
+        assert next(results) == 0
+        assert len(submitted) == 4
+        assert list(results) == [i * 2 for i in range(1, 100)]
+
+
+def test_zip_stream__deterministic(tmp_path):
+    (tmp_path / "first").mkdir()
+    (tmp_path / "second").mkdir()
+    first, _ = make_crate(tmp_path / "first", CONTENTS)
+    second, _ = make_crate(tmp_path / "second", CONTENTS)
+    os.utime(os.path.join(second, "data", "a.txt"), (0, 1_000_000_000))
+    os.chmod(os.path.join(second, "data", "a.txt"), 0o600)
+    os.chmod(os.path.join(second, "ro-crate-metadata.json"), 0o755)
+
+    first_data = zipstream.ZipStream.from_directory("crate.zip", first).open().read()
+    second_data = zipstream.ZipStream.from_directory("crate.zip", second).open().read()
+
+    with zipfile.ZipFile(io.BytesIO(second_data)) as archive:
+        modes = {info.filename: info.external_attr >> 16 for info in archive.infolist()}
+        assert archive.getinfo("data/a.txt").date_time == (1980, 1, 1, 0, 0, 0)
+    assert modes["data/a.txt"] == 0o100644
+    assert modes["ro-crate-metadata.json"] == 0o100755
+    assert modes["data/"] == 0o40755
+    os.chmod(os.path.join(second, "ro-crate-metadata.json"), 0o644)
+    assert zipstream.ZipStream.from_directory("crate.zip", second).open().read() == (
+        first_data
+    )
+
+
+def test_zip_stream__fingerprint(tmp_path):
+    crate_dir, _ = make_crate(tmp_path, CONTENTS)
+    fingerprint = zipstream.ZipStream.from_directory("crate.zip", crate_dir).fingerprint
+
+    assert fingerprint(6) == fingerprint(6)
+    assert fingerprint(6) != fingerprint(0)
+    (tmp_path / "crate" / "data" / "a.txt").write_bytes(b"b" * 999)
+    changed = zipstream.ZipStream.from_directory("crate.zip", crate_dir)
+    assert changed.fingerprint(6) != fingerprint(6)
+
+
+def test_cached_archive(tmp_path, capsys):
+    crate_dir, _ = make_crate(tmp_path, CONTENTS)
+    cache_dir = str(tmp_path / "cache")
+
+    def cache():
+        stream = zipstream.ZipStream.from_directory("crate.zip", crate_dir)
+        return zipstream.cached_archive(stream, cache_dir, level=6, jobs=1)
+
+    path = cache()
+    assert "Writing zip file" in capsys.readouterr().out
+    assert cache() == path
+    assert "Reusing cached zip file" in capsys.readouterr().out
+    with zipfile.ZipFile(path) as archive:
+        assert archive.read("data/a.txt") == CONTENTS["data/a.txt"]
+
+    (tmp_path / "crate" / "data" / "a.txt").write_bytes(b"b" * 999)
+    changed = cache()
+
+    assert changed != path
+    assert os.path.basename(changed) == "crate.zip"
+    assert os.path.isfile(path)  # another deposit may still upload it
+    assert os.path.dirname(os.path.dirname(changed)) == os.path.dirname(
+        os.path.dirname(path)
+    )
+
+
+def test_cached_archive__same_name(tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    paths = []
+    for parent in ("one", "two"):
+        (tmp_path / parent).mkdir()
+        crate_dir, _ = make_crate(tmp_path / parent, CONTENTS)
+        stream = zipstream.ZipStream.from_directory("crate.zip", crate_dir)
+        paths.append(zipstream.cached_archive(stream, cache_dir))
+
+    assert os.path.dirname(os.path.dirname(paths[0])) != os.path.dirname(
+        os.path.dirname(paths[1])
+    )
+    assert all(os.path.isfile(path) for path in paths)
+
+
+def test_cached_archive__failed_write(tmp_path, monkeypatch):
+    cache_dir = tmp_path / "cache"
+    stream = zipstream.ZipStream.from_directory(
+        "crate.zip", make_crate(tmp_path, CONTENTS)[0]
+    )
+    monkeypatch.setattr(zipstream.shutil, "copyfileobj", mock.Mock(side_effect=OSError))
+
+    with pytest.raises(OSError):
+        zipstream.cached_archive(stream, str(cache_dir))
+
+    assert [path for path in cache_dir.rglob("*") if path.is_file()] == []
+
+
+def test_prepare_archives__stream(tmp_path):
+    stream = zipstream.ZipStream.from_directory(
+        "crate.zip", make_crate(tmp_path, CONTENTS)[0]
+    )
+
+    with zipstream.prepare_archives([stream]) as files:
+        assert files == [stream]
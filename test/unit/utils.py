@@ -26,6 +26,25 @@ def add_entity_to_template(entity, rc):
     return rc
 
 
+def make_crate(tmp_path, contents):
+    """
+    Writes files into tmp_path/crate, creating directories as needed.
+
+    :param contents: The content of each file by path relative to the crate, as
+        bytes or as a number of bytes
+    :return: The path of the crate directory, and the paths of the files
+    """
+    crate_dir = tmp_path / "crate"
+    crate_dir.mkdir(parents=True, exist_ok=True)
+    files = []
+    for name, content in contents.items():
+        path = crate_dir / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(b"x" * content if isinstance(content, int) else content)
+        files.append(str(path))
+    return str(crate_dir), files
+
+
 def get_single_mapping(mapping_class, rule):
     m = converter.load_mapping_json()
 